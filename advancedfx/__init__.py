@@ -13,11 +13,12 @@ bl_info = {
 	"category": "Import-Export",
 }
 
-from . import utils, import_agr, import_cam, export_cam, import_bvh, export_bvh, export_agr2fbx
+from . import utils, import_agr, import_cam, export_cam, import_bvh, export_bvh, export_multicam, export_agr2fbx
 
 classes = (
 	import_bvh.BvhImporter,
 	export_bvh.BvhExporter,
+	export_multicam.MultiCamExporter,
 	import_cam.CamImporter,
 	export_cam.CamExporter,
 	import_agr.AgrImporter,
@@ -42,6 +43,9 @@ def menu_func_import_bvh(self, context):
 def menu_func_export_bvh(self, context):
 	self.layout.operator(export_bvh.BvhExporter.bl_idname, text="HLAE old Cam IO (.bvh)")
 
+def menu_func_export_multicam(self, context):
+	self.layout.operator(export_multicam.MultiCamExporter.bl_idname, text="HLAE Cameras (.cam / .bvh)")
+
 def register():
 	from bpy.utils import register_class
 	for cls in classes:
@@ -53,12 +57,14 @@ def register():
 	bpy.types.TOPBAR_MT_file_export.append(menu_func_export_cam)
 	bpy.types.TOPBAR_MT_file_import.append(menu_func_import_bvh)
 	bpy.types.TOPBAR_MT_file_export.append(menu_func_export_bvh)
+	bpy.types.TOPBAR_MT_file_export.append(menu_func_export_multicam)
 
 def unregister():
 	from bpy.utils import unregister_class
 	for cls in reversed(classes):
 		unregister_class(cls)
 
+	bpy.types.TOPBAR_MT_file_export.remove(menu_func_export_multicam)
 	bpy.types.TOPBAR_MT_file_export.remove(menu_func_export_bvh)
 	bpy.types.TOPBAR_MT_file_import.remove(menu_func_import_bvh)
 	bpy.types.TOPBAR_MT_file_import.remove(menu_func_import_agr)
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy
+
+from . import agr_reader
+
+# This module must not depend on bpy / mathutils, like agr_reader.
+
+# Increase when the decoded tracks change, so old cache files are not used anymore:
+AGR_CACHE_VERSION = 3
+
+ENTITY_ARRAYS = ('visibilityTimes', 'visible', 'transformTimes', 'location', 'rotation', 'scaleTimes', 'scale', 'boneTimes', 'boneCounts', 'boneMatrices')
+CAMERA_ARRAYS = ('times', 'location', 'rotation', 'fov')
+
+def GetDefaultCacheDirectory():
+	return os.path.join(tempfile.gettempdir(), "advancedfx_agr_cache")
+
+def HashFileSample(filepath, fileSize, blockSize = 1048576):
+	"""Hashes the first, middle and last blockSize bytes of the file only, so keys stay cheap for files of several GiB."""
+	digest = hashlib.blake2b(digest_size=20)
+	with open(filepath, 'rb') as file:
+		for offset in sorted(set((0, max(0, fileSize // 2 - blockSize // 2), max(0, fileSize - blockSize)))):
+			file.seek(offset)
+			digest.update(file.read(blockSize))
+	return digest.hexdigest()
+
+def GetAgrRecordingSize(recording):
+	"""Returns the bytes of the arrays SaveAgrRecording saves (uncompressed, an upper bound of the file size but for the metadata)."""
+	size = 0
+	for entity in recording.entities:
+		size += sum(getattr(entity, name).nbytes for name in ENTITY_ARRAYS)
+		if entity.camera is not None:
+			size += sum(getattr(entity.camera, name).nbytes for name in CAMERA_ARRAYS)
+	if recording.afxCam is not None:
+		size += sum(getattr(recording.afxCam, name).nbytes for name in CAMERA_ARRAYS)
+	return size
+
+def SaveAgrRecording(recording, file):
+	"""Saves the (finished) AgrRecording as .npz to the file (path or file object)."""
+	arrays = {}
+
+	entities = []
+	for i, entity in enumerate(recording.entities):
+		for name in ENTITY_ARRAYS:
+			arrays["%i.%s" % (i, name)] = getattr(entity, name)
+		if entity.camera is not None:
+			for name in CAMERA_ARRAYS:
+				arrays["%i.camera.%s" % (i, name)] = getattr(entity.camera, name)
+		entities.append([entity.objNr, entity.modelName, entity.accepted, None if entity.camera is None else entity.camera.name])
+
+	if recording.afxCam is not None:
+		for name in CAMERA_ARRAYS:
+			arrays["afxCam.%s" % name] = getattr(recording.afxCam, name)
+
+	arrays['meta'] = numpy.array(json.dumps({
+		'version': recording.version,
+		'endTime': recording.endTime,
+		'fpsErrorCount': recording.fpsErrorCount,
+		'fpsMaxError': recording.fpsMaxError,
+		'boneBytes': recording.boneBytes,
+		'entities': entities,
+		'afxCam': None if recording.afxCam is None else recording.afxCam.name,
+	}))
+
+	numpy.savez_compressed(file, **arrays)
+
+def LoadCameraTrack(data, prefix, name):
+	camera = agr_reader.CameraTrack(name)
+	for field in CAMERA_ARRAYS:
+		setattr(camera, field, data[prefix + field])
+	camera.samples = None
+	return camera
+
+def LoadAgrRecording(file):
+	"""Loads an AgrRecording saved with SaveAgrRecording."""
+	with numpy.load(file, allow_pickle=False) as data:
+		meta = json.loads(str(data['meta']))
+
+		recording = agr_reader.AgrRecording(meta['version'])
+		recording.endTime = meta['endTime']
+		recording.fpsErrorCount = meta['fpsErrorCount']
+		recording.fpsMaxError = meta['fpsMaxError']
+		recording.boneBytes = meta['boneBytes']
+
+		for i, (objNr, modelName, accepted, cameraName) in enumerate(meta['entities']):
+			entity = agr_reader.EntityTrack(objNr, modelName)
+			entity.accepted = accepted
+			for name in ENTITY_ARRAYS:
+				setattr(entity, name, data["%i.%s" % (i, name)])
+			entity.boneBytes = 0
+			entity.boneDecodeTime = 0.0
+			if cameraName is not None:
+				entity.camera = LoadCameraTrack(data, "%i.camera." % i, cameraName)
+			entity.visibility = None
+			entity.transforms = None
+			entity.scaleTransforms = None
+			entity.boneSamples = None
+			recording.entities.append(entity)
+
+		if meta['afxCam'] is not None:
+			recording.afxCam = LoadCameraTrack(data, "afxCam.", meta['afxCam'])
+
+	return recording
+
+class AgrCache:
+	"""Directory of decoded AGR recordings (.npz), evicting the least recently used ones above sizeLimit bytes."""
+
+	def __init__(self, directory, sizeLimit):
+		self.directory = directory
+		self.sizeLimit = sizeLimit
+
+	def GetKey(self, filepath, options):
+		"""Returns the cache key for the file (by path, size, mtime and a hash of parts of its content, see HashFileSample)
+		and the (JSON serializable) decoding options."""
+		stat = os.stat(filepath)
+		key = json.dumps({
+			'cacheVersion': AGR_CACHE_VERSION,
+			'filePath': os.path.normcase(os.path.abspath(filepath)),
+			'fileSize': stat.st_size,
+			'fileMTime': stat.st_mtime_ns,
+			'fileHash': HashFileSample(filepath, stat.st_size),
+			'options': options,
+		}, sort_keys=True)
+		return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+	def GetPath(self, key):
+		return os.path.join(self.directory, key + ".npz")
+
+	def Load(self, key):
+		"""Returns the cached AgrRecording or None."""
+		path = self.GetPath(key)
+		if not os.path.isfile(path):
+			return None
+		try:
+			recording = LoadAgrRecording(path)
+		except (OSError, ValueError, KeyError):
+			return None
+		try:
+			# Mark as recently used (fails in read only or concurrently evicted cache directories):
+			os.utime(path, None)
+		except OSError:
+			pass
+		return recording
+
+	def Store(self, key, recording):
+		"""Stores the recording and evicts old entries, returns False if it's not stored because it's bigger than the limit."""
+		if self.sizeLimit < GetAgrRecordingSize(recording):
+			return False
+		os.makedirs(self.directory, exist_ok=True)
+		path = self.GetPath(key)
+		tempPath = path + ".tmp"
+		with open(tempPath, 'wb') as file:
+			SaveAgrRecording(recording, file)
+		os.replace(tempPath, path)
+		self.Evict()
+		return True
+
+	def Evict(self):
+		"""Removes the least recently used entries till the cache is within sizeLimit, returns the number removed."""
+		entries = []
+		for name in os.listdir(self.directory):
+			if name.endswith(".npz"):
+				path = os.path.join(self.directory, name)
+				stat = os.stat(path)
+				entries.append((stat.st_mtime, stat.st_size, path))
+
+		entries.sort()
+		totalSize = sum(size for mtime, size, path in entries)
+
+		removed = 0
+		for mtime, size, path in entries:
+			if totalSize <= self.sizeLimit:
+				break
+			os.remove(path)
+			totalSize -= size
+			removed += 1
+
+		return removed
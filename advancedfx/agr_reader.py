@@ -0,0 +1,1605 @@
+import array
+import bisect
+import concurrent.futures
+import fnmatch
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import numpy
+
+# This module must not depend on bpy / mathutils, so it can be used outside of Blender.
+
+INT = struct.Struct('<i')
+FLOAT = struct.Struct('<f')
+DOUBLE = struct.Struct('<d')
+BOOL = struct.Struct('<?')
+VECTOR = struct.Struct('<3f')
+QUATERNION = struct.Struct('<4f')
+MATRIX3X4 = struct.Struct('<12f')
+
+AGR_MAGIC = b"afxGameRecord\0"
+
+class AgrReader:
+	"""Cursor over a buffer (usually a memory mapped AGR file)."""
+
+	def __init__(self, buffer, pos = 0):
+		self.buffer = buffer
+		self.size = len(buffer)
+		self.pos = pos
+
+	def Tell(self):
+		return self.pos
+
+	def Seek(self, pos):
+		self.pos = pos
+
+	def Unpack(self, fmt):
+		pos = self.pos
+		end = pos + fmt.size
+		if self.size < end:
+			return None
+		self.pos = end
+		return fmt.unpack_from(self.buffer, pos)
+
+	def ReadBytes(self, count):
+		pos = self.pos
+		end = pos + count
+		if self.size < end:
+			return None
+		self.pos = end
+		return self.buffer[pos:end]
+
+	def ReadString(self):
+		pos = self.pos
+		end = self.buffer.find(b"\0", pos)
+		if end < 0:
+			return None
+		self.pos = end + 1
+		return self.buffer[pos:end].decode("utf-8")
+
+	def ReadBool(self):
+		pos = self.pos
+		if self.size < pos + 1:
+			return None
+		self.pos = pos + 1
+		return BOOL.unpack_from(self.buffer, pos)[0]
+
+	def ReadInt(self):
+		pos = self.pos
+		if self.size < pos + 4:
+			return None
+		self.pos = pos + 4
+		return INT.unpack_from(self.buffer, pos)[0]
+
+	def ReadFloat(self):
+		pos = self.pos
+		if self.size < pos + 4:
+			return None
+		self.pos = pos + 4
+		return FLOAT.unpack_from(self.buffer, pos)[0]
+
+	def ReadDouble(self):
+		pos = self.pos
+		if self.size < pos + 8:
+			return None
+		self.pos = pos + 8
+		return DOUBLE.unpack_from(self.buffer, pos)[0]
+
+class AgrFile:
+	"""Opens an AGR file and memory maps it, use as context manager."""
+
+	def __init__(self, filepath):
+		self.filepath = filepath
+		self.file = None
+		self.buffer = None
+
+	def Open(self):
+		self.file = open(self.filepath, 'rb')
+		try:
+			self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		except (ValueError, OSError):
+			# Empty files or file systems that don't support mapping:
+			self.buffer = self.file.read()
+
+	def Close(self):
+		if isinstance(self.buffer, mmap.mmap):
+			self.buffer.close()
+		self.buffer = None
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+	def __enter__(self):
+		self.Open()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.Close()
+
+	def Size(self):
+		return len(self.buffer)
+
+	def Reader(self, pos = 0):
+		return AgrReader(self.buffer, pos)
+
+def ReadAgrVersion(reader):
+	pos = reader.Tell()
+	if reader.size < pos + len(AGR_MAGIC):
+		return None
+
+	if reader.buffer[pos:pos + len(AGR_MAGIC)] != AGR_MAGIC:
+		return None
+
+	reader.Seek(pos + len(AGR_MAGIC))
+
+	return reader.ReadInt()
+
+class AgrDictionary:
+	def __init__(self):
+		self.dictionary = []
+		self.peeked = None
+
+	def ReadIndex(self,reader):
+		"""Returns the dictionary index of the next string, defining it if required."""
+		if self.peeked is not None:
+			oldPeeked = self.peeked
+			self.peeked = None
+			return oldPeeked
+
+		idx = reader.ReadInt()
+
+		if idx is None:
+			return None
+
+		if -1 == idx:
+			str = reader.ReadString()
+			if str is None:
+				return None
+			idx = len(self.dictionary)
+			self.dictionary.append(str)
+
+		return idx
+
+	def Read(self,reader):
+		idx = self.ReadIndex(reader)
+		if idx is None:
+			return None
+		return self.dictionary[idx]
+
+	def Peekaboo(self,reader,what):
+		if self.peeked is None:
+			self.peeked = self.ReadIndex(reader)
+			if self.peeked is None:
+				return False
+
+		if(what == self.dictionary[self.peeked]):
+			self.peeked = None
+			return True
+
+		return False
+
+class AgrError(Exception):
+	pass
+
+class AgrTimeConverter:
+	def __init__(self,fps):
+		self.fps = fps
+		self.time = 0
+		self.frameTime = 0
+		self.newTime = 0
+		self.errorCount = 0
+		self.maxError = None
+
+	def Frame(self,frameTime):
+		self.time = self.newTime
+		self.frameTime = frameTime
+
+		if 0 != frameTime:
+			fps = 1.0/frameTime
+			error = self.fps -fps
+			if (0>= error) or (0.001 < error):
+				self.errorCount = self.errorCount + 1
+				if (self.maxError is None) or (abs(self.maxError) < abs(error)):
+					self.maxError = error
+
+	def FrameEnd(self):
+		self.newTime = self.time + self.frameTime
+
+	def GetTime(self):
+		return 1.0 + self.time * self.fps
+
+def SanitizeVector(v):
+	x, y, z = v
+	if math.isinf(x) or math.isinf(y) or math.isinf(z):
+		return (0.0, 0.0, 0.0)
+	return v
+
+def SanitizeMatrix3x4(v):
+	return tuple(0.0 if math.isinf(val) else val for val in v)
+
+# Batch conversions, all quaternions are (w,x,y,z) like in mathutils.
+# QuaternionsMultiply, QAnglesToQuaternions and ValveToBlenderLocations compute in single precision in the same
+# order as mathutils, so they give the same values as the per sample code (see afx_utils.QAngle):
+
+def QuaternionsMultiply(a, b):
+	"""Same as a @ b for (...,4) quaternions, returns float32."""
+	aw, ax, ay, az = numpy.moveaxis(numpy.asarray(a, dtype=numpy.float32), -1, 0)
+	bw, bx, by, bz = numpy.moveaxis(numpy.asarray(b, dtype=numpy.float32), -1, 0)
+	return numpy.stack((
+		aw * bw - ax * bx - ay * by - az * bz,
+		aw * bx + ax * bw + ay * bz - az * by,
+		aw * by + ay * bw + az * bx - ax * bz,
+		aw * bz + az * bw + ax * by - ay * bx), axis=-1)
+
+def QAnglesToQuaternions(angles):
+	"""Same as QAngle.to_quaternion for an (N,3) array of (pitch, yaw, roll) in degrees, returns float32."""
+	halves = 0.5 * numpy.radians(numpy.asarray(angles, dtype=numpy.float64))
+	cos = numpy.cos(halves)
+	sin = numpy.sin(halves)
+	zeros = numpy.zeros(len(halves))
+	qPitchY = numpy.stack((cos[:, 0], -sin[:, 0], zeros, zeros), axis=-1)
+	qYawZ = numpy.stack((cos[:, 1], zeros, zeros, sin[:, 1]), axis=-1)
+	qRollX = numpy.stack((cos[:, 2], zeros, sin[:, 2], zeros), axis=-1)
+	return QuaternionsMultiply(QuaternionsMultiply(qYawZ, qPitchY), qRollX)
+
+def Matrices3x3ToQuaternions(m):
+	"""Converts (...,3,3) orthonormal rotation matrices to quaternions with w >= 0."""
+	m00, m01, m02 = m[..., 0, 0], m[..., 0, 1], m[..., 0, 2]
+	m10, m11, m12 = m[..., 1, 0], m[..., 1, 1], m[..., 1, 2]
+	m20, m21, m22 = m[..., 2, 0], m[..., 2, 1], m[..., 2, 2]
+
+	q = numpy.empty(m.shape[:-2] + (4,), dtype=numpy.float64)
+
+	trace = m00 + m11 + m22
+	caseW = 0 < trace
+	caseX = ~caseW & (m11 <= m00) & (m22 <= m00)
+	caseY = ~caseW & ~caseX & (m22 <= m11)
+	caseZ = ~caseW & ~caseX & ~caseY
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		s = 2.0 * numpy.sqrt(numpy.maximum(1.0 + trace, 0.0))
+		q[caseW] = numpy.stack((0.25 * s, (m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s), axis=-1)[caseW]
+		s = 2.0 * numpy.sqrt(numpy.maximum(1.0 + m00 - m11 - m22, 0.0))
+		q[caseX] = numpy.stack(((m21 - m12) / s, 0.25 * s, (m01 + m10) / s, (m02 + m20) / s), axis=-1)[caseX]
+		s = 2.0 * numpy.sqrt(numpy.maximum(1.0 + m11 - m00 - m22, 0.0))
+		q[caseY] = numpy.stack(((m02 - m20) / s, (m01 + m10) / s, 0.25 * s, (m12 + m21) / s), axis=-1)[caseY]
+		s = 2.0 * numpy.sqrt(numpy.maximum(1.0 + m22 - m00 - m11, 0.0))
+		q[caseZ] = numpy.stack(((m10 - m01) / s, (m02 + m20) / s, (m12 + m21) / s, 0.25 * s), axis=-1)[caseZ]
+
+	q[q[..., 0] < 0] *= -1.0
+	length = numpy.linalg.norm(q, axis=-1, keepdims=True)
+	length[0 == length] = 1.0
+	return q / length
+
+def DecomposeMatrices(m):
+	"""Same as mathutils Matrix.decompose for (...,3,4) matrices, returns location, rotation, scale."""
+	m = numpy.asarray(m, dtype=numpy.float64)
+	location = m[..., :, 3].copy()
+	rot = m[..., :, :3]
+	scale = numpy.linalg.norm(rot, axis=-2)
+	scale[numpy.linalg.det(rot) < 0] *= -1.0
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		safeScale = numpy.where(0 == scale, 1.0, scale)
+		rotation = Matrices3x3ToQuaternions(rot / safeScale[..., numpy.newaxis, :])
+	return location, rotation, scale
+
+def QuaternionsToMatrices3x4(vectors, quaternions):
+	"""Returns Translation(vector) @ quaternion.to_matrix() as (...,3,4) for quaternions given as (x,y,z,w) like in the AGR."""
+	x, y, z, w = quaternions[..., 0], quaternions[..., 1], quaternions[..., 2], quaternions[..., 3]
+	xx = 2.0 * x * x
+	yy = 2.0 * y * y
+	zz = 2.0 * z * z
+	xy = 2.0 * x * y
+	xz = 2.0 * x * z
+	yz = 2.0 * y * z
+	wx = 2.0 * w * x
+	wy = 2.0 * w * y
+	wz = 2.0 * w * z
+	return numpy.stack((
+		numpy.stack((1.0 - yy - zz, xy - wz, xz + wy, vectors[..., 0]), axis=-1),
+		numpy.stack((xy + wz, 1.0 - xx - zz, yz - wx, vectors[..., 1]), axis=-1),
+		numpy.stack((xz - wy, yz + wx, 1.0 - xx - yy, vectors[..., 2]), axis=-1)), axis=-2)
+
+def DecodeBoneMatrices(version, data, numBones):
+	"""Decodes concatenated bone lists of numBones bones each into (N,numBones,3,4) float32 matrices."""
+	values = numpy.frombuffer(data, dtype='<f4')
+
+	if 5 == version:
+		values = values.reshape((-1, numBones, 7))
+		vectors = values[..., 0:3]
+		vectors = numpy.where(numpy.isinf(vectors).any(axis=-1, keepdims=True), 0.0, vectors)
+		quaternions = values[..., 3:7]
+		quaternions = numpy.where(numpy.isinf(quaternions).any(axis=-1, keepdims=True), numpy.array((0.0, 0.0, 0.0, 1.0), dtype=numpy.float32), quaternions)
+		return QuaternionsToMatrices3x4(vectors, quaternions).astype(numpy.float32)
+
+	matrices = values.reshape((-1, numBones, 3, 4)).copy()
+	matrices[numpy.isinf(matrices)] = 0.0
+	return matrices
+
+def RestRelativeInverses(restMatrices, parentIndices):
+	"""Returns the inverse rest matrices (B,4,4) relative to the parent bone.
+
+	restMatrices: Armature space rest matrices (B,4,4) (Bone.matrix_local).
+	parentIndices: Index of the parent bone in restMatrices, -1 for root bones."""
+	restMatrices = numpy.asarray(restMatrices, dtype=numpy.float64)
+	parentIndices = numpy.asarray(parentIndices)
+	relative = restMatrices.copy()
+	hasParent = 0 <= parentIndices
+	relative[hasParent] = numpy.linalg.inv(restMatrices[parentIndices[hasParent]]) @ restMatrices[hasParent]
+	return numpy.linalg.inv(relative)
+
+def BoneBasisTransforms(boneMatrices, restRelativeInverse):
+	"""Returns location, rotation and scale of the pose bone for (N,3,4) bone matrices relative to the
+	parent's pose (or armature space for roots). This is what setting PoseBone.matrix to
+	parent.matrix @ boneMatrix results in for bones inheriting rotation and scale."""
+	count = len(boneMatrices)
+	matrices = numpy.zeros((count, 4, 4), dtype=numpy.float64)
+	matrices[:, :3, :] = boneMatrices
+	matrices[:, 3, 3] = 1.0
+	basis = numpy.matmul(restRelativeInverse, matrices)
+	return DecomposeMatrices(basis[:, :3, :])
+
+# valveMatrixToBlender (rotation by 90 degrees around Z) applied to (...,3,4) matrices:
+def ValveToBlenderMatrices(m):
+	return numpy.stack((-m[..., 1, :], m[..., 0, :], m[..., 2, :]), axis=-2)
+
+# Quake (x,y,z) vectors to Blender:
+def ValveToBlenderVectors(v):
+	return numpy.stack((-v[..., 1], v[..., 0], v[..., 2]), axis=-1)
+
+def ValveToBlenderLocations(v, globalScale):
+	"""Same as Vector((-y, x, z)) * globalScale for (N,3) Quake vectors, returns float32."""
+	return ValveToBlenderVectors(numpy.asarray(v, dtype=numpy.float32)) * numpy.float32(globalScale)
+
+def FovsToLenses(fovs, sensorWidth):
+	"""Lens (focal length) for horizontal field of views in degrees and the camera's sensor width."""
+	return sensorWidth / (2.0 * numpy.tan(numpy.radians(fovs) / 2.0))
+
+BONE_SIZE = {5: VECTOR.size + QUATERNION.size, 6: MATRIX3X4.size}
+
+BLENDER_CAM_UP_QUAT = numpy.array((math.cos(0.5 * math.radians(90.0)), math.sin(0.5* math.radians(90.0)), 0.0, 0.0))
+
+def ClipRange(times, begin, end):
+	"""Returns the slice (lo, hi) of the (ascending) times within [begin, end]."""
+	return bisect.bisect_left(times, begin), bisect.bisect_right(times, end)
+
+def ClipSamples(times, samples, begin, end):
+	"""Returns the (ascending) times and their samples within [begin, end].
+	samples can be flat (i.e. an array with a fixed number of values per sample)."""
+	width = len(samples) // len(times) if 0 < len(times) else 1
+	lo, hi = ClipRange(times, begin, end)
+	return times[lo:hi], samples[lo * width:hi * width]
+
+def NewTimes():
+	return array.array('d')
+
+def NewValues():
+	"""Growable buffer of float64 sample values, appended to with extend."""
+	return array.array('d')
+
+def NewFlags():
+	return array.array('b')
+
+class CameraTrack:
+	"""Camera (afxCam or entity camera) samples, after Finish as columns:
+	times (N), location (N,3), rotation (N,4) and fov (N) in degrees.
+
+	Till then times and samples (7 values each) are collected in typed buffers."""
+
+	__slots__ = ('name', 'lastTime', 'sample', 'times', 'samples', 'location', 'rotation', 'fov')
+
+	def __init__(self,name):
+		self.name = name
+
+		self.lastTime = None
+		self.sample = None
+
+		self.times = NewTimes()
+		self.samples = NewValues()
+
+	def UpdateSample(self,curTime,sample):
+		self.Update(curTime)
+		self.sample = sample
+
+	def Update(self,curTime):
+		if((self.lastTime is not None) and ((curTime is None) or (self.lastTime < curTime))):
+			if self.sample is not None:
+				self.times.append(self.lastTime)
+				self.samples.extend(self.sample)
+			self.sample = None
+
+		self.lastTime = curTime
+
+	def Discard(self):
+		"""Drops the samples collected so far (keeps pending updates)."""
+		self.times = NewTimes()
+		self.samples = NewValues()
+
+	def Clip(self,begin,end):
+		self.Update(None) #finish lingering updates
+		self.times, self.samples = ClipSamples(self.times, self.samples, begin, end)
+
+	def HasSamples(self):
+		return 0 < len(self.times)
+
+	def Finish(self,globalScale):
+		self.Update(None) #finish lingering updates
+
+		samples = numpy.array(self.samples, dtype=numpy.float64).reshape((-1, 7))
+		self.times = numpy.array(self.times, dtype=numpy.float64)
+		self.location = ValveToBlenderLocations(samples[:, 0:3], globalScale).astype(numpy.float64)
+		self.rotation = QuaternionsMultiply(QAnglesToQuaternions(samples[:, 3:6]), BLENDER_CAM_UP_QUAT).astype(numpy.float64)
+		self.fov = samples[:, 6].copy()
+		self.samples = None
+
+	@staticmethod
+	def Merge(parts):
+		"""Concatenates finished tracks of consecutive chunks, see ReadAgrParallel."""
+		camera = CameraTrack(parts[0].name)
+		camera.times = numpy.concatenate([part.times for part in parts])
+		camera.location = numpy.concatenate([part.location for part in parts])
+		camera.rotation = numpy.concatenate([part.rotation for part in parts])
+		camera.fov = numpy.concatenate([part.fov for part in parts])
+		camera.samples = None
+		return camera
+
+# Number of spilled bone samples decoded at once:
+SPILL_DECODE_BLOCK = 4096
+
+class BoneSpill:
+	"""Raw bone samples of an EntityTrack in a temporary file instead of memory, see AgrParser.memoryBudget."""
+
+	__slots__ = ('directory', 'file', 'sizes', 'first', 'count')
+
+	def __init__(self,directory):
+		self.directory = directory
+		self.file = tempfile.TemporaryFile(dir=directory)
+		self.sizes = array.array('q')
+		self.first = 0
+		self.count = 0
+
+	def Append(self,data):
+		self.file.write(data)
+		self.sizes.append(len(data))
+		self.count += 1
+
+	def Discard(self):
+		self.file.seek(0)
+		self.file.truncate()
+		self.sizes = array.array('q')
+		self.first = 0
+		self.count = 0
+
+	def Clip(self,lo,hi):
+		self.first += lo
+		self.count = hi - lo
+
+	def Close(self):
+		self.file.close()
+
+def NewSpilledMatrices(directory, count, numBones):
+	"""Returns zeroed (count, numBones, 3, 4) float32 matrices backed by a temporary file,
+	stored bone by bone, so reading them per bone reads contiguous data."""
+	if 0 == count * numBones:
+		return numpy.zeros((count, numBones, 3, 4), dtype=numpy.float32)
+	matrices = numpy.memmap(tempfile.TemporaryFile(dir=directory), dtype=numpy.float32, mode='w+', shape=(numBones, count, 3, 4))
+	return matrices.transpose((1, 0, 2, 3))
+
+class EntityTrack:
+	"""Samples of one Blender object (entity handles with the same model get re-used).
+
+	After Finish the columns are:
+	visibilityTimes (N), visible (N);
+	transformTimes (N), location (N,3), rotation (N,4);
+	scaleTimes (N), scale (N,3);
+	boneTimes (N), boneCounts (N), boneMatrices (N,B,3,4) as in file (parent relative).
+
+	Till then the times, visibility and (flattened) transforms are collected in typed buffers,
+	the bones as the raw bytes from the file."""
+
+	__slots__ = ('objNr', 'modelName', 'lastRenderOrigin', 'camera', 'accepted',
+		'lastTime', 'visible', 'origin', 'transform', 'scaleTransform', 'bones',
+		'visibilityTimes', 'visibility', 'transformTimes', 'transforms', 'scaleTimes', 'scaleTransforms', 'boneTimes', 'boneSamples',
+		'location', 'rotation', 'scale', 'boneCounts', 'boneMatrices', 'boneBytes', 'boneDecodeTime', 'boneSpill')
+
+	def __init__(self,objNr,modelName):
+		self.objNr = objNr
+		self.modelName = modelName
+		self.lastRenderOrigin = None
+		self.camera = None
+		self.accepted = False
+
+		self.lastTime = None
+		self.visible = None
+		self.origin = None
+		self.transform = None
+		self.scaleTransform = None
+		self.bones = None
+
+		self.visibilityTimes = NewTimes()
+		self.visibility = NewFlags()
+		self.transformTimes = NewTimes()
+		self.transforms = NewValues()
+		self.scaleTimes = NewTimes()
+		self.scaleTransforms = NewValues()
+		self.boneTimes = NewTimes()
+		self.boneSamples = []
+		self.boneSpill = None
+
+	def UpdateVisible(self,curTime,visible):
+		self.Update(curTime)
+		self.visible = visible
+
+	def UpdateTransform(self,curTime,origin,transform):
+		self.Update(curTime)
+		self.origin = origin
+		self.transform = transform
+		self.scaleTransform = transform
+
+	def UpdateBones(self,curTime,bones):
+		self.Update(curTime)
+		self.bones = bones
+
+	def Update(self,curTime):
+		if((self.lastTime is not None) and ((curTime is None) or (self.lastTime < curTime))):
+
+			if self.visible is not None:
+				self.visibilityTimes.append(self.lastTime)
+				self.visibility.append(self.visible)
+
+			if self.transform is not None:
+				self.lastRenderOrigin = self.origin
+				self.transformTimes.append(self.lastTime)
+				self.transforms.extend(self.transform)
+
+			# Scale is not reset, it is keyed again with each update:
+			if self.scaleTransform is not None:
+				self.scaleTimes.append(self.lastTime)
+				self.scaleTransforms.extend(self.scaleTransform)
+
+			if self.bones is not None:
+				self.boneTimes.append(self.lastTime)
+				if self.boneSpill is not None:
+					self.boneSpill.Append(self.bones)
+				else:
+					self.boneSamples.append(self.bones)
+
+			self.visible = None
+			self.transform = None
+			self.bones = None
+
+		self.lastTime = curTime
+
+	def GetLastRenderOrigin(self):
+		"""The lastRenderOrigin as it will be after the pending updates are applied."""
+		return self.origin if self.transform is not None else self.lastRenderOrigin
+
+	def Discard(self):
+		"""Drops the samples collected so far (keeps pending updates)."""
+		self.visibilityTimes = NewTimes()
+		self.visibility = NewFlags()
+		self.transformTimes = NewTimes()
+		self.transforms = NewValues()
+		self.scaleTimes = NewTimes()
+		self.scaleTransforms = NewValues()
+		self.boneTimes = NewTimes()
+		self.boneSamples = []
+		if self.boneSpill is not None:
+			self.boneSpill.Discard()
+		if self.camera is not None:
+			self.camera.Discard()
+
+	def GetHeldBoneBytes(self):
+		return 0 if self.boneSpill is not None else sum(len(bones) for bones in self.boneSamples)
+
+	def SpillBones(self,directory):
+		"""Moves the bone samples to a temporary file in directory (None for the default), later ones go there too."""
+		self.boneSpill = BoneSpill(directory)
+		for bones in self.boneSamples:
+			self.boneSpill.Append(bones)
+		self.boneSamples = []
+
+	def Clip(self,begin,end):
+		self.Update(None) #finish lingering updates
+		self.visibilityTimes, self.visibility = ClipSamples(self.visibilityTimes, self.visibility, begin, end)
+		self.transformTimes, self.transforms = ClipSamples(self.transformTimes, self.transforms, begin, end)
+		self.scaleTimes, self.scaleTransforms = ClipSamples(self.scaleTimes, self.scaleTransforms, begin, end)
+		if self.boneSpill is not None:
+			lo, hi = ClipRange(self.boneTimes, begin, end)
+			self.boneTimes = self.boneTimes[lo:hi]
+			self.boneSpill.Clip(lo, hi)
+		else:
+			self.boneTimes, self.boneSamples = ClipSamples(self.boneTimes, self.boneSamples, begin, end)
+		if self.camera is not None:
+			self.camera.Clip(begin, end)
+			if not self.camera.HasSamples():
+				self.camera = None
+
+	def HasSamples(self):
+		return 0 < len(self.transformTimes) or 0 < len(self.boneTimes) or (self.camera is not None and self.camera.HasSamples())
+
+	def Finish(self,version,globalScale):
+		self.Update(None) #finish lingering updates
+
+		self.visibilityTimes = numpy.array(self.visibilityTimes, dtype=numpy.float64)
+		self.visible = numpy.array(self.visibility, dtype=bool)
+		self.visibility = None
+
+		self.transformTimes = numpy.array(self.transformTimes, dtype=numpy.float64)
+		self.scaleTimes = numpy.array(self.scaleTimes, dtype=numpy.float64)
+
+		if 5 == version:
+			transforms = numpy.array(self.transforms, dtype=numpy.float64).reshape((-1, 6))
+			self.location = ValveToBlenderLocations(transforms[:, 0:3], globalScale).astype(numpy.float64)
+			self.rotation = QAnglesToQuaternions(transforms[:, 3:6]).astype(numpy.float64)
+			self.scale = numpy.full((len(self.scaleTimes), 3), globalScale)
+		else:
+			transforms = ValveToBlenderMatrices(numpy.array(self.transforms, dtype=numpy.float64).reshape((-1, 3, 4)))
+			self.location, self.rotation, scale = DecomposeMatrices(transforms)
+			self.location *= globalScale
+			scaleTransforms = ValveToBlenderMatrices(numpy.array(self.scaleTransforms, dtype=numpy.float64).reshape((-1, 3, 4)))
+			scale = DecomposeMatrices(scaleTransforms)[2]
+			self.scale = scale * globalScale
+
+		self.transforms = None
+		self.scaleTransforms = None
+
+		self.boneTimes = numpy.array(self.boneTimes, dtype=numpy.float64)
+
+		if self.boneSpill is not None:
+			self.FinishSpilledBones(version)
+			return
+
+		boneSize = BONE_SIZE[version]
+		self.boneCounts = numpy.array([len(bones) // boneSize for bones in self.boneSamples], dtype=numpy.int32)
+		maxBones = int(self.boneCounts.max()) if 0 < len(self.boneCounts) else 0
+		self.boneMatrices = numpy.zeros((len(self.boneSamples), maxBones, 3, 4), dtype=numpy.float32)
+
+		self.boneBytes = sum(len(bones) for bones in self.boneSamples)
+		time_decode = time.perf_counter()
+
+		# Decode all samples with the same number of bones in one go:
+		for numBones in numpy.unique(self.boneCounts).tolist():
+			if 0 == numBones:
+				continue
+			samples = numpy.flatnonzero(self.boneCounts == numBones)
+			data = b"".join([self.boneSamples[idx] for idx in samples.tolist()])
+			self.boneMatrices[samples, :numBones] = DecodeBoneMatrices(version, data, numBones)
+
+		self.boneDecodeTime = time.perf_counter() - time_decode
+		self.boneSamples = None
+
+	def FinishSpilledBones(self,version):
+		"""Decodes the spilled bone samples block-wise into file backed boneMatrices, see NewSpilledMatrices."""
+		spill = self.boneSpill
+		spill.file.flush()
+
+		boneSize = BONE_SIZE[version]
+		sizes = numpy.array(spill.sizes, dtype=numpy.int64)
+		offsets = numpy.concatenate(([0], numpy.cumsum(sizes)))[spill.first:spill.first + spill.count]
+		sizes = sizes[spill.first:spill.first + spill.count]
+
+		self.boneCounts = (sizes // boneSize).astype(numpy.int32)
+		maxBones = int(self.boneCounts.max()) if 0 < len(self.boneCounts) else 0
+		self.boneMatrices = NewSpilledMatrices(spill.directory, len(sizes), maxBones)
+		self.boneBytes = int(sizes.sum())
+
+		time_decode = time.perf_counter()
+
+		if 0 < self.boneBytes:
+			with mmap.mmap(spill.file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				for numBones in numpy.unique(self.boneCounts).tolist():
+					if 0 == numBones:
+						continue
+					samples = numpy.flatnonzero(self.boneCounts == numBones)
+					for first in range(0, len(samples), SPILL_DECODE_BLOCK):
+						block = samples[first:first + SPILL_DECODE_BLOCK]
+						blockData = b"".join([data[offset:offset + size] for offset, size in zip(offsets[block].tolist(), sizes[block].tolist())])
+						self.boneMatrices[block, :numBones] = DecodeBoneMatrices(version, blockData, numBones)
+
+		self.boneDecodeTime = time.perf_counter() - time_decode
+		self.boneSamples = None
+		spill.Close()
+		self.boneSpill = None
+
+	@staticmethod
+	def Merge(parts):
+		"""Concatenates finished tracks of the same entity from consecutive chunks, see ReadAgrParallel."""
+		entity = EntityTrack(parts[0].objNr, parts[0].modelName)
+		entity.accepted = any(part.accepted for part in parts)
+
+		for name in ('visibilityTimes', 'visible', 'transformTimes', 'location', 'rotation', 'scaleTimes', 'scale', 'boneTimes', 'boneCounts'):
+			setattr(entity, name, numpy.concatenate([getattr(part, name) for part in parts]))
+
+		maxBones = max(part.boneMatrices.shape[1] for part in parts)
+		entity.boneMatrices = numpy.zeros((len(entity.boneTimes), maxBones, 3, 4), dtype=numpy.float32)
+		first = 0
+		for part in parts:
+			entity.boneMatrices[first:first + len(part.boneMatrices), :part.boneMatrices.shape[1]] = part.boneMatrices
+			first += len(part.boneMatrices)
+
+		entity.boneBytes = sum(part.boneBytes for part in parts)
+		entity.boneDecodeTime = sum(part.boneDecodeTime for part in parts)
+
+		cameras = [part.camera for part in parts if part.camera is not None]
+		entity.camera = CameraTrack.Merge(cameras) if 0 < len(cameras) else None
+
+		entity.visibility = None
+		entity.transforms = None
+		entity.scaleTransforms = None
+		entity.boneSamples = None
+		return entity
+
+# Grid cell size (in game units) of EntityReusePool:
+REUSE_CELL_SIZE = 512.0
+
+class EntityReuseModel:
+	def __init__(self):
+		self.cells = {}
+		self.noOrigin = {}
+		self.count = 0
+
+class EntityReusePool:
+	"""The unused EntityTracks per model name, with a grid hash over their lastRenderOrigin to find the one to re-use quickly.
+
+	Picks the same one as scanning all unused entities in the order they were added would:
+	The last one added without lastRenderOrigin, otherwise the first one added with the smallest distance.
+	The lastRenderOrigin of an entity must not change while it is in the pool."""
+
+	def __init__(self,cellSize):
+		self.cellSize = cellSize if 0 < cellSize else 1.0
+		self.models = {}
+		self.slots = {}
+		self.nextSeq = 0
+
+	def __len__(self):
+		return len(self.slots)
+
+	def GetCell(self,origin):
+		cellSize = self.cellSize
+		return (math.floor(origin[0] / cellSize), math.floor(origin[1] / cellSize), math.floor(origin[2] / cellSize))
+
+	def Add(self,entity):
+		model = self.models.get(entity.modelName, None)
+		if model is None:
+			model = self.models[entity.modelName] = EntityReuseModel()
+
+		seq = self.nextSeq
+		self.nextSeq += 1
+
+		if entity.lastRenderOrigin is None:
+			cell = None
+			model.noOrigin[seq] = entity
+		else:
+			cell = self.GetCell(entity.lastRenderOrigin)
+			cellEntities = model.cells.get(cell, None)
+			if cellEntities is None:
+				cellEntities = model.cells[cell] = {}
+			cellEntities[seq] = entity
+
+		model.count += 1
+		self.slots[entity.objNr] = (seq, cell)
+
+	def Remove(self,entity):
+		model = self.models[entity.modelName]
+		seq, cell = self.slots.pop(entity.objNr)
+
+		if cell is None:
+			del model.noOrigin[seq]
+		else:
+			cellEntities = model.cells[cell]
+			del cellEntities[seq]
+			if 0 == len(cellEntities):
+				del model.cells[cell]
+
+		model.count -= 1
+
+	def Pop(self,modelName,origin):
+		"""Removes and returns the entity with the model to re-use at origin or None."""
+		model = self.models.get(modelName, None)
+		if (model is None) or 0 == model.count:
+			return None
+
+		if 0 < len(model.noOrigin):
+			entity = model.noOrigin[max(model.noOrigin)]
+		else:
+			entity = self.FindClosest(model, origin)
+
+		self.Remove(entity)
+		return entity
+
+	def FindClosest(self,model,origin):
+		best = None
+		bestLength = None
+		bestSeq = None
+
+		def consider(cellEntities):
+			nonlocal best, bestLength, bestSeq
+			for seq, entity in cellEntities.items():
+				length = math.dist(entity.lastRenderOrigin, origin)
+				if (best is None) or length < bestLength or (length == bestLength and seq < bestSeq):
+					best = entity
+					bestLength = length
+					bestSeq = seq
+
+		cx, cy, cz = self.GetCell(origin)
+		radius = 0
+
+		while True:
+			if len(model.cells) <= (2 * radius + 1) ** 3:
+				# Cheaper to look at all cells than at the next ring:
+				best = None
+				for cellEntities in model.cells.values():
+					consider(cellEntities)
+				return best
+
+			# Cells with a Chebyshev distance of radius:
+			for dx in range(-radius, radius + 1):
+				for dy in range(-radius, radius + 1):
+					if radius == abs(dx) or radius == abs(dy):
+						dzs = range(-radius, radius + 1)
+					else:
+						dzs = (-radius, radius) if 0 < radius else (0,)
+					for dz in dzs:
+						cellEntities = model.cells.get((cx + dx, cy + dy, cz + dz), None)
+						if cellEntities is not None:
+							consider(cellEntities)
+
+			# Entities in further rings are at least radius * cellSize away:
+			if (best is not None) and bestLength < radius * self.cellSize * (1.0 - 1e-9):
+				return best
+
+			radius += 1
+
+	def GetEntities(self):
+		"""Returns the entities in the order they were added."""
+		entities = {}
+		for model in self.models.values():
+			entities.update(model.noOrigin)
+			for cellEntities in model.cells.values():
+				entities.update(cellEntities)
+		return [entities[seq] for seq in sorted(entities)]
+
+# Model name patterns of the "players only" preset (Source 1 and Source 2 games):
+PLAYER_MODEL_PATTERNS = ("models/player/*", "characters/models/*")
+
+class AgrEntityFilter:
+	"""Decides which entities are parsed by their model name (glob patterns, case insensitive) and handle.
+
+	Entities are included if no include patterns / handles are given or if either one matches,
+	unless an exclude pattern or handle matches."""
+
+	def __init__(self, includeModels = (), excludeModels = (), includeHandles = (), excludeHandles = ()):
+		self.includeModels = [pattern.lower() for pattern in includeModels]
+		self.excludeModels = [pattern.lower() for pattern in excludeModels]
+		self.includeHandles = set(includeHandles)
+		self.excludeHandles = set(excludeHandles)
+		self.includeAll = 0 == len(self.includeModels) and 0 == len(self.includeHandles)
+		self.modelResults = {}
+
+	def MatchModel(self, patterns, modelName):
+		return any(fnmatch.fnmatchcase(modelName, pattern) for pattern in patterns)
+
+	def GetModelResult(self, modelName):
+		"""Returns (included, excluded) for the model name, cached since the same names are checked every frame."""
+		result = self.modelResults.get(modelName, None)
+		if result is None:
+			lowerName = modelName.lower()
+			result = (self.MatchModel(self.includeModels, lowerName), self.MatchModel(self.excludeModels, lowerName))
+			self.modelResults[modelName] = result
+		return result
+
+	def Accepts(self, handle, modelName):
+		included, excluded = self.GetModelResult(modelName)
+		if excluded or handle in self.excludeHandles:
+			return False
+		return self.includeAll or included or handle in self.includeHandles
+
+	def GetKey(self):
+		"""Returns the filter options as (JSON serializable) dict, see agr_cache."""
+		return {
+			'includeModels': sorted(self.includeModels),
+			'excludeModels': sorted(self.excludeModels),
+			'includeHandles': sorted(self.includeHandles),
+			'excludeHandles': sorted(self.excludeHandles),
+		}
+
+class AgrRecording:
+	"""Result of AgrParser.Parse, entities are ordered by objNr."""
+
+	def __init__(self,version):
+		self.version = version
+		self.entities = []
+		self.afxCam = None
+		self.endTime = 1.0
+		self.fpsErrorCount = 0
+		self.fpsMaxError = None
+		self.boneBytes = 0
+		self.boneDecodeTime = 0.0
+		self.spilledEntities = 0
+		self.spilledBoneBytes = 0
+
+class AgrParser:
+	"""Decodes an AGR v5 / v6 file into columnar tracks, without creating anything in Blender.
+
+	fps: The (Blender) frames per second, times are returned in frames (first frame being 1).
+	globalScale: Scale applied to locations and scales.
+	entityFilter: Optional AgrEntityFilter, the bones and cameras of entities it doesn't accept are skipped
+	and objects that never got an accepted update are dropped.
+	onModel: Optional callable, called with the model name when an object gets its first accepted update
+	(i.e. to start loading the model while parsing continues).
+
+	memoryBudget: Optional number of bytes of bone samples to hold in memory, above it the bone samples of the
+	objects holding the most are spilled to temporary files in spillDirectory (None for the default one)."""
+
+	def __init__(self,fps,globalScale,entityFilter = None,onModel = None):
+		self.fps = fps
+		self.globalScale = globalScale
+		self.entityFilter = entityFilter
+		self.onModel = onModel
+		self.readBones = True
+		self.memoryBudget = None
+		self.spillDirectory = None
+
+	def Parse(self,agrFile,progress = None,frameRange = None,index = None):
+		"""Parses the file, if frameRange (first, last) is given only samples within it are kept.
+		With an AgrIndex for the file parsing starts at the checkpoint before the range."""
+		self.Begin(agrFile)
+
+		stopOffset = None
+
+		if (frameRange is not None) and (index is not None):
+			startCheckpoint, stopCheckpoint = index.FindCheckpoints((frameRange[0] - 1.0) / self.fps, (frameRange[1] - 1.0) / self.fps)
+			if startCheckpoint is not None:
+				self.Restore(index.dictionary, startCheckpoint)
+			if stopCheckpoint is not None:
+				stopOffset = stopCheckpoint['offset']
+
+		self.Run(progress, stopOffset)
+
+		return self.End(frameRange)
+
+	def Begin(self,agrFile):
+		"""Reads the header and resets the state, see Parse."""
+		self.reader = reader = agrFile.Reader()
+
+		version = ReadAgrVersion(reader)
+
+		if version is None:
+			raise AgrError('Invalid file format.')
+
+		if (5 != version and version != 6):
+			raise AgrError('Version '+str(version)+' is not supported!')
+
+		self.version = version
+		self.timeConverter = AgrTimeConverter(self.fps)
+		self.currentTime = self.timeConverter.GetTime()
+		self.dictionary = AgrDictionary()
+		self.handleToLastEntity = {}
+		self.unusedEntities = EntityReusePool(REUSE_CELL_SIZE * self.globalScale)
+		self.entities = []
+		self.afxCam = None
+		self.heldBoneBytes = 0
+		# Origins of pending updates of restored unused entities, they become the lastRenderOrigin on re-use:
+		self.pendingOrigins = {}
+
+	def Run(self,progress = None,stopOffset = None):
+		"""Parses packets from the current position till stopOffset (or the end of the file)."""
+		reader = self.reader
+		dictionary = self.dictionary
+
+		startOffset = reader.Tell()
+		if stopOffset is None:
+			stopOffset = reader.size
+
+		packetHandlers = {
+			'afxFrame': self.OnAfxFrame,
+			'afxFrameEnd': self.OnAfxFrameEnd,
+			'afxHidden': self.OnAfxHidden,
+			'deleted': self.OnDeleted,
+			'entity_state': self.OnEntityState,
+			'afxCam': self.OnAfxCam,
+		}
+
+		# Packet handlers by dictionary index, resolved once per dictionary entry:
+		indexHandlers = []
+
+		stupidCount = 0
+
+		while reader.pos < stopOffset:
+
+			if progress is not None and 0 == stupidCount % 100:
+				progress(float(reader.Tell() - startOffset)/float(stopOffset - startOffset))
+
+			stupidCount = stupidCount +1
+
+			idx = dictionary.ReadIndex(reader)
+
+			if idx is None:
+				break
+
+			while len(indexHandlers) < len(dictionary.dictionary):
+				indexHandlers.append(packetHandlers.get(dictionary.dictionary[len(indexHandlers)], None))
+
+			handler = indexHandlers[idx]
+
+			if handler is None:
+				raise AgrError('Unknown packet at '+str(reader.Tell()))
+
+			handler()
+
+	def End(self,frameRange = None,dropEmpty = True):
+		"""Clips the tracks to frameRange if given and returns the finished AgrRecording.
+
+		dropEmpty: If entities the entityFilter didn't accept or without samples (in frameRange) are dropped."""
+		recording = AgrRecording(self.version)
+
+		if dropEmpty and (self.entityFilter is not None):
+			self.entities = [entity for entity in self.entities if entity.accepted]
+
+		if frameRange is not None:
+			for entity in self.entities:
+				entity.Clip(frameRange[0], frameRange[1])
+			if self.afxCam is not None:
+				self.afxCam.Clip(frameRange[0], frameRange[1])
+				if not self.afxCam.HasSamples():
+					self.afxCam = None
+			if dropEmpty:
+				# Entities known from before the range that don't show up within it are dropped:
+				self.entities = [entity for entity in self.entities if entity.HasSamples()]
+
+		for entity in self.entities:
+			spilled = entity.boneSpill is not None
+			entity.Finish(self.version, self.globalScale)
+			if spilled:
+				recording.spilledEntities += 1
+				recording.spilledBoneBytes += entity.boneBytes
+			recording.boneBytes += entity.boneBytes
+			recording.boneDecodeTime += entity.boneDecodeTime
+			if entity.camera is not None:
+				entity.camera.Finish(self.globalScale)
+		recording.entities = self.entities
+
+		if self.afxCam is not None:
+			self.afxCam.Finish(self.globalScale)
+		recording.afxCam = self.afxCam
+
+		recording.endTime = self.timeConverter.GetTime()
+		recording.fpsErrorCount = self.timeConverter.errorCount
+		recording.fpsMaxError = self.timeConverter.maxError
+
+		self.reader = None
+
+		return recording
+
+	def Restore(self,dictionary,checkpoint):
+		"""Continues from an AgrIndex checkpoint instead of the start of the file."""
+		self.reader.Seek(checkpoint['offset'])
+		self.dictionary.dictionary = dictionary[:checkpoint['dictionarySize']]
+		self.timeConverter.newTime = checkpoint['time']
+
+		for objNr, modelName, origin, scaleTransform in checkpoint['entities']:
+			entity = EntityTrack(objNr, modelName)
+			if origin is not None:
+				entity.lastRenderOrigin = tuple(value * self.globalScale for value in origin)
+			if scaleTransform is not None:
+				entity.scaleTransform = tuple(scaleTransform)
+			self.entities.append(entity)
+
+		self.handleToLastEntity = { handle: self.entities[objNr - 1] for handle, objNr in checkpoint['handles'] }
+		for objNr in checkpoint['unused']:
+			self.unusedEntities.Add(self.entities[objNr - 1])
+		self.pendingOrigins = { objNr: tuple(value * self.globalScale for value in origin) for objNr, origin in checkpoint['pendingOrigins'] }
+
+	def HideEntity(self,handle):
+		entity = self.handleToLastEntity.pop(handle, None)
+		if entity is not None:
+			# Make ent invisible:
+			entity.UpdateVisible(self.currentTime, False)
+			self.unusedEntities.Add(entity)
+
+	def OnAfxFrame(self):
+		reader = self.reader
+
+		frameTime = reader.ReadFloat()
+
+		self.timeConverter.Frame(frameTime)
+		self.currentTime = self.timeConverter.GetTime()
+
+		afxHiddenOffset = reader.ReadInt()
+		if afxHiddenOffset:
+			curOffset = reader.Tell()
+			reader.Seek(curOffset + afxHiddenOffset -4)
+
+			numHidden = reader.ReadInt()
+			for i in range(numHidden):
+				self.HideEntity(reader.ReadInt())
+
+			reader.Seek(curOffset)
+
+	def OnAfxFrameEnd(self):
+		self.timeConverter.FrameEnd()
+
+		if (self.memoryBudget is not None) and self.memoryBudget < self.heldBoneBytes:
+			self.SpillBones()
+
+	def SpillBones(self):
+		"""Spills the bone samples of the objects holding the most till at most half of memoryBudget is held."""
+		held = sorted([(entity.GetHeldBoneBytes(), entity.objNr) for entity in self.entities if entity.boneSpill is None], reverse=True)
+		total = sum(size for size, objNr in held)
+
+		for size, objNr in held:
+			if total <= self.memoryBudget // 2:
+				break
+			self.entities[objNr - 1].SpillBones(self.spillDirectory)
+			total -= size
+
+		self.heldBoneBytes = total
+
+	def OnAfxHidden(self):
+		# skipped, because will be handled earlier by afxHiddenOffset
+		reader = self.reader
+		numHidden = reader.ReadInt()
+		reader.Seek(reader.Tell() + 4 * numHidden)
+
+	def OnDeleted(self):
+		self.HideEntity(self.reader.ReadInt())
+
+	def GetEntity(self,handle,modelName,origin):
+		entity = self.handleToLastEntity.get(handle, None)
+
+		if (entity is not None) and (entity.modelName != modelName):
+			# Switched model, make old model invisible:
+			entity.UpdateVisible(self.currentTime, False)
+			entity = None
+
+		if entity is None:
+
+			# Check if we can reuse s.th. (the closest unused one with the same model) and if not create new one:
+
+			entity = self.unusedEntities.Pop(modelName, origin)
+
+			if (entity is not None) and entity.objNr in self.pendingOrigins:
+				# Like applying the update that was pending when the checkpoint was made:
+				entity.lastRenderOrigin = self.pendingOrigins.pop(entity.objNr)
+
+			if entity is None:
+				entity = EntityTrack(len(self.entities) + 1, modelName)
+				self.entities.append(entity)
+
+			self.handleToLastEntity[handle] = entity
+
+		return entity
+
+	def OnEntityState(self):
+		reader = self.reader
+		dictionary = self.dictionary
+		currentTime = self.currentTime
+		entity = None
+
+		handle = reader.ReadInt()
+		if dictionary.Peekaboo(reader,'baseentity'):
+
+			modelName = dictionary.Read(reader)
+
+			visible = reader.ReadBool()
+
+			if 5 == self.version:
+				transform = SanitizeVector(reader.Unpack(VECTOR)) + SanitizeVector(reader.Unpack(VECTOR))
+				x, y, z = transform[0], transform[1], transform[2]
+			else:
+				transform = SanitizeMatrix3x4(reader.Unpack(MATRIX3X4))
+				x, y, z = transform[3], transform[7], transform[11]
+
+			origin = (-y * self.globalScale, x * self.globalScale, z * self.globalScale)
+
+			entity = self.GetEntity(handle, modelName, origin)
+
+			entity.UpdateVisible(currentTime, visible)
+			entity.UpdateTransform(currentTime, origin, transform)
+
+			if (self.entityFilter is None) or self.entityFilter.Accepts(handle, modelName):
+				if not entity.accepted:
+					entity.accepted = True
+					if self.onModel is not None:
+						self.onModel(modelName)
+			else:
+				# Still followed, so re-use is the same as without filter, but bones and camera are skipped:
+				entity = None
+
+		if dictionary.Peekaboo(reader,'baseanimating'):
+			#skin = ReadInt(file)
+			#body = ReadInt(file)
+			#sequence  = ReadInt(file)
+			hasBoneList = reader.ReadBool()
+			if hasBoneList:
+				numBones = reader.ReadInt()
+
+				if (entity is not None) and self.readBones:
+					# Decoded later on in one go, see EntityTrack.Finish:
+					entity.UpdateBones(currentTime, reader.ReadBytes(numBones * BONE_SIZE[self.version]))
+					if entity.boneSpill is None:
+						self.heldBoneBytes += numBones * BONE_SIZE[self.version]
+				else:
+					reader.Seek(reader.Tell() + numBones * BONE_SIZE[self.version])
+
+		if dictionary.Peekaboo(reader,'camera'):
+			thidPerson = reader.ReadBool()
+			pos = SanitizeVector(reader.Unpack(VECTOR))
+			rot = SanitizeVector(reader.Unpack(VECTOR))
+			fov = reader.ReadFloat()
+
+			if entity is not None:
+				if entity.camera is None:
+					entity.camera = CameraTrack("camera."+str(entity.objNr))
+				entity.camera.UpdateSample(currentTime, pos + rot + (fov,))
+
+		dictionary.Peekaboo(reader,'/')
+
+		viewModel = reader.ReadBool()
+
+	def OnAfxCam(self):
+		reader = self.reader
+
+		if self.afxCam is None:
+			self.afxCam = CameraTrack("afxCam")
+
+		pos = SanitizeVector(reader.Unpack(VECTOR))
+		rot = SanitizeVector(reader.Unpack(VECTOR))
+		fov = reader.ReadFloat()
+
+		self.afxCam.UpdateSample(self.currentTime, pos + rot + (fov,))
+
+AGR_INDEX_VERSION = 3
+
+class AgrIndex:
+	"""Checkpoints every interval afxFrames of an AGR file, so parsing can start in the middle.
+
+	Each checkpoint has the offset of the afxFrame packet, its start time in seconds, the size
+	of the dictionary and the entity state at that point: The entities with their unscaled last
+	origin and their scale transform (which is keyed again with each update), the handles in use,
+	the unused entities and the unscaled origins of the unused ones with a pending update."""
+
+	def __init__(self, interval):
+		self.interval = interval
+		self.fileSize = None
+		self.fileMTime = None
+		self.dictionary = []
+		self.checkpoints = []
+		self.frameCount = 0
+
+	def FindCheckpoints(self, beginTime, endTime):
+		"""Returns the last checkpoint at or before beginTime and the first one after endTime (in seconds), each can be None."""
+		times = [checkpoint['time'] for checkpoint in self.checkpoints]
+		lo = bisect.bisect_right(times, beginTime) - 1
+		hi = bisect.bisect_right(times, endTime)
+		return self.checkpoints[lo] if 0 <= lo else None, self.checkpoints[hi] if hi < len(self.checkpoints) else None
+
+	def IsValidFor(self, filepath):
+		stat = os.stat(filepath)
+		return self.fileSize == stat.st_size and self.fileMTime == stat.st_mtime_ns
+
+	def Save(self, path):
+		with open(path, 'w') as file:
+			json.dump({
+				'version': AGR_INDEX_VERSION,
+				'interval': self.interval,
+				'fileSize': self.fileSize,
+				'fileMTime': self.fileMTime,
+				'frameCount': self.frameCount,
+				'dictionary': self.dictionary,
+				'checkpoints': self.checkpoints,
+			}, file, separators=(',', ':'))
+
+	@staticmethod
+	def Load(path):
+		"""Returns the AgrIndex stored at path or None if it's not readable."""
+		try:
+			with open(path, 'r') as file:
+				data = json.load(file)
+		except (OSError, ValueError):
+			return None
+
+		if not isinstance(data, dict) or AGR_INDEX_VERSION != data.get('version', None):
+			return None
+
+		index = AgrIndex(data['interval'])
+		index.fileSize = data['fileSize']
+		index.fileMTime = data['fileMTime']
+		index.frameCount = data['frameCount']
+		index.dictionary = data['dictionary']
+		index.checkpoints = data['checkpoints']
+		return index
+
+class AgrIndexer(AgrParser):
+	"""Parses the file once to build an AgrIndex, samples are discarded on the way."""
+
+	def __init__(self, interval):
+		super().__init__(1.0, 1.0)
+		self.readBones = False
+		self.index = AgrIndex(interval)
+		self.frameCount = 0
+
+	def OnAfxFrame(self):
+		if 0 < self.frameCount and 0 == self.frameCount % self.index.interval:
+			# afxFrame is in the dictionary already, so the packet started with its index:
+			self.AddCheckpoint(self.reader.Tell() - INT.size)
+		self.frameCount += 1
+		super().OnAfxFrame()
+
+	def AddCheckpoint(self, offset):
+		unused = self.unusedEntities.GetEntities()
+		unusedNrs = set(entity.objNr for entity in unused)
+		self.index.checkpoints.append({
+			'offset': offset,
+			'frame': self.frameCount,
+			'time': self.timeConverter.newTime,
+			'dictionarySize': len(self.dictionary.dictionary),
+			# The pool matches on the origin the entity had when it was added (an update in the frame it got deleted
+			# is still pending then), the others are added later, after their pending updates are applied:
+			'entities': [[entity.objNr, entity.modelName, entity.lastRenderOrigin if entity.objNr in unusedNrs else entity.GetLastRenderOrigin(), entity.scaleTransform] for entity in self.entities],
+			'handles': [[handle, entity.objNr] for handle, entity in self.handleToLastEntity.items()],
+			'unused': [entity.objNr for entity in unused],
+			'pendingOrigins': [[entity.objNr, entity.origin] for entity in unused if entity.transform is not None],
+		})
+
+		for entity in self.entities:
+			entity.Discard()
+		if self.afxCam is not None:
+			self.afxCam.Discard()
+
+	def Build(self, filepath, progress = None):
+		stat = os.stat(filepath)
+		with AgrFile(filepath) as agrFile:
+			self.Parse(agrFile, progress)
+		self.index.fileSize = stat.st_size
+		self.index.fileMTime = stat.st_mtime_ns
+		self.index.frameCount = self.frameCount
+		self.index.dictionary = self.dictionary.dictionary
+		return self.index
+
+def GetAgrIndexPath(filepath):
+	return filepath + "i"
+
+def LoadAgrIndex(filepath, interval, progress = None):
+	"""Returns the index from the .agri sidecar of filepath if it matches the file and interval,
+	otherwise builds it. The second return value is True if it was (re-)built and should be saved."""
+	index = AgrIndex.Load(GetAgrIndexPath(filepath))
+	if (index is not None) and index.interval == interval and index.IsValidFor(filepath):
+		return index, False
+	return AgrIndexer(interval).Build(filepath, progress), True
+
+class AgrScanner(AgrParser):
+	"""Parses the file without bones and key frame data to summarize it, see ScanAgr."""
+
+	# Samples are only kept to follow the entity re-use, so they are dropped every this many frames:
+	DISCARD_INTERVAL = 256
+
+	def __init__(self, fps):
+		super().__init__(fps, 1.0)
+		self.readBones = False
+		self.frameCount = 0
+		self.minFrameTime = None
+		self.maxFrameTime = None
+		self.lifetimes = []
+		self.openLifetimes = {}
+
+	def OnAfxFrame(self):
+		super().OnAfxFrame()
+
+		frameTime = self.timeConverter.frameTime
+		if (self.minFrameTime is None) or frameTime < self.minFrameTime:
+			self.minFrameTime = frameTime
+		if (self.maxFrameTime is None) or self.maxFrameTime < frameTime:
+			self.maxFrameTime = frameTime
+
+		self.frameCount += 1
+		if 0 == self.frameCount % self.DISCARD_INTERVAL:
+			for entity in self.entities:
+				entity.Discard()
+			if self.afxCam is not None:
+				self.afxCam.Discard()
+
+	def HideEntity(self, handle):
+		self.openLifetimes.pop(handle, None)
+		super().HideEntity(handle)
+
+	def GetEntity(self, handle, modelName, origin):
+		entity = super().GetEntity(handle, modelName, origin)
+
+		lifetime = self.openLifetimes.get(handle, None)
+		if (lifetime is None) or lifetime['object'] != entity.objNr:
+			lifetime = { 'handle': handle, 'model': modelName, 'object': entity.objNr, 'firstFrame': self.currentTime, 'lastFrame': self.currentTime }
+			self.openLifetimes[handle] = lifetime
+			self.lifetimes.append(lifetime)
+		else:
+			lifetime['lastFrame'] = self.currentTime
+
+		return entity
+
+	def Scan(self, filepath, progress = None):
+		with AgrFile(filepath) as agrFile:
+			fileSize = agrFile.Size()
+			recording = self.Parse(agrFile, progress)
+
+		duration = self.timeConverter.newTime
+
+		models = {}
+		for entity in recording.entities:
+			models.setdefault(entity.modelName, { 'objects': 0, 'handles': 0 })['objects'] += 1
+		for lifetime in self.lifetimes:
+			models[lifetime['model']]['handles'] += 1
+
+		return {
+			'file': filepath,
+			'fileSize': fileSize,
+			'version': recording.version,
+			'frames': self.frameCount,
+			'duration': duration,
+			'endFrame': int(math.ceil(recording.endTime)),
+			'fps': {
+				'project': self.fps,
+				'average': self.frameCount / duration if 0 < duration else None,
+				'minFrameTime': self.minFrameTime,
+				'maxFrameTime': self.maxFrameTime,
+				'mismatchCount': recording.fpsErrorCount,
+				'maxMismatch': recording.fpsMaxError,
+			},
+			'models': models,
+			'handles': self.lifetimes,
+			'afxCam': recording.afxCam is not None,
+			'entityCameras': ["camera."+str(entity.objNr) for entity in recording.entities if entity.camera is not None],
+		}
+
+def ScanAgr(filepath,fps,progress = None):
+	"""Returns a summary (JSON serializable dict) of the AGR file at filepath, times are frames at fps:
+	frames, duration (seconds), endFrame, fps statistics, models (objects as imported and handles per model name),
+	handles (lifetimes of handles with their model and object number), afxCam and entityCameras (camera object names)."""
+	return AgrScanner(fps).Scan(filepath, progress)
+
+def GetPeakRss():
+	"""Returns the peak resident set size (working set on Windows) of the process in bytes or None if unknown."""
+	try:
+		import resource
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return peak if 'darwin' == sys.platform else peak * 1024
+	except ImportError:
+		pass
+
+	if 'nt' == os.name:
+		import ctypes
+		from ctypes import wintypes
+
+		class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+			_fields_ = [
+				('cb', wintypes.DWORD),
+				('PageFaultCount', wintypes.DWORD),
+				('PeakWorkingSetSize', ctypes.c_size_t),
+				('WorkingSetSize', ctypes.c_size_t),
+				('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+				('QuotaPagedPoolUsage', ctypes.c_size_t),
+				('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+				('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+				('PagefileUsage', ctypes.c_size_t),
+				('PeakPagefileUsage', ctypes.c_size_t),
+			]
+
+		counters = PROCESS_MEMORY_COUNTERS()
+		counters.cb = ctypes.sizeof(counters)
+		getCurrentProcess = ctypes.windll.kernel32.GetCurrentProcess
+		getCurrentProcess.restype = wintypes.HANDLE
+		getProcessMemoryInfo = ctypes.windll.psapi.GetProcessMemoryInfo
+		getProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+		if getProcessMemoryInfo(getCurrentProcess(), ctypes.byref(counters), counters.cb):
+			return counters.PeakWorkingSetSize
+
+	return None
+
+def ReadAgrChunk(filepath,fps,globalScale,entityFilter,readBones,frameRange,dictionary,startCheckpoint,stopOffset):
+	"""Parses the part of the file from startCheckpoint (None for the start) to stopOffset (None for the end),
+	without dropping entities, see ReadAgrParallel. Runs in the worker processes."""
+	parser = AgrParser(fps, globalScale, entityFilter)
+	parser.readBones = readBones
+	with AgrFile(filepath) as agrFile:
+		parser.Begin(agrFile)
+		if startCheckpoint is not None:
+			parser.Restore(dictionary, startCheckpoint)
+		parser.Run(None, stopOffset)
+		return parser.End(frameRange, False)
+
+def GetAgrChunks(index,chunkCount,fps,frameRange = None):
+	"""Splits the file at the index checkpoints into up to chunkCount chunks of about the same number
+	of frames, returns a list of (startCheckpoint, stopOffset), where None means start / end of file."""
+	boundaries = [None] + index.checkpoints + [None]
+
+	if frameRange is not None:
+		startCheckpoint, stopCheckpoint = index.FindCheckpoints((frameRange[0] - 1.0) / fps, (frameRange[1] - 1.0) / fps)
+		first = 0 if startCheckpoint is None else index.checkpoints.index(startCheckpoint) + 1
+		last = len(boundaries) - 1 if stopCheckpoint is None else index.checkpoints.index(stopCheckpoint) + 1
+		boundaries = boundaries[first:last + 1]
+
+	count = len(boundaries) - 1
+	chunkCount = max(1, min(chunkCount, count))
+
+	chunks = []
+	for i in range(chunkCount):
+		start = boundaries[(i * count) // chunkCount]
+		stop = boundaries[((i + 1) * count) // chunkCount]
+		chunks.append((start, None if stop is None else stop['offset']))
+	return chunks
+
+def MergeAgrRecordings(recordings,dropEmpty,dropUnaccepted):
+	"""Merges the recordings of consecutive chunks into one, see ReadAgrParallel."""
+	recording = AgrRecording(recordings[0].version)
+
+	parts = {}
+	for chunk in recordings:
+		for entity in chunk.entities:
+			parts.setdefault(entity.objNr, []).append(entity)
+
+	recording.entities = [EntityTrack.Merge(parts[objNr]) for objNr in sorted(parts)]
+	if dropUnaccepted:
+		recording.entities = [entity for entity in recording.entities if entity.accepted]
+	if dropEmpty:
+		recording.entities = [entity for entity in recording.entities if entity.HasSamples()]
+
+	afxCams = [chunk.afxCam for chunk in recordings if chunk.afxCam is not None]
+	recording.afxCam = CameraTrack.Merge(afxCams) if 0 < len(afxCams) else None
+
+	recording.endTime = recordings[-1].endTime
+	recording.fpsErrorCount = sum(chunk.fpsErrorCount for chunk in recordings)
+	for chunk in recordings:
+		if (chunk.fpsMaxError is not None) and ((recording.fpsMaxError is None) or abs(recording.fpsMaxError) < abs(chunk.fpsMaxError)):
+			recording.fpsMaxError = chunk.fpsMaxError
+	recording.boneBytes = sum(chunk.boneBytes for chunk in recordings)
+	recording.boneDecodeTime = sum(chunk.boneDecodeTime for chunk in recordings)
+
+	return recording
+
+# Run by the worker processes before anything else, so they can import this module without the
+# (bpy dependent) package __init__, when this module is part of the addon package:
+WORKER_INITIALIZER = """
+import sys, types
+if packageName and packageName not in sys.modules:
+	package = types.ModuleType(packageName)
+	package.__path__ = [directory]
+	sys.modules[packageName] = package
+"""
+
+def ReadAgrParallel(filepath,fps,globalScale,index,workers,progress = None,frameRange = None,entityFilter = None,readBones = True):
+	"""Same as ReadAgr, but decodes chunks of the file (split at the AgrIndex checkpoints) in workers processes
+	and merges them. The result is the same as with ReadAgr."""
+	chunks = GetAgrChunks(index, 4 * workers, fps, frameRange)
+
+	initArgs = { 'packageName': __name__.rpartition('.')[0], 'directory': os.path.dirname(os.path.abspath(__file__)) }
+
+	recordings = [None] * len(chunks)
+
+	with concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=exec, initargs=(WORKER_INITIALIZER, initArgs)) as executor:
+		futures = {}
+		for i, (startCheckpoint, stopOffset) in enumerate(chunks):
+			dictionary = None if startCheckpoint is None else index.dictionary[:startCheckpoint['dictionarySize']]
+			futures[executor.submit(ReadAgrChunk, filepath, fps, globalScale, entityFilter, readBones, frameRange, dictionary, startCheckpoint, stopOffset)] = i
+
+		for done, future in enumerate(concurrent.futures.as_completed(futures)):
+			recordings[futures[future]] = future.result()
+			if progress is not None:
+				progress(float(done + 1) / float(len(chunks)))
+
+	return MergeAgrRecordings(recordings, frameRange is not None, entityFilter is not None)
+
+def ReadAgr(filepath,fps,globalScale,progress = None,frameRange = None,index = None,entityFilter = None,readBones = True,onModel = None,memoryBudget = None,spillDirectory = None):
+	"""Parses the AGR file at filepath, see AgrParser."""
+	parser = AgrParser(fps, globalScale, entityFilter, onModel)
+	parser.readBones = readBones
+	parser.memoryBudget = memoryBudget
+	parser.spillDirectory = spillDirectory
+	with AgrFile(filepath) as agrFile:
+		return parser.Parse(agrFile, progress, frameRange, index)
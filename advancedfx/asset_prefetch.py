@@ -0,0 +1,156 @@
+import concurrent.futures
+import io
+import locale
+import os
+import re
+import threading
+import time
+
+# This module must not depend on bpy / mathutils, like agr_reader.
+
+QC_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+QC_ASSET_EXTENSIONS = ('.smd', '.vta', '.dmx', '.qc', '.qci')
+
+# Not read by the SMD importer without animations:
+QC_SKIPPED_DIRECTIVES = ('$sequence', '$animation')
+
+def TokenizeQcLine(line):
+	"""Returns the (unquoted) tokens of a QC line, without the // comment."""
+	tokens = []
+	for match in QC_TOKEN.finditer(line):
+		if match.group(1) is not None:
+			tokens.append(match.group(1))
+		elif match.group(2).startswith('//'):
+			break
+		else:
+			tokens.append(match.group(2))
+	return tokens
+
+def GetQcReferences(qcPath, text):
+	"""Returns (path, directive) of the model files referenced in the QC / QCI text, relative to the QC and $cd."""
+	directory = os.path.dirname(qcPath)
+	directive = None
+	references = []
+
+	for line in text.splitlines():
+		tokens = TokenizeQcLine(line)
+		if 0 == len(tokens):
+			continue
+
+		if tokens[0].startswith('$'):
+			directive = tokens[0].lower()
+			tokens = tokens[1:]
+			if '$cd' == directive and 0 < len(tokens):
+				directory = os.path.join(directory, tokens[0])
+				continue
+
+		if directive in QC_SKIPPED_DIRECTIVES:
+			continue
+
+		for token in tokens:
+			if token.lower().endswith(QC_ASSET_EXTENSIONS):
+				references.append((os.path.normpath(os.path.join(directory, token)), directive))
+
+	return references
+
+def GetIntervalsOverlap(intervals, begin, end):
+	"""Returns the length of the union of the (begin, end) intervals within [begin, end]."""
+	total = 0.0
+	last = begin
+	for intervalBegin, intervalEnd in sorted(intervals):
+		intervalBegin = max(intervalBegin, last)
+		intervalEnd = min(intervalEnd, end)
+		if intervalBegin < intervalEnd:
+			total += intervalEnd - intervalBegin
+			last = intervalEnd
+	return total
+
+class AssetPrefetcher:
+	"""Reads QC files and the files they reference (tokenizing QC / QCI files to find them) in worker threads,
+	so they are in memory when the SMD importer opens them (see Open). Only the reading is done ahead,
+	the SMD importer parses the files itself.
+
+	skipFile: Optional callable (path, directive) returning True for referenced files not to read."""
+
+	def __init__(self, workers, skipFile = None):
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="afx_prefetch")
+		self.skipFile = skipFile
+		self.lock = threading.Lock()
+		self.jobs = {}
+		self.files = {}
+		self.intervals = []
+		self.bytesRead = 0
+
+	@staticmethod
+	def GetKey(path):
+		return os.path.normcase(os.path.abspath(path))
+
+	def Request(self, qcPath):
+		"""Starts prefetching the QC file (once)."""
+		key = self.GetKey(qcPath)
+		if key not in self.jobs:
+			self.jobs[key] = self.executor.submit(self.Prefetch, qcPath)
+
+	def Prefetch(self, qcPath):
+		time_start = time.perf_counter()
+		pending = [(qcPath, None)]
+		done = set()
+
+		while 0 < len(pending):
+			path, directive = pending.pop()
+			key = self.GetKey(path)
+			if key in done:
+				continue
+			done.add(key)
+
+			if (directive is not None) and (self.skipFile is not None) and self.skipFile(path, directive):
+				continue
+
+			try:
+				with open(path, 'rb') as file:
+					data = file.read()
+			except OSError:
+				continue
+
+			if path.lower().endswith(('.qc', '.qci')):
+				pending.extend(GetQcReferences(path, data.decode('utf-8', errors='replace')))
+
+			with self.lock:
+				self.files[key] = data
+				self.bytesRead += len(data)
+
+		with self.lock:
+			self.intervals.append((time_start, time.perf_counter()))
+
+	def Wait(self, qcPath):
+		"""Waits till the QC file requested is prefetched."""
+		job = self.jobs.get(self.GetKey(qcPath), None)
+		if job is not None:
+			job.result()
+
+	def Open(self, file, mode = 'r', *args, **kwargs):
+		"""Like open, but returns prefetched files opened for reading text from memory (once)."""
+		if isinstance(file, str) and mode in ('r', 'rt') and 0 == len(args) and set(kwargs).issubset(('encoding', 'errors')):
+			with self.lock:
+				data = self.files.pop(self.GetKey(file), None)
+			if data is not None:
+				text = data.decode(kwargs.get('encoding', None) or locale.getpreferredencoding(False), kwargs.get('errors', None) or 'strict')
+				return io.StringIO(text, newline=None)
+		return open(file, mode, *args, **kwargs)
+
+	def GetOverlap(self, begin, end):
+		"""Returns the wall time prefetching was running within [begin, end] (perf_counter)."""
+		with self.lock:
+			return GetIntervalsOverlap(self.intervals, begin, end)
+
+	def GetTotalTime(self):
+		"""Returns the wall time prefetching was running."""
+		with self.lock:
+			if 0 == len(self.intervals):
+				return 0.0
+			return GetIntervalsOverlap(self.intervals, min(interval[0] for interval in self.intervals), max(interval[1] for interval in self.intervals))
+
+	def Shutdown(self):
+		self.executor.shutdown(wait=False, cancel_futures=True)
+		with self.lock:
+			self.files = {}
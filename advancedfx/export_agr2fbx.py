@@ -2,6 +2,127 @@
 # https://github.com/darkhandrob
 
 import bpy, bpy.props, bpy.ops, time
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Custom property identifying the objects to export in the snapshot opened by the worker processes:
+EXPORT_TAG = "afx_export_tag"
+
+MANIFEST_NAME = "agr2fbx_manifest.json"
+
+def ExportModel(model, filepath, root_name, global_scale, skip_meshes):
+	# select root
+	model.select_set(1)
+	# select childrens
+	for child in model.children:
+		child.select_set(1)
+	# rename top to root
+	name = model.name
+	model.name = root_name
+	try:
+		# export single objects as fbx
+		bpy.ops.export_scene.fbx(
+			filepath = filepath,
+			object_types={'ARMATURE'} if skip_meshes else {'ARMATURE', 'MESH'},
+			use_selection = True,
+			global_scale = global_scale,
+			bake_anim_use_nla_strips = False,
+			bake_anim_use_all_actions = False,
+			bake_anim_simplify_factor = 0,
+			add_leaf_bones=False)
+	finally:
+		# undo all changes
+		model.name = name
+		model.select_set(0)
+		for child in model.children:
+			child.select_set(0)
+
+def ExportCamera(camera, filepath, global_scale):
+	# select camera
+	camera.select_set(1)
+	# scale camera (like transform.resize on the single selected camera, which needs no 3D view this way)
+	scale = camera.scale.copy()
+	camera.scale = scale * 0.01
+	try:
+		# export single cameras as fbx
+		bpy.ops.export_scene.fbx(
+			filepath = filepath,
+			object_types={'CAMERA'},
+			use_selection = True,
+			global_scale = global_scale,
+			bake_anim_use_nla_strips = False,
+			bake_anim_use_all_actions = False,
+			bake_anim_simplify_factor = 0)
+	finally:
+		# undo all changes
+		camera.scale = scale
+		camera.select_set(0)
+
+def ExportJobs(jobs, objects, settings, onResult):
+	"""Exports the jobs (dicts with index, tag, type MODEL / CAMERA, name and file), getting their objects by tag from objects,
+	calls onResult with each job extended by ok, error and time."""
+	for job in jobs:
+		time_start = time.time()
+		result = dict(job)
+		try:
+			obj = objects[job['tag']]
+			if 'MODEL' == job['type']:
+				ExportModel(obj, job['file'], settings['root_name'], settings['global_scale'], settings['skip_meshes'])
+			else:
+				ExportCamera(obj, job['file'], settings['global_scale'])
+			result['ok'] = True
+			result['error'] = None
+		except Exception as e:
+			result['ok'] = False
+			result['error'] = "%s: %s" % (type(e).__name__, e)
+		result['time'] = time.time() - time_start
+		onResult(result)
+
+def RunWorker(jobsPath, resultsPath):
+	"""Run in the worker processes (on the snapshot): Exports the jobs from the jobsPath JSON file, appending the results to resultsPath as JSON lines."""
+	# bpy.ops.export_scene.fbx always exists as attribute, ask whether the exporter is actually enabled
+	# (with --factory-startup it is only if it is enabled by default):
+	import addon_utils
+	loaded_default, loaded_state = addon_utils.check("io_scene_fbx")
+	if not loaded_state:
+		addon_utils.enable("io_scene_fbx", default_set=True)
+
+	with open(jobsPath, "r", encoding="utf8") as file:
+		data = json.load(file)
+
+	for obj in bpy.context.view_layer.objects:
+		obj.select_set(0)
+
+	objects = {obj[EXPORT_TAG]: obj for obj in bpy.data.objects if EXPORT_TAG in obj}
+
+	with open(resultsPath, "a", encoding="utf8") as results:
+		def onResult(result):
+			results.write(json.dumps(result) + "\n")
+			results.flush()
+		ExportJobs(data['jobs'], objects, data['settings'], onResult)
+
+def ReadResults(resultsPath):
+	results = {}
+	if os.path.isfile(resultsPath):
+		with open(resultsPath, "r", encoding="utf8") as file:
+			for line in file:
+				try:
+					result = json.loads(line)
+				except ValueError:
+					continue
+				results[result['index']] = result
+	return results
+
+def GetLogTail(logPath, lines = 5):
+	try:
+		with open(logPath, "r", encoding="utf8", errors="replace") as file:
+			return " | ".join(line.strip() for line in file.readlines()[-lines:])
+	except OSError:
+		return ""
 
 class AgrExport(bpy.types.Operator):
 	"""Exports every models with its animation as a FBX"""
@@ -31,6 +152,13 @@ class AgrExport(bpy.types.Operator):
 		default=True,
 	)
 
+	exportProcesses: bpy.props.IntProperty(
+		name="Export processes",
+		description="1 exports in Blender's process, more save a snapshot of the file and export the models and cameras in that many background Blender processes in parallel (0 for one per CPU).",
+		default=1,
+		min=0,
+	)
+
 	def menu_draw_export(self, context):
 		layout = self.layout
 		layout.operator("advancedfx.agr_to_fbx", text="HLAE afxGameRecord")
@@ -39,74 +167,141 @@ class AgrExport(bpy.types.Operator):
 		context.window_manager.fileselect_add(self)
 		return {'RUNNING_MODAL'}
 
+	def getJobs(self, context):
+		jobs = []
+
+		for model in context.scene.objects:
+			if model.name.find("afx.") != -1:
+				jobs.append({'obj': model, 'type': 'MODEL', 'name': model.name})
+
+		for camera in bpy.data.objects:
+			if any(camera.name.startswith(c) for c in ("afxCam", "camera")):
+				jobs.append({'obj': camera, 'type': 'CAMERA', 'name': camera.name})
+
+		tags = {}
+		for i, job in enumerate(jobs):
+			job['index'] = i
+			job['tag'] = tags.setdefault(job['obj'].name, str(len(tags)))
+			job['file'] = self.filepath + "/" + job['name'] + ".fbx"
+
+		return jobs
+
+	def exportSerial(self, jobs, settings):
+		# export models and cameras
+		bpy.ops.object.select_all(action='DESELECT')
+
+		objects = {job['tag']: job['obj'] for job in jobs}
+		results = []
+		ExportJobs([{key: value for key, value in job.items() if 'obj' != key} for job in jobs], objects, settings, results.append)
+		return results
+
+	def exportParallel(self, jobs, settings, workers):
+		directory = tempfile.mkdtemp(prefix="afx_agr2fbx_")
+		snapshot = os.path.join(directory, "snapshot.blend")
+		processes = []
+		try:
+			# Tag the objects, so the workers find them without scanning names:
+			for job in jobs:
+				job['obj'][EXPORT_TAG] = job['tag']
+			try:
+				bpy.ops.wm.save_as_mainfile(filepath=snapshot, copy=True)
+			finally:
+				for job in jobs:
+					job['obj'].pop(EXPORT_TAG, None)
+
+			jobs = [{key: value for key, value in job.items() if 'obj' != key} for job in jobs]
+
+			for i in range(workers):
+				jobsPath = os.path.join(directory, "jobs_%i.json" % i)
+				resultsPath = os.path.join(directory, "results_%i.jsonl" % i)
+				logPath = os.path.join(directory, "worker_%i.log" % i)
+				workerJobs = jobs[i::workers]
+				with open(jobsPath, "w", encoding="utf8") as file:
+					json.dump({'settings': settings, 'jobs': workerJobs}, file)
+				log = open(logPath, "w", encoding="utf8")
+				try:
+					process = subprocess.Popen([bpy.app.binary_path, "-b", "--factory-startup", snapshot, "--python-exit-code", "1", "--python", os.path.abspath(__file__), "--", jobsPath, resultsPath], stdout=log, stderr=subprocess.STDOUT)
+				except OSError:
+					log.close()
+					raise
+				processes.append((process, log, workerJobs, resultsPath, logPath))
+
+			print("FBX-Export with %i processes." % workers)
+
+			results = []
+			for process, log, workerJobs, resultsPath, logPath in processes:
+				returncode = process.wait()
+				log.close()
+				workerResults = ReadResults(resultsPath)
+				for job in workerJobs:
+					result = workerResults.get(job['index'], None)
+					if result is None:
+						result = dict(job)
+						result['ok'] = False
+						result['error'] = "Worker exited with code %i before exporting it: %s" % (returncode, GetLogTail(logPath))
+						result['time'] = None
+					results.append(result)
+
+			return results
+		finally:
+			# Stop workers that are still running (if we failed while waiting), they keep the snapshot open:
+			for process, log, workerJobs, resultsPath, logPath in processes:
+				if process.poll() is None:
+					process.kill()
+					process.wait()
+				log.close()
+			try:
+				if os.path.exists(snapshot):
+					os.remove(snapshot)
+			except OSError as e:
+				print("FBX-Export: Could not remove snapshot %s: %s" % (snapshot, e))
+			shutil.rmtree(directory, ignore_errors=True)
+
 	def execute(self, context):
 		time_start = time.time()
 		# Change Filepath, if something got insert in the File Name box
 		if not self.filepath.endswith("\\"):
 			self.filepath = self.filepath.rsplit(sep="\\", maxsplit=1)[0] + "\\"
 
-		# export model
-		bpy.ops.object.select_all(action='DESELECT')
-		for CurrentModel in bpy.data.objects:
-			if CurrentModel.name.find("afx.") != -1:
-				for o in context.scene.objects:
-					if o.name == CurrentModel.name:
-         				# select root
-						CurrentModel.select_set(1)
-						# select childrens
-						for CurrentChildren in CurrentModel.children:
-							CurrentChildren.select_set(1)
-						# rename top to root
-						CurrentObjectName = CurrentModel.name
-						CurrentModel.name = self.root_name
-						# export single objects as fbx
-						fullfiles = self.filepath + "/" + CurrentObjectName + ".fbx"
-						if self.skip_meshes:
-							bpy.ops.export_scene.fbx(
-								filepath = fullfiles, 
-								object_types={'ARMATURE'}, 
-								use_selection = True, 
-								global_scale =  self.global_scale, 
-								bake_anim_use_nla_strips = False, 
-								bake_anim_use_all_actions = False, 
-								bake_anim_simplify_factor = 0,
-								add_leaf_bones=False)
-						else:
-							bpy.ops.export_scene.fbx(
-								filepath = fullfiles,
-								object_types={'ARMATURE', 'MESH'},
-								use_selection = True,
-								global_scale =  self.global_scale, 
-								bake_anim_use_nla_strips = False, 
-								bake_anim_use_all_actions = False, 
-								bake_anim_simplify_factor = 0,
-								add_leaf_bones=False)
-						# undo all changes
-						CurrentModel.name = CurrentObjectName
-						CurrentModel.select_set(0)
-						for CurrentChildren in CurrentModel.children:
-							CurrentChildren.select_set(0)
-
-		# export camera
-		for CameraData in bpy.data.objects:
-			if any(CameraData.name.startswith(c) for c in ("afxCam", "camera")):
-				# select camera
-				CameraData.select_set(1)
-				# scale camera
-				bpy.ops.transform.resize(value=(0.01, 0.01, 0.01))
-				# export single cameras as fbx
-				fullfiles = self.filepath + "/" + CameraData.name + ".fbx"
-				bpy.ops.export_scene.fbx(
-					filepath = fullfiles, 
-					object_types={'CAMERA'}, 
-					use_selection = True, 
-					global_scale =  self.global_scale, 
-					bake_anim_use_nla_strips = False, 
-					bake_anim_use_all_actions = False, 
-					bake_anim_simplify_factor = 0)
-				# undo all changes
-				bpy.ops.transform.resize(value=(100, 100, 100))
-				CameraData.select_set(0)
+		settings = {
+			'global_scale': self.global_scale,
+			'root_name': self.root_name,
+			'skip_meshes': self.skip_meshes,
+		}
+
+		jobs = self.getJobs(context)
+
+		workers = self.exportProcesses if 0 < self.exportProcesses else (os.cpu_count() or 1)
+		workers = min(workers, len(jobs))
+
+		if 1 < workers:
+			results = self.exportParallel(jobs, settings, workers)
+		else:
+			workers = 1
+			results = self.exportSerial(jobs, settings)
+
+		results.sort(key=lambda result: result['index'])
+		failed = [result for result in results if not result['ok']]
+
+		with open(self.filepath + "/" + MANIFEST_NAME, "w", encoding="utf8") as file:
+			json.dump({
+				'blendFile': bpy.data.filepath,
+				'processes': workers,
+				'time': time.time() - time_start,
+				'exported': len(results) - len(failed),
+				'failed': len(failed),
+				'exports': [{key: result[key] for key in ('name', 'type', 'file', 'ok', 'error', 'time')} for result in results],
+			}, file, indent=1)
+
+		for result in failed:
+			print("FBX-Export failed for %s: %s" % (result['name'], result['error']))
+
+		if 0 < len(failed):
+			self.report({'WARNING'}, "%i of %i FBX exports failed, see %s." % (len(failed), len(results), MANIFEST_NAME))
 
 		print("FBX-Export script finished in %.4f sec." % (time.time() - time_start))
 		return {'FINISHED'}
+
+if __name__ == "__main__":
+	# Worker process, see AgrExport.exportParallel:
+	RunWorker(*sys.argv[sys.argv.index("--") + 1:])
@@ -9,6 +9,7 @@ import mathutils
 from io_scene_valvesource import utils as vs_utils
 
 from .utils import QAngle
+from . import utils as afx_utils
 
 # <summary> Formats a float value to be suitable for bvh output </summary>
 def FloatToBvhString(value):
@@ -29,6 +30,35 @@ def WriteHeader(file, frames, frameTime):
 	file.write("Frames: "+str(frames)+"\n")
 	file.write("Frame Time: "+FloatToBvhString(frameTime)+"\n")
 
+BVH_LINE = "{0:f} {1:f} {2:f} {3:f} {4:f} {5:f}\n"
+
+def GetBvhLines(matrices, globalScale, isCamera):
+	"""Returns the MOTION lines for the object's world matrices."""
+	lines = []
+	lastRot = None
+
+	mRot = mathutils.Matrix.Rotation(math.radians(-90.0 if isCamera else 0.0), 4, 'X')
+
+	for mat in matrices:
+		mat = mat @ mRot
+
+		loc = mat.to_translation()
+
+		rot = mat.to_euler('YXZ') if lastRot is None else mat.to_euler('YXZ', lastRot)
+		lastRot = rot
+
+		X = -(-loc[0]) * globalScale
+		Y =  loc[2] * globalScale
+		Z = -loc[1] * globalScale
+
+		XR = -math.degrees(-rot[0])
+		YR =  math.degrees( rot[2])
+		ZR = -math.degrees( rot[1])
+
+		lines.append(BVH_LINE.format(X, Y, Z, ZR, XR, YR))
+
+	return lines
+
 class BvhExporter(bpy.types.Operator, vs_utils.Logger):
 	bl_idname = "advancedfx.bvhexporter"
 	bl_label = "HLAE old Cam IO (.bvh)"
@@ -79,7 +109,6 @@ class BvhExporter(bpy.types.Operator, vs_utils.Logger):
 
 	def writeBvh(self, context):
 		scene = context.scene
-		frame_current = scene.frame_current
 		fps = context.scene.render.fps
 
 		obj = context.active_object
@@ -88,11 +117,6 @@ class BvhExporter(bpy.types.Operator, vs_utils.Logger):
 			self.error("No object selected.")
 			return False
 
-		lastRot = None
-
-		mRot = mathutils.Matrix.Rotation(math.radians(-90.0 if "CAMERA" == obj.type else 0.0), 4, 'X')
-		mTrans = mathutils.Matrix.Scale(-1,4,(-1.0, 0.0, 0.0))
-
 		file = None
 
 		try:
@@ -106,34 +130,12 @@ class BvhExporter(bpy.types.Operator, vs_utils.Logger):
 
 			WriteHeader(file, frameCount, frameTime)
 
-			for frame in range(self.frame_start, self.frame_end + 1):
-				scene.frame_set(frame)
-
-				mat = obj.matrix_world
-				mat = mat @ mRot
-
-				loc = mat.to_translation()
-
-				rot = mat.to_euler('YXZ') if lastRot is None else mat.to_euler('YXZ', lastRot)
-				lastRot = rot
+			matrices = afx_utils.SampleObjects(scene, [obj], range(self.frame_start, self.frame_end + 1), "BVH")[0][0]
 
-
-
-				X = -(-loc[0]) * self.global_scale
-				Y =  loc[2] * self.global_scale
-				Z = -loc[1] * self.global_scale
-
-				XR = -math.degrees(-rot[0])
-				YR =  math.degrees( rot[2])
-				ZR = -math.degrees( rot[1])
-
-				S = "" +FloatToBvhString(X) +" " +FloatToBvhString(Y) +" " +FloatToBvhString(Z) +" " +FloatToBvhString(ZR) +" " +FloatToBvhString(XR) +" " +FloatToBvhString(YR) + "\n"
-				file.write(S)
+			file.writelines(GetBvhLines(matrices, self.global_scale, "CAMERA" == obj.type))
 
 		finally:
 			if file is not None:
 				file.close()
 
-		scene.frame_set(frame_current)
-
 		return True
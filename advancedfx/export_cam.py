@@ -8,6 +8,8 @@ import mathutils
 
 from io_scene_valvesource import utils as vs_utils
 
+from advancedfx import utils as afx_utils
+
 # <summary> Formats a float value to be suitable for bvh output </summary>
 def FloatToBvhString(value):
 	return "{0:f}".format(value)
@@ -18,6 +20,30 @@ def WriteHeader(file, frames, frameTime):
 	file.write("channels time xPosition yPosition zPositon xRotation yRotation zRotation fov\n")
 	file.write("DATA\n")
 
+CAM_LINE = "{0:f} {1:f} {2:f} {3:f} {4:f} {5:f} {6:f} {7:f}\n"
+
+UN_ROT = mathutils.Matrix.Rotation(math.radians(-90.0), 4, 'X')
+
+def GetCamLines(frames, frameTime, matrices, fovs, globalScale):
+	"""Returns the DATA lines for the camera's world matrices and field of views (degrees) at the frames."""
+	lines = []
+	lastRot = None
+
+	for frame, mat, fov in zip(frames, matrices, fovs):
+		mat = mat @ UN_ROT
+
+		loc = mat.to_translation()
+		rot = mat.to_euler('YXZ') if lastRot is None else mat.to_euler('YXZ', lastRot)
+		lastRot = rot
+
+		loc = globalScale * mathutils.Vector((loc[1],-loc[0],loc[2]))
+
+		qAngleVec = mathutils.Vector((math.degrees(rot[1]),-math.degrees(rot[0]),math.degrees(rot[2])))
+
+		lines.append(CAM_LINE.format((frame-1) * frameTime, loc[0], loc[1], loc[2], qAngleVec[0], qAngleVec[1], qAngleVec[2], fov))
+
+	return lines
+
 
 class CamExporter(bpy.types.Operator, vs_utils.Logger):
 	bl_idname = "advancedfx.camexporter"
@@ -48,6 +74,30 @@ class CamExporter(bpy.types.Operator, vs_utils.Logger):
 		default=0,
 	)
 
+	keyFrameTimes: bpy.props.BoolProperty(
+		name="Key frame times only",
+		description="Write rows only at the (fractional) times of the camera's key frames and the start and end frame, instead of every frame.",
+		default=False)
+
+	sampleBezier: bpy.props.BoolProperty(
+		name="Sample Bezier curves",
+		description="With key frame times only: Add rows within Bezier interpolated segments, as long as straight lines between the rows leave the given tolerances.",
+		default=True)
+
+	sampleTolerance: bpy.props.FloatProperty(
+		name="Sample tolerance",
+		description="Maximum error for locations in Blender units and for the lens in mm.",
+		default=0.001,
+		min=0.0,
+		precision=4)
+
+	sampleAngleTolerance: bpy.props.FloatProperty(
+		name="Sample angle tolerance",
+		description="Maximum error for rotations in degrees.",
+		default=0.1,
+		min=0.0,
+		precision=3)
+
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
 		vs_utils.Logger.__init__(self)
@@ -69,7 +119,6 @@ class CamExporter(bpy.types.Operator, vs_utils.Logger):
 
 	def writeBvh(self, context):
 		scene = context.scene
-		frame_current = scene.frame_current
 		fps = context.scene.render.fps
 
 		obj = context.active_object
@@ -78,12 +127,6 @@ class CamExporter(bpy.types.Operator, vs_utils.Logger):
 			self.error("No camera selected.")
 			return False
 
-		cam = obj.data
-
-		lastRot = None
-
-		unRot = mathutils.Matrix.Rotation(math.radians(-90.0), 4, 'X')
-
 		file = None
 
 		try:
@@ -97,30 +140,21 @@ class CamExporter(bpy.types.Operator, vs_utils.Logger):
 
 			WriteHeader(file, frameCount, frameTime)
 
-			for frame in range(self.frame_start, self.frame_end + 1):
-				scene.frame_set(frame)
-
-				mat = obj.matrix_world
-				mat = mat @ unRot
+			frames = range(self.frame_start, self.frame_end + 1)
+			if self.keyFrameTimes:
+				error = afx_utils.GetSampleError(scene, obj)
+				if error is None:
+					frames = afx_utils.GetKeyFrames(obj, self.frame_start, self.frame_end, self.sampleBezier, self.sampleTolerance, self.sampleAngleTolerance)
+					print("CAM Writing %i rows for %i frames." % (len(frames), frameCount))
+				else:
+					print("CAM Writing every frame: %s." % error)
 
-				loc = mat.to_translation()
-				rot = mat.to_euler('YXZ') if lastRot is None else mat.to_euler('YXZ', lastRot)
-				lastRot = rot
+			matrices, fovs = afx_utils.SampleObjects(scene, [obj], frames, "CAM")[0]
 
-				loc = self.global_scale * mathutils.Vector((loc[1],-loc[0],loc[2]))
-
-				qAngleVec = mathutils.Vector((math.degrees(rot[1]),-math.degrees(rot[0]),math.degrees(rot[2])))
-
-				# lens = camData.c.sensor_width / (2.0 * math.tan(math.radians(fov) / 2.0))
-				fov = math.degrees(2.0 * math.atan((cam.sensor_width / cam.lens) / 2.0))
-
-				S = ""+FloatToBvhString((frame-1) * frameTime) +" " +FloatToBvhString(loc[0]) +" " +FloatToBvhString(loc[1]) +" " +FloatToBvhString(loc[2]) +" " +FloatToBvhString(qAngleVec[0]) +" " +FloatToBvhString(qAngleVec[1]) +" " +FloatToBvhString(qAngleVec[2]) +" " +FloatToBvhString(fov) + "\n"
-				file.write(S)
+			file.writelines(GetCamLines(frames, frameTime, matrices, fovs, self.global_scale))
 
 		finally:
 			if file is not None:
 				file.close()
 
-		scene.frame_set(frame_current)
-
 		return True
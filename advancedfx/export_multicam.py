@@ -0,0 +1,141 @@
+import os
+
+import bpy, bpy.props, bpy.ops
+
+from io_scene_valvesource import utils as vs_utils
+
+from advancedfx import utils as afx_utils
+from advancedfx import export_cam, export_bvh
+
+class MultiCamExporter(bpy.types.Operator, vs_utils.Logger):
+	"""Exports several cameras to .cam and / or .bvh files, sampling the frame range once"""
+	bl_idname = "advancedfx.multicamexporter"
+	bl_label = "HLAE Cameras (.cam / .bvh)"
+	bl_options = {'UNDO'}
+
+	# Properties used by the file browser
+	directory: bpy.props.StringProperty(subtype="DIR_PATH")
+	filter_folder: bpy.props.BoolProperty(default=True, options={'HIDDEN'})
+
+	# Custom properties
+	cameras: bpy.props.EnumProperty(
+		name="Cameras",
+		description="Cameras to export, one file per camera and format named after the camera",
+		items=[
+			('SELECTED', "Selected", "Selected cameras"),
+			('SCENE', "Scene", "All cameras in the scene"),
+		],
+		default='SELECTED',
+	)
+
+	exportCam: bpy.props.BoolProperty(
+		name="Export .cam",
+		description="Write HLAE Camera IO (.cam) files",
+		default=True,
+	)
+
+	exportBvh: bpy.props.BoolProperty(
+		name="Export .bvh",
+		description="Write HLAE old Cam IO (.bvh) files",
+		default=False,
+	)
+
+	global_scale: bpy.props.FloatProperty(
+		name="Scale",
+		description="Scale everything by this value",
+		min=0.000001, max=1000000.0,
+		soft_min=1.0, soft_max=1000.0,
+		default=100.0,
+	)
+
+	frame_start: bpy.props.IntProperty(
+		name="Start Frame",
+		description="Starting frame to export",
+		default=0,
+	)
+	frame_end: bpy.props.IntProperty(
+		name="End Frame",
+		description="End frame to export",
+		default=0,
+	)
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		vs_utils.Logger.__init__(self)
+
+	def execute(self, context):
+		ok = self.writeCameras(context)
+
+		self.errorReport("Error report")
+
+		return {'FINISHED'}
+
+	def invoke(self, context, event):
+		self.frame_start = context.scene.frame_start
+		self.frame_end = context.scene.frame_end
+
+		bpy.context.window_manager.fileselect_add(self)
+
+		return {'RUNNING_MODAL'}
+
+	def getCameras(self, context):
+		objects = context.selected_objects if 'SELECTED' == self.cameras else context.scene.objects
+		return [obj for obj in objects if 'CAMERA' == obj.type]
+
+	def writeCameras(self, context):
+		scene = context.scene
+		fps = context.scene.render.fps
+
+		formats = []
+		if self.exportCam: formats.append(".cam")
+		if self.exportBvh: formats.append(".bvh")
+
+		if 0 == len(formats):
+			self.error("No format selected.")
+			return False
+
+		cameras = []
+		names = set()
+		for obj in self.getCameras(context):
+			name = bpy.path.clean_name(obj.name)
+			if name in names:
+				self.error("Skipping camera "+obj.name+", its file name "+name+" is already used.")
+				continue
+			names.add(name)
+			cameras.append((obj, name))
+
+		if 0 == len(cameras):
+			self.error("No camera selected." if 'SELECTED' == self.cameras else "No camera in scene.")
+			return False
+
+		frameCount = self.frame_end -self.frame_start +1
+		if frameCount < 0: frameCount = 0
+
+		frameTime = 1.0
+		if 0.0 != fps: frameTime = frameTime / fps
+
+		# Resolve Blender relative paths (//):
+		directory = bpy.path.abspath(self.directory)
+
+		frames = range(self.frame_start, self.frame_end + 1)
+		samples = afx_utils.SampleObjects(scene, [obj for obj, name in cameras], frames, "CAMS")
+
+		for (obj, name), (matrices, fovs) in zip(cameras, samples):
+			for extension in formats:
+				filepath = os.path.join(directory, name + extension)
+
+				if ".cam" == extension:
+					lines = export_cam.GetCamLines(frames, frameTime, matrices, fovs, self.global_scale)
+				else:
+					lines = export_bvh.GetBvhLines(matrices, self.global_scale, True)
+
+				with open(filepath, "w", encoding="utf8", newline="\n") as file:
+					if ".cam" == extension:
+						export_cam.WriteHeader(file, frameCount, frameTime)
+					else:
+						export_bvh.WriteHeader(file, frameCount, frameTime)
+					file.writelines(lines)
+
+				print("CAMS Wrote "+filepath+".")
+
+		return True
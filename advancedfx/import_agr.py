@@ -1,24 +1,40 @@
-import gc
+import concurrent.futures
 import math
 import os
-import struct
 import copy
-from collections import defaultdict
+import json
+import hashlib
+import inspect
+import pickle
+import tempfile
 
 import traceback
 
 import bpy, bpy.props, bpy.ops, time
 import mathutils
+import numpy
 
 from os.path import splitext, basename
 
 from io_scene_valvesource import import_smd as vs_import_smd, utils as vs_utils
 
 from advancedfx import utils as afx_utils
+from advancedfx import agr_reader
+from advancedfx import agr_cache
+from advancedfx import asset_prefetch
+
+def IsSkippedSmd(filepath, smd_type = None):
+	"""Whether the file is skipped with bSkip (physics, LOD and skeleton meshes)."""
+	s = splitext(basename(filepath))[0].rstrip("123456789")
+	return smd_type == vs_utils.PHYS or s.endswith("_lod") or any(filepath.endswith(u) for u in ("skeleto.smd", "skel.smd"))
+
+def IsSkippedPrefetch(filepath, directive):
+	return IsSkippedSmd(filepath, vs_utils.PHYS if directive in ("$collisionmodel", "$collisionjoints") else None)
 
 class GAgrImporter:
 	onlyBones = False
 	smd = None
+	smdErrors = 0
 
 class SmdImporterEx(vs_import_smd.SmdImporter):
 	bl_idname = "advancedfx.smd_importer_ex"
@@ -52,6 +68,7 @@ class SmdImporterEx(vs_import_smd.SmdImporter):
 		self.num_files_imported = 0
 		self.readQC(self.filepath, False, False, False, 'XYZ', outer_qc = True)
 		GAgrImporter.smd = self.smd
+		GAgrImporter.smdErrors = len(getattr(self, 'log_errors', ()))
 		return {'FINISHED'}
 
 	def readPolys(self):
@@ -65,419 +82,232 @@ class SmdImporterEx(vs_import_smd.SmdImporter):
 		super(SmdImporterEx, self).readShapes()
 
 	def readSMD(self, filepath, upAxis, rotMode, newscene = False, smd_type = None, target_layer = 0):
-		s = splitext(basename(filepath))[0].rstrip("123456789")
-		if SmdImporterEx.bSkip and (smd_type == vs_utils.PHYS or s.endswith("_lod") or any(filepath.endswith(u) for u in ("skeleto.smd", "skel.smd"))):
+		if SmdImporterEx.bSkip and IsSkippedSmd(filepath, smd_type):
 			return 0
 		else:
 			return super().readSMD(filepath, upAxis, rotMode, newscene, smd_type, target_layer) # call parent method
 
-def ReadString(file):
-	buf = bytearray()
-	while True:
-		b = file.read(1)
-		if len(b) < 1:
-			return None
-		elif b == b"\0":
-			return buf.decode("utf-8")
-		else:
-			buf.append(b[0])
-
-def ReadBool(file):
-	buf = file.read(1)
-	if(len(buf) < 1):
-		return None
-	return struct.unpack('<?', buf)[0]
-
-def ReadInt(file):
-	buf = file.read(4)
-	if(len(buf) < 4):
-		return None
-	return struct.unpack('<i', buf)[0]
-
-def ReadFloat(file):
-	buf = file.read(4)
-	if(len(buf) < 4):
-		return None
-	return struct.unpack('<f', buf)[0]
-
-def ReadDouble(file):
-	buf = file.read(8)
-	if(len(buf) < 8):
-		return None
-	return struct.unpack('<d', buf)[0]
-
-def ReadVector(file, quakeFormat = False):
-	x = ReadFloat(file)
-	if x is None:
-		return None
-	y = ReadFloat(file)
-	if y is None:
-		return None
-	z = ReadFloat(file)
-	if z is None:
-		return None
-
-	if math.isinf(x) or math.isinf(y) or math.isinf(z):
-		x = 0
-		y = 0
-		z = 0
-
-	return mathutils.Vector((-y,x,z)) if quakeFormat else mathutils.Vector((x,y,z))
-
-def ReadQAngle(file):
-	x = ReadFloat(file)
-	if x is None:
-		return None
-	y = ReadFloat(file)
-	if y is None:
-		return None
-	z = ReadFloat(file)
-	if z is None:
-		return None
-
-	if math.isinf(x) or math.isinf(y) or math.isinf(z):
-		x = 0
-		y = 0
-		z = 0
-
-	return afx_utils.QAngle(x,y,z)
-
-def ReadQuaternion(file, quakeFormat = False):
-	x = ReadFloat(file)
-	if x is None:
-		return None
-	y = ReadFloat(file)
-	if y is None:
-		return None
-	z = ReadFloat(file)
-	if z is None:
-		return None
-	w = ReadFloat(file)
-	if w is None:
-		return None
-
-	if math.isinf(x) or math.isinf(y) or math.isinf(z) or math.isinf(w):
-		w = 1
-		x = 0
-		y = 0
-		z = 0
-
-	return mathutils.Quaternion((w,-y,x,z)) if quakeFormat else mathutils.Quaternion((w,x,y,z))
-
-def ReadMatrix3x4(file):
-	mat = mathutils.Matrix()
-	for i in range(3):
-		for j in range(4):
-			val = ReadFloat(file)
-			if val is None:
-				return None
-			if math.isinf(val):
-				val = 0
-			mat[i][j] = val
+class SmdLoader(vs_utils.Logger):
+	"""Does what SmdImporterEx does as plain in-process object: Load returns the smd directly, without operator
+	dispatch, without (re-)registering classes and without undo bookkeeping per model.
 
-	return mat
+	Operator subclasses can't be instantiated outside of bpy.ops, so SmdImporter's functions are borrowed (see below)."""
 
-def ReadAgrVersion(file):
-	buf = file.read(14)
-	if len(buf) < 14:
-		return None
+	def __init__(self, onlyBones, bSkip):
+		vs_utils.Logger.__init__(self)
+		self.onlyBones = onlyBones
+		self.bSkip = bSkip
+
+		# SmdImporter's properties, as SmdImporterEx is called:
+		self.filepath = ""
+		self.files = []
+		self.directory = ""
+		self.doAnim = False
+		self.createCollections = False
+		self.makeCamera = False
+		self.append = 'APPEND'
+		self.upAxis = 'Z'
+		self.rotMode = 'XYZ'
+		self.boneMode = 'SPHERE'
+
+		self.qc = None
+		self.smd = None
+		self.loadErrors = 0
+
+	@property
+	def properties(self):
+		return self
+
+	def report(self, type, message):
+		print(message)
+
+	def Load(self, filepath):
+		"""Imports the QC file and returns its smd."""
+		self.filepath = filepath
+		self.existingBones = []
+		self.num_files_imported = 0
+		self.qc = None
+		self.smd = None
+		errors = len(getattr(self, 'log_errors', ()))
+		self.readQC(filepath, False, False, False, 'XYZ', outer_qc = True)
+		self.loadErrors = len(getattr(self, 'log_errors', ())) - errors
+		return self.smd
 
-	cmp = b"afxGameRecord\0"
+	def readPolys(self):
+		if self.onlyBones:
+			return
+		vs_import_smd.SmdImporter.readPolys(self)
 
-	if buf != cmp:
-		return None
+	def readShapes(self):
+		if self.onlyBones:
+			return
+		vs_import_smd.SmdImporter.readShapes(self)
 
-	return ReadInt(file)
+	def readSMD(self, filepath, upAxis, rotMode, newscene = False, smd_type = None, target_layer = 0):
+		if self.bSkip and IsSkippedSmd(filepath, smd_type):
+			return 0
+		return vs_import_smd.SmdImporter.readSMD(self, filepath, upAxis, rotMode, newscene, smd_type, target_layer)
 
-class AgrDictionary:
-	def __init__(self):
-		self.dictionary = {}
-		self.peeked = None
+for name, member in vars(vs_import_smd.SmdImporter).items():
+	if inspect.isfunction(member) and not hasattr(SmdLoader, name):
+		setattr(SmdLoader, name, member)
 
-	def Read(self,file):
-		if self.peeked is not None:
-			oldPeeked = self.peeked
-			self.peeked = None
-			return oldPeeked
+class ModelData:
+	__slots__ = ('smd', 'curves', 'boneRestInverses', 'boneIsRoot')
 
-		idx = ReadInt(file)
+	def __init__(self,smd):
+		self.smd = smd
+		self.curves = []
+
+class CameraData:
+	__slots__ = ('o', 'c', 'curves')
+
+	def __init__(self,o,c):
+		self.o = o
+		self.c = c
+		self.curves = []
 
-		if idx is None:
+# Increase when the stored models change, so old library files are not used anymore:
+MODEL_LIBRARY_VERSION = 2
+
+class LibrarySmd:
+	"""Stands in for the SmdImporter's smd of a model appended from the ModelLibrary (only a and boneIDs are used)."""
+
+	def __init__(self,a,boneIDs):
+		self.a = a
+		self.boneIDs = boneIDs
+
+class ModelLibrary:
+	"""Directory of imported models (armature and its children) as .blend files, keyed by QC path, QC modification
+	time and the import options, so their QC / SMD files don't need to be parsed again in later imports."""
+
+	# Bone IDs and bone names of the freshly imported model:
+	boneIDsProperty = "afx_bone_ids"
+
+	def __init__(self,directory,options):
+		self.directory = directory
+		self.options = options
+		self.hits = 0
+		self.misses = 0
+		self.stored = 0
+		self.loadTime = 0.0
+		self.storeTime = 0.0
+
+	@staticmethod
+	def GetDefaultDirectory():
+		return os.path.join(tempfile.gettempdir(), "advancedfx_model_library")
+
+	def GetPath(self,qcPath):
+		key = json.dumps({
+			'version': MODEL_LIBRARY_VERSION,
+			'qcPath': os.path.normcase(os.path.abspath(qcPath)),
+			'qcMTime': os.stat(qcPath).st_mtime_ns,
+			'options': self.options,
+		}, sort_keys=True)
+		return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".blend")
+
+	def Contains(self,qcPath):
+		try:
+			return os.path.isfile(self.GetPath(qcPath))
+		except OSError:
+			return False
+
+	def Load(self,context,qcPath):
+		"""Appends the model to the scene and returns its LibrarySmd or None if it's not in the library."""
+		try:
+			path = self.GetPath(qcPath)
+		except OSError:
 			return None
 
-		if -1 == idx:
-			str = ReadString(file)
-			if str is None:
-				return None
-			self.dictionary[len(self.dictionary)] = str
-			return str
+		if not os.path.isfile(path):
+			self.misses += 1
+			return None
 
-		return self.dictionary[idx]
+		time_load = time.time()
 
-	def Peekaboo(self,file,what):
-		if self.peeked is None:
-			self.peeked = self.Read(file)
+		try:
+			with bpy.data.libraries.load(path, link=False) as (dataFrom, dataTo):
+				dataTo.objects = dataFrom.objects
+		except (OSError, RuntimeError):
+			self.misses += 1
+			return None
 
-		if(what == self.peeked):
-			self.peeked = None
-			return True
+		objects = [obj for obj in dataTo.objects if obj is not None]
+		armature = next((obj for obj in objects if 'ARMATURE' == obj.type and obj.parent is None), None)
 
-		return False
+		stored = None
+		if armature is not None and self.boneIDsProperty in armature:
+			try:
+				stored = json.loads(armature[self.boneIDsProperty])
+			except ValueError:
+				pass
+
+		# Must give the same armature and bones as the import it was stored from:
+		if stored is None or set(bone.name for bone in armature.data.bones) != set(stored['bones']) or not set(stored['boneIDs']).issubset(stored['bones']):
+			print("AGR Model library entry for \""+qcPath+"\" doesn't match its import, removing it.")
+			for obj in objects:
+				bpy.data.objects.remove(obj)
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+			self.misses += 1
+			return None
 
-class ModelData:
-	def __init__(self,smd):
-		self.smd = smd
-		self.curves = []
+		for obj in objects:
+			obj.use_fake_user = False
+			context.scene.collection.objects.link(obj)
 
-class ModelHandle:
-	def __init__(self,objNr,modelName):
-		self.objNr = objNr
-		self.modelName = modelName
-		self.modelData = False
-		self.lastRenderOrigin = None
-		self.lastRenderRotQuat = None
-		self.boneLastRenderRotQuats = {}
-		self.camData = None
-
-		self.lastTime = None
-		self.visible = None
-		self.location = None
-		self.rotation = None
-		self.scale = None
-		self.bones = None
-
-		# We are lazy, so we use frame 0 to set as not visible (initially) / hide_render 1:
-		self.visibilityFrames = [0, 1]
-		self.locationXFrames = []
-		self.locationYFrames = []
-		self.locationZFrames = []
-		self.rotationWFrames = []
-		self.rotationXFrames = []
-		self.rotationYFrames = []
-		self.rotationZFrames = []
-		self.scaleXFrames = []
-		self.scaleYFrames = []
-		self.scaleZFrames = []
-		self.boneLocationXFrames = defaultdict(list)
-		self.boneLocationYFrames = defaultdict(list)
-		self.boneLocationZFrames = defaultdict(list)
-		self.boneRotationWFrames = defaultdict(list)
-		self.boneRotationXFrames = defaultdict(list)
-		self.boneRotationYFrames = defaultdict(list)
-		self.boneRotationZFrames = defaultdict(list)
-		self.boneScaleXFrames = defaultdict(list)
-		self.boneScaleYFrames = defaultdict(list)
-		self.boneScaleZFrames = defaultdict(list)
-
-	def UpdateVisible(self,curTime,visible,interKey):
-		self.Update(curTime,interKey)
-		self.visible = visible
-
-	def UpdateLocation(self,curTime,location,interKey):
-		self.Update(curTime,interKey)
-		self.location = location
-
-	def UpdateRotation(self,curTime,rotation,interKey):
-		self.Update(curTime,interKey)
-		self.rotation = rotation
-
-	def UpdateScale(self,curTime,scale,interKey):
-		self.Update(curTime,interKey)
-		self.scale = scale
-
-	def UpdateBones(self,curTime,bones,interKey):
-		self.Update(curTime,interKey)
-		self.bones = bones
-
-	def Update(self,curTime,interKey):
-		if((self.lastTime is not None) and ((curTime is None) or (self.lastTime < curTime))):
-
-			if self.visible is not None:
-				if interKey:
-					afx_utils.AppendInterKeys_Visible(self.lastTime, 0 if self.visible else 1, self.visibilityFrames)
-				self.visibilityFrames.extend((self.lastTime, 0 if self.visible else 1))
-
-			if self.location is not None:
-
-				self.lastRenderOrigin = self.location
-
-				if interKey:
-					afx_utils.AppendInterKeys_Location(self.lastTime, self.location, self.locationXFrames, self.locationYFrames, self.locationZFrames)
-				self.locationXFrames.extend((self.lastTime, self.location.x))
-				self.locationYFrames.extend((self.lastTime, self.location.y))
-				self.locationZFrames.extend((self.lastTime, self.location.z))
-
-			if self.rotation is not None:
-
-				# make sure we take the shortest path:
-				if self.lastRenderRotQuat is not None:
-					dot = self.lastRenderRotQuat.dot(self.rotation)
-					if dot < 0:
-						self.rotation.negate()
-				self.lastRenderRotQuat = self.rotation
-
-				if interKey:
-					afx_utils.AppendInterKeys_Rotation(self.lastTime, self.rotation, self.rotationWFrames, self.rotationXFrames, self.rotationYFrames, self.rotationZFrames)
-				self.rotationWFrames.extend((self.lastTime, self.rotation.w))
-				self.rotationXFrames.extend((self.lastTime, self.rotation.x))
-				self.rotationYFrames.extend((self.lastTime, self.rotation.y))
-				self.rotationZFrames.extend((self.lastTime, self.rotation.z))
-
-			if self.scale is not None:
-				if interKey:
-					afx_utils.AppendInterKeys_Location(self.lastTime, self.scale, self.scaleXFrames, self.scaleYFrames, self.scaleZFrames)
-				self.scaleXFrames.extend((self.lastTime, self.scale.x))
-				self.scaleYFrames.extend((self.lastTime, self.scale.y))
-				self.scaleZFrames.extend((self.lastTime, self.scale.z))
-
-			if self.bones is not None:
-				for idx,i in enumerate(self.bones):
-
-					bone = self.bones[i]
-
-					renderRotQuat = bone.rotation_quaternion.copy()
-
-					# make sure we take the shortest path:
-					if i in self.boneLastRenderRotQuats:
-						dot = self.boneLastRenderRotQuats[i].dot(renderRotQuat)
-						if dot < 0:
-							renderRotQuat.negate()
-					self.boneLastRenderRotQuats[i] = renderRotQuat
-
-					if interKey:
-						afx_utils.AppendInterKeys_Location(self.lastTime, bone.location, self.boneLocationXFrames[i], self.boneLocationYFrames[i], self.boneLocationZFrames[i])
-						afx_utils.AppendInterKeys_Rotation(self.lastTime, renderRotQuat, self.boneRotationWFrames[i], self.boneRotationXFrames[i], self.boneRotationYFrames[i], self.boneRotationZFrames[i])
-						afx_utils.AppendInterKeys_Location(self.lastTime, bone.scale, self.boneScaleXFrames[i], self.boneScaleYFrames[i], self.boneScaleZFrames[i])
-
-					self.boneLocationXFrames[i].extend((self.lastTime, bone.location.x))
-					self.boneLocationYFrames[i].extend((self.lastTime, bone.location.y))
-					self.boneLocationZFrames[i].extend((self.lastTime, bone.location.z))
-
-					self.boneRotationWFrames[i].extend((self.lastTime, renderRotQuat.w))
-					self.boneRotationXFrames[i].extend((self.lastTime, renderRotQuat.x))
-					self.boneRotationYFrames[i].extend((self.lastTime, renderRotQuat.y))
-					self.boneRotationZFrames[i].extend((self.lastTime, renderRotQuat.z))
-
-					self.boneScaleXFrames[i].extend((self.lastTime, bone.scale.x))
-					self.boneScaleYFrames[i].extend((self.lastTime, bone.scale.y))
-					self.boneScaleZFrames[i].extend((self.lastTime, bone.scale.z))
-
-			self.visible = None
-			self.location = None
-			self.rotation = None
-			self.bones = None
-
-		self.lastTime = curTime
-
-#
-#	def __hash__(self):
-#		return hash((self.handle, self.modelName))
-#
-#	def __eq__(self, other):
-#		return (self.handle, self.modelName) == (other.handle, other.modelName)
+		boneIDs = dict(enumerate(stored['boneIDs']))
+		del armature[self.boneIDsProperty]
 
-class CameraData:
-	def __init__(self,o,c):
-		self.o = o
-		self.c = c
-		self.curves = []
+		self.hits += 1
+		self.loadTime += time.time() - time_load
+		return LibrarySmd(armature, boneIDs)
+
+	def Store(self,qcPath,smd):
+		"""Writes the freshly (and successfully) imported model of the smd to the library."""
+		time_store = time.time()
 
-		self.lastRenderOrigin = None
-		self.lastRenderRotQuat = None
-
-		self.lastTime = None
-		self.lens = None
-		self.location = None
-		self.rotation = None
-
-		self.locationXFrames = []
-		self.locationYFrames = []
-		self.locationZFrames = []
-		self.rotationWFrames = []
-		self.rotationXFrames = []
-		self.rotationYFrames = []
-		self.rotationZFrames = []
-		self.lensFrames = []
-
-	def UpdateLens(self,curTime,lens,interKey):
-		self.Update(curTime,interKey)
-		self.lens = lens
-
-	def UpdateLocation(self,curTime,location,interKey):
-		self.Update(curTime,interKey)
-		self.location = location
-
-	def UpdateRotation(self,curTime,rotation,interKey):
-		self.Update(curTime,interKey)
-		self.rotation = rotation
-
-	def Update(self,curTime,interKey):
-		if((self.lastTime is not None) and ((curTime is None) or (self.lastTime < curTime))):
-
-			if self.lens is not None:
-				if interKey:
-					afx_utils.AppendInterKeys_Value(self.lastTime, self.lens, self.lensFrames)
-
-				self.lensFrames.extend((self.lastTime, self.lens))
-
-			if self.location is not None:
-
-				self.lastRenderOrigin = self.location
-
-				if interKey:
-					afx_utils.AppendInterKeys_Location(self.lastTime, self.location, self.locationXFrames, self.locationYFrames, self.locationZFrames)
-				self.locationXFrames.extend((self.lastTime, self.location.x))
-				self.locationYFrames.extend((self.lastTime, self.location.y))
-				self.locationZFrames.extend((self.lastTime, self.location.z))
-
-			if self.rotation is not None:
-
-				# make sure we take the shortest path:
-				if self.lastRenderRotQuat is not None:
-					dot = self.lastRenderRotQuat.dot(self.rotation)
-					if dot < 0:
-						self.rotation.negate()
-				self.lastRenderRotQuat = self.rotation
-
-				if interKey:
-					afx_utils.AppendInterKeys_Rotation(self.lastTime, self.rotation, self.rotationWFrames, self.rotationXFrames, self.rotationYFrames, self.rotationZFrames)
-				self.rotationWFrames.extend((self.lastTime, self.rotation.w))
-				self.rotationXFrames.extend((self.lastTime, self.rotation.x))
-				self.rotationYFrames.extend((self.lastTime, self.rotation.y))
-				self.rotationZFrames.extend((self.lastTime, self.rotation.z))
-
-			self.lens = None
-			self.location = None
-			self.rotation = None
-
-		self.lastTime = curTime
-
-class AgrTimeConverter:
-	def __init__(self,context):
-		self.fps = context.scene.render.fps
-		self.time = 0
-		self.frameTime = 0
-		self.newTime = 0
-		self.errorCount = 0
-		self.maxError = None
-
-	def Frame(self,frameTime):
-		self.time = self.newTime
-		self.frameTime = frameTime
-
-		if 0 != frameTime:
-			fps = 1.0/frameTime
-			error = self.fps -fps
-			if (0>= error) or (0.001 < error):
-				self.errorCount = self.errorCount + 1
-				if (self.maxError is None) or (abs(self.maxError) < abs(error)):
-					self.maxError = error
-
-	def FrameEnd(self):
-		self.newTime = self.time + self.frameTime
-
-	def GetTime(self):
-		return 1.0 + self.time * self.fps
+		a = smd.a
+		a[self.boneIDsProperty] = json.dumps({
+			'boneIDs': [smd.boneIDs[i] for i in range(len(smd.boneIDs))],
+			'bones': [bone.name for bone in a.data.bones],
+		})
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			path = self.GetPath(qcPath)
+			tempPath = path + ".tmp"
+			bpy.data.libraries.write(tempPath, {a, *a.children_recursive}, fake_user=True)
+			os.replace(tempPath, path)
+		finally:
+			del a[self.boneIDsProperty]
+
+		self.stored += 1
+		self.storeTime += time.time() - time_store
+
+	def PrintReport(self,prefix):
+		print("%s Model library: %i hits (loaded in %.4f sec), %i misses, %i stored (in %.4f sec)." % (prefix, self.hits, self.loadTime, self.misses, self.stored, self.storeTime))
+
+def MakeKeys_Visible(times, visible, interKey):
+	# We are lazy, so we use frame 0 to set as not visible (initially) / hide_render 1:
+	times = numpy.concatenate(([0.0], times))
+	invisible = numpy.concatenate(([1.0], numpy.where(visible, 0.0, 1.0)))
+	if interKey:
+		times, invisible = afx_utils.InterKeys_Visible(times, invisible)
+	return times, invisible
+
+def MakeKeys_Value(times, values, interKey):
+	if interKey:
+		times, values = afx_utils.InterKeys_Value(times, values)
+	return times, values
+
+def MakeKeys_Rotation(times, rotations, interKey):
+	# make sure we take the shortest path:
+	rotations = afx_utils.ShortestPath_Rotations(rotations)
+	if interKey:
+		times, rotations = afx_utils.InterKeys_Rotation(times, rotations)
+	return times, rotations
 
 class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 	bl_idname = "advancedfx.agrimporter"
@@ -548,6 +378,156 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 		default='CONSTANT'
 	)
 
+	removeRedundantKeys: bpy.props.BoolProperty(
+		name="Remove redundant key frames",
+		description="Don't create key frames that don't change the animation: Runs of identical key frames are collapsed and constant channels are reduced to a single key frame (or none if it's the bone's rest value).",
+		default=False)
+
+	simplifyKeys: bpy.props.BoolProperty(
+		name="Simplify key frames",
+		description="Drop key frames as long as the animation stays within the given tolerances (lossy).",
+		default=False)
+
+	simplifyTolerance: bpy.props.FloatProperty(
+		name="Simplify tolerance",
+		description="Maximum error for locations in Blender units, for scales and for the lens in mm.",
+		default=0.001,
+		min=0.0,
+		precision=4)
+
+	simplifyAngleTolerance: bpy.props.FloatProperty(
+		name="Simplify angle tolerance",
+		description="Maximum error for rotations in degrees.",
+		default=0.1,
+		min=0.0,
+		precision=3)
+
+	entityPreset: bpy.props.EnumProperty(
+		name="Entities",
+		description="Which entities to import, further limited by the include / exclude filters",
+		items=[
+			('ALL', "All", "Import all entities"),
+			('PLAYERS', "Players only", "Only import player models"),
+			('CAMERAS', "Cameras only", "Don't import any models, only afxCam and entity cameras"),
+		],
+		default='ALL'
+	)
+
+	includeModels: bpy.props.StringProperty(
+		name="Include models",
+		description="Comma separated model name patterns to import (i.e. models/player/*), empty for all.",
+		default="")
+
+	excludeModels: bpy.props.StringProperty(
+		name="Exclude models",
+		description="Comma separated model name patterns to skip (i.e. *shell*, models/weapons/*).",
+		default="")
+
+	includeHandles: bpy.props.StringProperty(
+		name="Include handles",
+		description="Comma separated entity handles to import (in addition to included models), see Scan only.",
+		default="")
+
+	excludeHandles: bpy.props.StringProperty(
+		name="Exclude handles",
+		description="Comma separated entity handles to skip.",
+		default="")
+
+	scanOnly: bpy.props.BoolProperty(
+		name="Scan only",
+		description="Don't import anything, only show a summary of the recording (frames, FPS, models, handles, cameras) and print it as JSON to the console. Sets Last frame to the end of the recording.",
+		default=False)
+
+	importRange: bpy.props.BoolProperty(
+		name="Import frame range",
+		description="Only import the key frames from First frame to Last frame. Uses (and on first use creates) an index file (.agri) next to the AGR file to skip to the range quickly.",
+		default=False)
+
+	rangeStart: bpy.props.IntProperty(
+		name="First frame",
+		description="First frame to import (at the scene's FPS, the recording starts at frame 1).",
+		min=1,
+		default=1)
+
+	rangeEnd: bpy.props.IntProperty(
+		name="Last frame",
+		description="Last frame to import (at the scene's FPS).",
+		min=1,
+		default=250)
+
+	indexInterval: bpy.props.IntProperty(
+		name="Index interval",
+		description="Number of recorded frames between index checkpoints, smaller values mean faster seeking but bigger index files.",
+		min=1,
+		default=256)
+
+	decodeProcesses: bpy.props.IntProperty(
+		name="Decode processes",
+		description="1 decodes the AGR in Blender's process, more decode chunks of it in that many worker processes in parallel (0 for one per CPU). Uses (and on first use creates) the index file (.agri).",
+		min=0,
+		default=1)
+
+	useCache: bpy.props.BoolProperty(
+		name="Use decode cache",
+		description="Store the decoded recording in the cache directory and load it from there when the same AGR file is imported with the same options again.",
+		default=False)
+
+	cacheDirectory: bpy.props.StringProperty(
+		name="Cache directory",
+		description="Directory for the decoded recordings, empty for advancedfx_agr_cache in the temporary directory.",
+		subtype='DIR_PATH',
+		default="")
+
+	cacheSizeLimit: bpy.props.IntProperty(
+		name="Cache size limit (MiB)",
+		description="The least recently used decoded recordings are removed from the cache directory when it grows above this size.",
+		min=0,
+		default=2048)
+
+	useModelLibrary: bpy.props.BoolProperty(
+		name="Use model library",
+		description="Store imported models as .blend files in Model library directory and append them from there in later imports instead of parsing their QC / SMD files again.",
+		default=False)
+
+	modelLibraryDirectory: bpy.props.StringProperty(
+		name="Model library directory",
+		description="Directory for the model library, empty for advancedfx_model_library in the temporary directory.",
+		subtype='DIR_PATH',
+		default="")
+
+	prefetchThreads: bpy.props.IntProperty(
+		name="Model prefetch threads",
+		description="Experimental: Number of threads reading the QC / SMD files of the models while the AGR is decoded (parsing them still happens when the models are imported), 0 to read them only then.",
+		min=0,
+		default=0)
+
+	memoryBudget: bpy.props.IntProperty(
+		name="Memory budget (MiB)",
+		description="Bone data held in memory while decoding, above it the bone data of the objects with the most is moved to temporary files (decoded there too), 0 for no limit. Decodes in Blender's process and doesn't use the decode cache.",
+		min=0,
+		default=0)
+
+	spillDirectory: bpy.props.StringProperty(
+		name="Spill directory",
+		description="Directory for the temporary files of Memory budget, empty for the temporary directory.",
+		subtype='DIR_PATH',
+		default="")
+
+	directModelImport: bpy.props.BoolProperty(
+		name="Direct model import",
+		description="Run the SMD importer code directly for each model instead of calling it as operator (faster, experimental). Falls back to the operator if it fails with your Blender Source Tools version.",
+		default=False)
+
+	suspendUndo: bpy.props.BoolProperty(
+		name="Suspend undo during import",
+		description="Turn off global undo while importing, so no undo steps are stored for the models (less memory), the whole import is still a single undo step. Changes the Global Undo preference till the import ends.",
+		default=False)
+
+	writeKeyHandles: bpy.props.BoolProperty(
+		name="Write key handles",
+		description="Compute the Bezier handles of the keys in one go (like Blender's auto clamped handles) instead of updating each F-Curve afterwards.",
+		default=False)
+
 	# class properties
 	valveMatrixToBlender = mathutils.Matrix.Rotation(math.pi/2,4,'Z')
 	blenderCamUpQuat = mathutils.Quaternion((math.cos(0.5 * math.radians(90.0)), math.sin(0.5* math.radians(90.0)), 0.0, 0.0))
@@ -557,15 +537,36 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 		vs_utils.Logger.__init__(self)
 
 	def execute(self, context):
+		if self.scanOnly:
+			return self.scanAgr(context)
+
 		time_start = time.time()
 		result = None
+		self.prefetcher = None
+		self.smdLoader = None
+		self.smdImporterExRegistered = False
+
+		editPreferences = context.preferences.edit
+		useGlobalUndo = editPreferences.use_global_undo
+		if self.suspendUndo:
+			editPreferences.use_global_undo = False
+
 		try:
-			bpy.utils.unregister_class(vs_import_smd.SmdImporter)
-			bpy.utils.register_class(SmdImporterEx)
+			if self.directModelImport:
+				self.smdLoader = SmdLoader(self.onlyBones, self.bSkip)
+			else:
+				self.registerSmdImporterEx()
 			result = self.readAgr(context)
 		finally:
-			bpy.utils.unregister_class(SmdImporterEx)
-			bpy.utils.register_class(vs_import_smd.SmdImporter)
+			if self.prefetcher is not None:
+				self.prefetcher.Shutdown()
+				self.prefetcher = None
+			self.smdLoader = None
+			if self.smdImporterExRegistered:
+				bpy.utils.unregister_class(SmdImporterEx)
+				bpy.utils.register_class(vs_import_smd.SmdImporter)
+				self.smdImporterExRegistered = False
+			editPreferences.use_global_undo = useGlobalUndo
 
 		for area in context.screen.areas:
 			if area.type == 'VIEW_3D':
@@ -659,13 +660,52 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 
 		return modelData
 
-	def importModel(self, context, modelHandle):
+	def registerSmdImporterEx(self):
+		bpy.utils.unregister_class(vs_import_smd.SmdImporter)
+		bpy.utils.register_class(SmdImporterEx)
+		self.smdImporterExRegistered = True
+
+	def importQc(self, filePath):
+		"""Same as importQcFiles, but the SMD importer reads the prefetched files from memory (it still parses them here)."""
+		if self.prefetcher is None:
+			return self.importQcFiles(filePath)
 
-		def makeModelName(modelHandle):
-			name = modelHandle.modelName.rsplit('/',1)
+		# The SMD importer looks up open in its module before the builtins, restore whatever it was:
+		moduleOpen = vs_import_smd.__dict__.get('open', None)
+		vs_import_smd.open = self.prefetcher.Open
+		try:
+			return self.importQcFiles(filePath)
+		finally:
+			if moduleOpen is None:
+				del vs_import_smd.open
+			else:
+				vs_import_smd.open = moduleOpen
+
+	def importQcFiles(self, filePath):
+		"""Imports the QC file with the SMD importer and returns its smd, sets smdErrors to the number of errors it logged."""
+		if self.smdLoader is not None:
+			try:
+				smd = self.smdLoader.Load(filePath)
+				self.smdErrors = self.smdLoader.loadErrors
+				return smd
+			except (AttributeError, TypeError) as e:
+				# SmdLoader is not an operator, this Blender Source Tools version needs one:
+				traceback.print_exc()
+				self.warning("Direct model import failed ("+str(e)+"), importing the models as operator instead.")
+				self.smdLoader = None
+				self.registerSmdImporterEx()
+		GAgrImporter.smdErrors = 0
+		bpy.ops.advancedfx.smd_importer_ex(filepath=filePath, doAnim=False)
+		self.smdErrors = GAgrImporter.smdErrors
+		return GAgrImporter.smd
+
+	def importModel(self, context, entity):
+
+		def makeModelName(entity):
+			name = entity.modelName.rsplit('/',1)
 			name = name[len(name) -1]
 			name = (name[:30] + '..') if len(name) > 30 else name
-			name = "afx." +str(modelHandle.objNr)+ " " + name
+			name = "afx." +str(entity.objNr)+ " " + name
 			return name
 
 		def copyObj(src,parent=None):
@@ -700,14 +740,12 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 		modelData = None
 
 		if self.modelInstancing:
-			modelData = self.modelObjects.pop(modelHandle.modelName, None)
+			modelData = self.modelObjects.pop(entity.modelName, None)
 
 		if modelData is None:
 			# No instance we are allowed to use, so import it for real:
 
-			filePath = self.assetPath.rstrip("/\\") + "/" +modelHandle.modelName.lower()
-			filePath = os.path.splitext(filePath)[0]
-			filePath = filePath + "/" + os.path.basename(filePath).lower() + ".qc"
+			filePath = self.getQcPath(entity.modelName)
 
 			SmdImporterEx.bSkip = self.bSkip
 			GAgrImporter.smd = None
@@ -715,10 +753,26 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 			modelData = None
 
 			try:
-				if self.aSkip and any(filePath.endswith(a) for a in ("stattrack.qc", "decal_a.qc", "decal_b.qc", "decal_c.qc", "decal_d.qc", "decal_e.qc")):
+				if self.isSkippedQc(filePath):
 					return
-				bpy.ops.advancedfx.smd_importer_ex(filepath=filePath, doAnim=False)
-				modelData = ModelData(GAgrImporter.smd)
+				smd = None
+				if self.modelLibrary is not None:
+					smd = self.modelLibrary.Load(context, filePath)
+				if smd is None:
+					if self.prefetcher is not None:
+						time_wait = time.perf_counter()
+						self.prefetcher.Wait(filePath)
+						self.prefetchWaitTime += time.perf_counter() - time_wait
+					smd = self.importQc(filePath)
+					if self.modelLibrary is not None:
+						if smd is None or smd.a is None or 0 < self.smdErrors:
+							print("AGR Not storing \""+filePath+"\" in model library, its import failed.")
+						else:
+							try:
+								self.modelLibrary.Store(filePath, smd)
+							except (OSError, RuntimeError) as e:
+								self.warning("Could not store \""+filePath+"\" in model library: "+str(e))
+				modelData = ModelData(smd)
 			except Exception as e:
 				if '?.qc' in str(e):
 					pass
@@ -731,7 +785,7 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 			armature = modelData.smd.a
 
 			# Update name:
-			armature.name = makeModelName(modelHandle)
+			armature.name = makeModelName(entity)
 
 			# Fix rotation:
 			if armature.rotation_mode != 'QUATERNION':
@@ -746,16 +800,18 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 			armature.scale[1] = self.global_scale
 			armature.scale[2] = self.global_scale
 
+			self.extractBoneRest(modelData)
+
 			# Insert into instance dictionary:
-			self.modelObjects[modelHandle.modelName] = modelData
+			self.modelObjects[entity.modelName] = modelData
 
 		else:
-			print("Instancing %i (%s)." % (modelHandle.objNr,modelHandle.modelName))
+			print("Instancing %i (%s)." % (entity.objNr,entity.modelName))
 			modelData = copy.copy(modelData)
 
 			modelData.smd = copy.copy(modelData.smd)
 			modelData.smd.a = copyObj(modelData.smd.a)
-			modelData.smd.a.name = makeModelName(modelHandle)
+			modelData.smd.a.name = makeModelName(entity)
 
 			modelData.curves = []
 
@@ -807,373 +863,351 @@ class AgrImporter(bpy.types.Operator, vs_utils.Logger):
 
 		return camData
 
-	def readAgr(self,context):
-		file = None
-		result = { 'result': False, 'frameBegin': 1, 'frameEnd': None }
+	def extractBoneRest(self, modelData):
+		"""Stores the inverse parent relative rest matrices of the bones (in AGR bone order) in modelData."""
+
+		smd = modelData.smd
+		armatureBones = smd.a.data.bones
+
+		restMatrices = numpy.array([bone.matrix_local for bone in armatureBones], dtype=numpy.float64).reshape((-1, 4, 4))
+		parentIndices = numpy.array([armatureBones.find(bone.parent.name) if bone.parent else -1 for bone in armatureBones], dtype=numpy.int32)
+		boneIndices = numpy.array([armatureBones.find(smd.boneIDs[i]) for i in range(len(smd.boneIDs))], dtype=numpy.int32)
+
+		modelData.boneRestInverses = agr_reader.RestRelativeInverses(restMatrices, parentIndices)[boneIndices]
+		modelData.boneIsRoot = parentIndices[boneIndices] < 0
+
+	def computeBoneTransforms(self, entity, modelData, version):
+		"""Yields (times, location, rotation, scale) of the pose bone for each AGR bone."""
+
+		numBones = min(entity.boneMatrices.shape[1], len(modelData.boneRestInverses))
+
+		for i in range(numBones):
+			samples = i < entity.boneCounts
+			matrices = entity.boneMatrices[samples, i]
+
+			if modelData.boneIsRoot[i] and 5 == version:
+				matrices = agr_reader.ValveToBlenderMatrices(matrices)
+
+			location, rotation, scale = agr_reader.BoneBasisTransforms(matrices, modelData.boneRestInverses[i])
+
+			yield entity.boneTimes[samples], location, rotation, scale
+
+	def addCameraKeys(self, camTrack, camData):
+		curves = camData.curves
+		owner = camData.o.name
+
+		lenses = afx_utils.Fovs_ToLenses(camTrack.fov, camData.c.sensor_width)
+
+		self.keyframeWriter.AddKeys(owner, curves[0:3], *MakeKeys_Value(camTrack.times, camTrack.location, self.interKey))
+		self.keyframeWriter.AddKeys(owner, curves[3:7], *MakeKeys_Rotation(camTrack.times, camTrack.rotation, self.interKey), isRotation = True)
+		self.keyframeWriter.AddKeys(owner, curves[7:8], *MakeKeys_Value(camTrack.times, lenses, self.interKey))
+
+		self.keyframeWriter.UpdateCurves(curves)
+
+	def addModelKeys(self, entity, modelData, version):
+		curves = modelData.curves
+		owner = modelData.smd.a.name
+
+		self.keyframeWriter.AddKeys(owner, curves[0:1], *MakeKeys_Visible(entity.visibilityTimes, entity.visible, self.interKey), interpolation = 'CONSTANT', simplify = False)
+		self.keyframeWriter.AddKeys(owner, curves[1:4], *MakeKeys_Value(entity.transformTimes, entity.location, self.interKey))
+		self.keyframeWriter.AddKeys(owner, curves[4:8], *MakeKeys_Rotation(entity.transformTimes, entity.rotation, self.interKey), isRotation = True)
+		self.keyframeWriter.AddKeys(owner, curves[8:11], *MakeKeys_Value(entity.scaleTimes, entity.scale, self.interKey))
+
+		for i, (times, locations, rotations, scales) in enumerate(self.computeBoneTransforms(entity, modelData, version)):
+			self.keyframeWriter.AddKeys(owner, curves[10*i+11:10*i+14], *MakeKeys_Value(times, locations, self.interKey), restValues = (0.0, 0.0, 0.0))
+			self.keyframeWriter.AddKeys(owner, curves[10*i+14:10*i+18], *MakeKeys_Rotation(times, rotations, self.interKey), restValues = (1.0, 0.0, 0.0, 0.0), isRotation = True)
+			self.keyframeWriter.AddKeys(owner, curves[10*i+18:10*i+21], *MakeKeys_Value(times, scales, self.interKey), restValues = (1.0, 1.0, 1.0))
+
+		self.keyframeWriter.UpdateCurves(curves)
+
+	def scanAgr(self, context):
+		time_scan = time.time()
+
+		def updateScanProgress(val):
+			print("AGR Scan %f%%" % (100*val))
 
 		try:
-			self.modelObjects = {}
+			summary = agr_reader.ScanAgr(self.filepath, context.scene.render.fps, updateScanProgress)
+		except agr_reader.AgrError as e:
+			self.error(str(e))
+			self.errorReport("Error report")
+			return {'CANCELLED'}
+
+		print("AGR Scan finished in %.4f sec." % (time.time() - time_scan))
+		print(json.dumps(summary, indent='\t'))
+
+		if not self.importRange:
+			self.rangeEnd = max(1, summary['endFrame'])
+
+		fps = summary['fps']
+		lines = [
+			"Frames: %i (%.2f sec), last frame at %i FPS: %i" % (summary['frames'], summary['duration'], fps['project'], summary['endFrame']),
+			"Recorded FPS: %.2f average, frame time %s - %s sec" % (fps['average'] or 0.0, fps['minFrameTime'], fps['maxFrameTime']),
+			"afxCam: %s, entity cameras: %i" % ("yes" if summary['afxCam'] else "no", len(summary['entityCameras'])),
+			"Models (objects / handles):",
+		]
+		if 0 < fps['mismatchCount']:
+			lines.insert(2, "FPS mismatch: %i times, max error %f" % (fps['mismatchCount'], fps['maxMismatch']))
+		for modelName, counts in sorted(summary['models'].items()):
+			lines.append("    %s: %i / %i" % (modelName, counts['objects'], counts['handles']))
+
+		def draw(menu, context):
+			for line in lines:
+				menu.layout.label(text=line)
+
+		context.window_manager.popup_menu(draw, title="AGR Summary: "+basename(self.filepath), icon='INFO')
+
+		return {'FINISHED'}
 
-			file = open(self.filepath, 'rb')
+	def getQcPath(self, modelName):
+		filePath = self.assetPath.rstrip("/\\") + "/" +modelName.lower()
+		filePath = os.path.splitext(filePath)[0]
+		return filePath + "/" + os.path.basename(filePath).lower() + ".qc"
 
-			if file is None:
-				self.error('Could not open file.')
-				return result
+	def isSkippedQc(self, filePath):
+		return self.aSkip and any(filePath.endswith(a) for a in ("stattrack.qc", "decal_a.qc", "decal_b.qc", "decal_c.qc", "decal_d.qc", "decal_e.qc"))
 
-			file.seek(0, 2)
-			fileSize = file.tell()
-			file.seek(0, 0)
+	def prefetchModel(self, modelName):
+		"""Starts reading the QC / SMD files of the model in the background, unless they won't be needed."""
+		filePath = self.getQcPath(modelName)
+		if self.isSkippedQc(filePath) or (self.modelLibrary is not None and self.modelLibrary.Contains(filePath)):
+			return
+		self.prefetcher.Request(filePath)
+
+	def makeEntityFilter(self):
+		"""Returns the agr_reader.AgrEntityFilter for the filter options or None if all entities are imported."""
 
-			context.window_manager.progress_begin(0.0, 1.0)
+		def splitList(value):
+			return [item.strip() for item in value.replace(';', ',').split(',') if item.strip()]
 
-			version = ReadAgrVersion(file)
+		def splitHandles(value):
+			handles = []
+			for item in splitList(value):
+				try:
+					handles.append(int(item))
+				except ValueError:
+					self.warning("Ignoring invalid handle \""+item+"\".")
+			return handles
 
-			if version is None:
-				self.error('Invalid file format.')
-				return result
+		includeModels = splitList(self.includeModels)
+		if 'PLAYERS' == self.entityPreset:
+			includeModels.extend(agr_reader.PLAYER_MODEL_PATTERNS)
 
-			if (5 != version and version != 6):
-				self.error('Version '+str(version)+' is not supported!')
-				return result
+		entityFilter = agr_reader.AgrEntityFilter(includeModels, splitList(self.excludeModels), splitHandles(self.includeHandles), splitHandles(self.excludeHandles))
 
-			timeConverter = AgrTimeConverter(context)
-			currentTime = timeConverter.GetTime()
-			dictionary = AgrDictionary()
-			handleToLastModelHandle = {}
-			unusedModelHandles = []
-			camData = None
+		if entityFilter.includeAll and 0 == len(entityFilter.excludeModels) and 0 == len(entityFilter.excludeHandles):
+			return None
 
-			modelHandles = []
+		return entityFilter
 
-			stupidCount = 0
+	def loadIndex(self):
+		"""Loads the .agri index of the file, (re-)building and saving it if it's missing or outdated."""
+		time_index = time.time()
 
-			objNr = 0
+		def updateIndexProgress(val):
+			print("AGR Index %f%%" % (100*val))
 
-			while True:
+		index, built = agr_reader.LoadAgrIndex(self.filepath, self.indexInterval, updateIndexProgress)
 
-				if 0 < fileSize and 0 == stupidCount % 100:
-					val = float(file.tell())/float(fileSize)
-					context.window_manager.progress_update(val * 0.5)
-					print("AGR Read %f%%" % (100*val))
+		if built:
+			try:
+				index.Save(agr_reader.GetAgrIndexPath(self.filepath))
+			except OSError as e:
+				self.warning("Could not save AGR index: "+str(e))
 
-				stupidCount = stupidCount +1
+		print("AGR Index %s in %.4f sec (%i checkpoints)." % ("built" if built else "loaded", time.time() - time_index, len(index.checkpoints)))
 
-				if 4096 <= stupidCount:
-					stupidCount = 0
-					gc.collect()
-					#break
+		return index
 
-				node0 = dictionary.Read(file)
+	def readAgr(self,context):
+		result = { 'result': False, 'frameBegin': 1, 'frameEnd': None }
 
-				if node0 is None:
-					break
+		self.modelObjects = {}
+		self.modelLibrary = None
 
-				elif 'afxFrame' == node0:
-					frameTime = ReadFloat(file)
+		if self.useModelLibrary and 'CAMERAS' != self.entityPreset:
+			self.modelLibrary = ModelLibrary(bpy.path.abspath(self.modelLibraryDirectory) if self.modelLibraryDirectory else ModelLibrary.GetDefaultDirectory(), {
+				'onlyBones': self.onlyBones,
+				'bSkip': self.bSkip,
+				'aSkip': self.aSkip,
+			})
 
-					timeConverter.Frame(frameTime)
-					currentTime = timeConverter.GetTime()
+		self.prefetchWaitTime = 0.0
 
-					afxHiddenOffset = ReadInt(file)
-					if afxHiddenOffset:
-						curOffset = file.tell()
-						file.seek(afxHiddenOffset -4, 1)
+		if 0 < self.prefetchThreads and 'CAMERAS' != self.entityPreset:
+			self.prefetcher = asset_prefetch.AssetPrefetcher(self.prefetchThreads, IsSkippedPrefetch if self.bSkip else None)
 
-						numHidden = ReadInt(file)
-						for i in range(numHidden):
-							handle = ReadInt(file)
-	
-							modelHandle = handleToLastModelHandle.pop(handle, None)
-							if modelHandle is not None:
-								# Make ent invisible:
-								modelData =  modelHandle.modelData
-								if modelData: # this can happen if the model could not be loaded
-									modelHandle.UpdateVisible(currentTime, False, self.interKey)
-		
-								unusedModelHandles.append(modelHandle)
-								#print("Marking %i (%s) as hidden/reusable." % (modelHandle.objNr,modelHandle.modelName))
-	
-						file.seek(curOffset,0)
+		context.window_manager.progress_begin(0.0, 1.0)
 
-				elif 'afxFrameEnd' == node0:
-					timeConverter.FrameEnd()
+		def updateReadProgress(val):
+			context.window_manager.progress_update(val * 0.5)
+			print("AGR Read %f%%" % (100*val))
 
-				elif 'afxHidden' == node0:
-					# skipped, because will be handled earlier by afxHiddenOffset
+		frameRange = None
+		index = None
+		recording = None
+		cache = None
+		decodeBegin = None
+		decodeEnd = None
+		onModel = None
 
-					numHidden = ReadInt(file)
-					for i in range(numHidden):
-						handle = ReadInt(file)
+		if self.prefetcher is not None:
+			onModel = self.prefetchModel
 
-				elif 'deleted' == node0:
-					handle = ReadInt(file)
-					modelHandle = handleToLastModelHandle.pop(handle, None)
-					if modelHandle is not None:
-						# Make removed ent invisible:
-						modelData = modelHandle.modelData
-						if modelData: # this can happen if the model could not be loaded
-							modelHandle.UpdateVisible(currentTime, False, self.interKey)
+		fps = context.scene.render.fps
+		entityFilter = self.makeEntityFilter()
+		readBones = 'CAMERAS' != self.entityPreset
+		workers = self.decodeProcesses if 0 < self.decodeProcesses else (os.cpu_count() or 1)
+		memoryBudget = None
+		spillDirectory = None
 
-						unusedModelHandles.append(modelHandle)
-						#print("Marking %i (%s) as deleted/reusable." % (modelHandle.objNr,modelHandle.modelName)
-
-				elif 'entity_state' == node0:
-					visible = None
-					modelHandle = None
-					modelData = None
-					handle = ReadInt(file)
-					if dictionary.Peekaboo(file,'baseentity'):
+		if 0 < self.memoryBudget:
+			memoryBudget = self.memoryBudget * 1048576
+			spillDirectory = bpy.path.abspath(self.spillDirectory) if self.spillDirectory else None
+			if 1 < workers:
+				print("AGR Memory budget set, decoding in Blender's process.")
+				workers = 1
 
-						modelName = dictionary.Read(file)
-
-						visible = ReadBool(file)
-
-						if 5 == version:
-							renderOrigin = ReadVector(file, quakeFormat=True)
-							renderAngles = ReadQAngle(file)
-							renderRotQuat = renderAngles.to_quaternion()
-							renderScale =  mathutils.Vector((1,1,1)) 
+		try:
+			if self.importRange:
+				frameRange = (self.rangeStart, max(self.rangeStart, self.rangeEnd))
+
+			if self.useCache and memoryBudget is None:
+				time_cache = time.time()
+				cache = agr_cache.AgrCache(bpy.path.abspath(self.cacheDirectory) if self.cacheDirectory else agr_cache.GetDefaultCacheDirectory(), self.cacheSizeLimit * 1048576)
+				cacheKey = cache.GetKey(self.filepath, {
+					'fps': fps,
+					'globalScale': self.global_scale,
+					'frameRange': frameRange,
+					'entityFilter': None if entityFilter is None else entityFilter.GetKey(),
+					'readBones': readBones,
+				})
+				recording = cache.Load(cacheKey)
+				print("AGR Cache %s in %.4f sec." % ("hit" if recording is not None else "miss", time.time() - time_cache))
+
+			if recording is None:
+				if self.importRange or 1 < workers:
+					index = self.loadIndex()
+
+				time_read = time.time()
+				decodeBegin = time.perf_counter()
+
+				if 1 < workers:
+					if onModel is not None:
+						# The workers can't report models, so start with the ones known from the index:
+						for checkpoint in index.checkpoints:
+							for objNr, modelName, origin, scaleTransform in checkpoint['entities']:
+								if (entityFilter is None) or entityFilter.Accepts(None, modelName):
+									onModel(modelName)
+					print("AGR Decoding with %i processes." % workers)
+					try:
+						recording = agr_reader.ReadAgrParallel(self.filepath, fps, self.global_scale, index, workers, updateReadProgress, frameRange, entityFilter, readBones)
+					except (concurrent.futures.BrokenExecutor, pickle.PicklingError, AttributeError, TypeError, OSError) as e:
+						# Worker crashed or couldn't be fed, the serial decode doesn't depend on either:
+						traceback.print_exc()
+						self.report({'ERROR'}, "AGR Decoding in worker processes failed (%s: %s), decoding in Blender's process instead." % (type(e).__name__, e))
+						workers = 1
+
+				if 1 == workers:
+					recording = agr_reader.ReadAgr(self.filepath, fps, self.global_scale, updateReadProgress, frameRange, index, entityFilter, readBones, onModel, memoryBudget, spillDirectory)
+
+				decodeEnd = time.perf_counter()
+				time_read = time.time() - time_read
+				fileSize = os.path.getsize(self.filepath)
+				print("AGR Read %.2f MiB in %.4f sec (%.2f MiB/s)." % (fileSize / 1048576.0, time_read, fileSize / 1048576.0 / time_read if 0 < time_read else 0.0))
+				print("AGR Bones decoded %.2f MiB in %.4f sec (%.2f MiB/s)." % (recording.boneBytes / 1048576.0, recording.boneDecodeTime, recording.boneBytes / 1048576.0 / recording.boneDecodeTime if 0 < recording.boneDecodeTime else 0.0))
+				if memoryBudget is not None:
+					print("AGR Spilled the bones of %i objects (%.2f MiB) to temporary files." % (recording.spilledEntities, recording.spilledBoneBytes / 1048576.0))
+
+				if cache is not None:
+					time_cache = time.time()
+					try:
+						if cache.Store(cacheKey, recording):
+							print("AGR Cache stored in %.4f sec." % (time.time() - time_cache))
 						else:
-							matrix = ReadMatrix3x4(file)
-							matrix = self.valveMatrixToBlender @ matrix
-							renderOrigin, renderRotQuat, renderScale = matrix.decompose()
-
-						renderOrigin = renderOrigin * self.global_scale
-						renderScale = renderScale * self.global_scale
-
-						modelHandle = handleToLastModelHandle.get(handle, None)
-
-						if (modelHandle is not None) and (modelHandle.modelName != modelName):
-							# Switched model, make old model invisible:
-							modelData = modelHandle.modelData
-							if modelData: # this can happen if the model could not be loaded
-								modelHandle.UpdateVisible(currentTime, False, self.interKey)
-	
-							modelHandle = None
-
-						if modelHandle is None:
-	
-							# Check if we can reuse s.th. and if not create new one:
-	
-							bestIndex = 0
-							bestLength = 0
-	
-							for idx,val in enumerate(unusedModelHandles):
-								if (val.modelName == modelName) and ((modelHandle is None) or val.lastRenderOrigin is None or ((val.lastRenderOrigin -renderOrigin).length < bestLength)):
-									modelHandle = val
-									bestLength = 0 if val.lastRenderOrigin is None else (val.lastRenderOrigin -renderOrigin).length
-									bestIndex = idx
-	
-							if modelHandle is not None:
-								# Use the one we found:
-								del unusedModelHandles[bestIndex]
-								print("Reusing %i (%s)." % (modelHandle.objNr,modelHandle.modelName))
-							else:
-								# If not then create a new one:
-								objNr = objNr + 1
-								modelHandle = ModelHandle(objNr, modelName)
-								print("Creating %i (%s)." % (modelHandle.objNr,modelHandle.modelName))
-								modelHandles.append(modelHandle)
-	
-							handleToLastModelHandle[handle] = modelHandle
-
-						modelData = modelHandle.modelData
-						if modelData is False:
-							# We have not tried to import the model for this (new) handle yet, so try to import it:
-							modelData = self.importModel(context, modelHandle)
-							modelHandle.modelData = modelData
-
-						if modelData is not None:
-							modelHandle.UpdateVisible(currentTime, visible, self.interKey)
-							modelHandle.UpdateLocation(currentTime, renderOrigin, self.interKey)
-							modelHandle.UpdateRotation(currentTime, renderRotQuat, self.interKey)
-							modelHandle.UpdateScale(currentTime, renderScale, self.interKey)
-
-					if dictionary.Peekaboo(file,'baseanimating'):
-						#skin = ReadInt(file)
-						#body = ReadInt(file)
-						#sequence  = ReadInt(file)
-						hasBoneList = ReadBool(file)
-						if hasBoneList:
-							numBones = ReadInt(file)
-	
-							bones = {}
-	
-							for i in range(numBones):
-								#pos = file.tell()
-								if 5 == version:
-									vec = ReadVector(file, quakeFormat=False)
-									quat = ReadQuaternion(file, quakeFormat=False)
-									matrix = mathutils.Matrix.Translation(vec) @ quat.to_matrix().to_4x4()
-								else:
-									matrix = ReadMatrix3x4(file)
-		
-								if (modelData is None):
-									continue
-		
-								#if not(True == visible):
-								#	# Only key-frame if visible
-								#	continue
-		
-								if(i < len(modelData.smd.boneIDs)):
-									bone = modelData.smd.a.pose.bones[modelData.smd.boneIDs[i]]
-			
-									#self.warning(str(pos)+": "+str(i)+"("+bone.name+"): "+str(vec)+" "+str(quat))
-			
-									if bone.parent:
-										matrix = bone.parent.matrix @ matrix
-									else:
-										if 5 == version:
-											matrix = self.valveMatrixToBlender @ matrix
-			
-									bone.matrix = matrix
-			
-									bones[i] = bone
-			
-							modelHandle.UpdateBones(currentTime,bones,self.interKey)
-
-					if dictionary.Peekaboo(file,'camera'):
-						thidPerson = ReadBool(file)
-						pos = ReadVector(file, quakeFormat=True)
-						rot = ReadQAngle(file)
-						fov = ReadFloat(file)
-
-						modelCamData = modelHandle.camData
-						if modelHandle.camData is None:
-							modelCamData = self.createCamera(context,"camera."+str(modelHandle.objNr))
-							modelHandle.camData = modelCamData
-
-						lens = modelCamData.c.sensor_width / (2.0 * math.tan(math.radians(fov) / 2.0))
-
-						renderOrigin = pos * self.global_scale
-						renderRotQuat = rot.to_quaternion() @ self.blenderCamUpQuat
-
-						modelCamData.UpdateLens(currentTime, lens, self.interKey)
-						modelCamData.UpdateLocation(currentTime, renderOrigin, self.interKey)
-						modelCamData.UpdateRotation(currentTime, renderRotQuat, self.interKey)
-
-					dictionary.Peekaboo(file,'/')
-
-					viewModel = ReadBool(file)
-
-					#if modelData is not None:
-					#	for fc in modelData.curves:
-					#		fc.update()
-
-				elif 'afxCam' == node0:
-
-					if camData is None:
-						camData = self.createCamera(context,"afxCam")
-
-						if camData is None:
-							self.error("Failed to create camera.")
-							return result
-
-
-					renderOrigin = ReadVector(file, quakeFormat=True)
-					renderAngles = ReadQAngle(file)
-
-					fov = ReadFloat(file)
-
-					lens = camData.c.sensor_width / (2.0 * math.tan(math.radians(fov) / 2.0))
-
-					renderOrigin = renderOrigin * self.global_scale
-					renderRotQuat = renderAngles.to_quaternion() @ self.blenderCamUpQuat
-
-					camData.UpdateLens(currentTime, lens, self.interKey)
-					camData.UpdateLocation(currentTime, renderOrigin, self.interKey)
-					camData.UpdateRotation(currentTime, renderRotQuat, self.interKey)
+							print("AGR Cache not storing the decoded recording, it's bigger than the cache size limit.")
+					except OSError as e:
+						self.warning("Could not store decoded AGR in cache: "+str(e))
+		except agr_reader.AgrError as e:
+			self.error(str(e))
+			context.window_manager.progress_end()
+			return result
 
-				else:
-					self.warning('Unknown packet at '+str(file.tell()))
-					return result
-
-			totalFrames = 0
-			for modelHandle in modelHandles:
-				modelHandle.Update(None,self.interKey) #finish lingering updates
-				modelCamData = modelHandle.camData
-				if modelCamData is not None:
-					modelCamData.Update(None,self.interKey) #finish lingering updates
-					totalFrames += len(modelCamData.locationXFrames) * 3
-					totalFrames += len(modelCamData.rotationWFrames) * 4
-					totalFrames += len(modelCamData.lensFrames)
-				totalFrames += len(modelHandle.visibilityFrames)
-				totalFrames += len(modelHandle.locationXFrames) * 3
-				totalFrames += len(modelHandle.rotationWFrames) * 4
-				totalFrames += len(modelHandle.scaleXFrames) * 3
-				for i in modelHandle.boneLocationXFrames:
-					totalFrames += len(modelHandle.boneLocationXFrames[i]) * 3
-					totalFrames += len(modelHandle.boneRotationWFrames[i]) * 4
-					totalFrames += len(modelHandle.boneScaleXFrames[i]) * 3
-			if camData is not None:
-				camData.Update(None,self.interKey) #finish lingering updates
-				totalFrames += len(camData.locationXFrames) * 3
-				totalFrames += len(camData.rotationWFrames) * 4
-				totalFrames += len(camData.lensFrames)
-
-			importedFrames = 0
-
-			def updateImportProgress(newFrames):
-				nonlocal importedFrames
-				importedFrames += newFrames
-				val = importedFrames / totalFrames
-				print("AGR Import %f%%" % (100*val))
-				context.window_manager.progress_update(0.5 + val * 0.5)
-
-			for modelHandle in modelHandles:
-				modelCamData = modelHandle.camData
-				if modelCamData is not None:
-					curves = modelCamData.curves
-					afx_utils.AddKeysList_Location(self.keyframeInterpolation, curves[0].keyframe_points, curves[1].keyframe_points, curves[2].keyframe_points, modelCamData.locationXFrames, modelCamData.locationYFrames, modelCamData.locationZFrames)
-					afx_utils.AddKeysList_Rotation(self.keyframeInterpolation, curves[3].keyframe_points, curves[4].keyframe_points, curves[5].keyframe_points, curves[6].keyframe_points, modelCamData.rotationWFrames, modelCamData.rotationXFrames, modelCamData.rotationYFrames, modelCamData.rotationZFrames)
-					afx_utils.AddKeysList_Value(self.keyframeInterpolation, curves[7].keyframe_points, modelCamData.lensFrames)
-					updateImportProgress(len(modelCamData.locationXFrames) * 3 + len(modelCamData.rotationWFrames) * 4 + len(modelCamData.lensFrames))
-					for curve in curves:
-						curve.update()
-				if modelHandle.modelData is None:
-					continue
-				curves = modelHandle.modelData.curves
-				afx_utils.AddKeysList_Visible(curves[0].keyframe_points, modelHandle.visibilityFrames)
-				afx_utils.AddKeysList_Location(self.keyframeInterpolation, curves[1].keyframe_points, curves[2].keyframe_points, curves[3].keyframe_points, modelHandle.locationXFrames, modelHandle.locationYFrames, modelHandle.locationZFrames)
-				afx_utils.AddKeysList_Rotation(self.keyframeInterpolation, curves[4].keyframe_points, curves[5].keyframe_points, curves[6].keyframe_points, curves[7].keyframe_points, modelHandle.rotationWFrames, modelHandle.rotationXFrames, modelHandle.rotationYFrames, modelHandle.rotationZFrames)
-				afx_utils.AddKeysList_Location(self.keyframeInterpolation, curves[8].keyframe_points, curves[9].keyframe_points, curves[10].keyframe_points, modelHandle.scaleXFrames, modelHandle.scaleYFrames, modelHandle.scaleZFrames)
-				updateImportProgress(len(modelHandle.visibilityFrames) + len(modelHandle.locationXFrames) * 3 + len(modelHandle.rotationWFrames) * 4 + len(modelHandle.scaleXFrames) * 3)
-				currentFrames = 0
-				for i in modelHandle.boneLocationXFrames:
-					afx_utils.AddKeysList_Location(self.keyframeInterpolation, curves[10*i+11].keyframe_points, curves[10*i+12].keyframe_points, curves[10*i+13].keyframe_points, modelHandle.boneLocationXFrames[i], modelHandle.boneLocationYFrames[i], modelHandle.boneLocationZFrames[i])
-					currentFrames += len(modelHandle.boneLocationXFrames[i]) * 3
-				updateImportProgress(currentFrames)
-				currentFrames = 0
-				for i in modelHandle.boneRotationWFrames:
-					afx_utils.AddKeysList_Rotation(self.keyframeInterpolation, curves[10*i+14].keyframe_points, curves[10*i+15].keyframe_points, curves[10*i+16].keyframe_points, curves[10*i+17].keyframe_points, modelHandle.boneRotationWFrames[i], modelHandle.boneRotationXFrames[i], modelHandle.boneRotationYFrames[i], modelHandle.boneRotationZFrames[i])
-					currentFrames += len(modelHandle.boneRotationWFrames[i]) * 4
-				updateImportProgress(currentFrames)
-				currentFrames = 0
-				for i in modelHandle.boneScaleXFrames:
-					afx_utils.AddKeysList_Location(self.keyframeInterpolation, curves[10*i+18].keyframe_points, curves[10*i+19].keyframe_points, curves[10*i+20].keyframe_points, modelHandle.boneScaleXFrames[i], modelHandle.boneScaleYFrames[i], modelHandle.boneScaleZFrames[i])
-					currentFrames += len(modelHandle.boneScaleXFrames[i]) * 3
-				updateImportProgress(currentFrames)
-				for curve in curves:
-					curve.update()
-			if camData is not None:
-				curves = camData.curves
-				afx_utils.AddKeysList_Location(self.keyframeInterpolation, curves[0].keyframe_points, curves[1].keyframe_points, curves[2].keyframe_points, camData.locationXFrames, camData.locationYFrames, camData.locationZFrames)
-				afx_utils.AddKeysList_Rotation(self.keyframeInterpolation, curves[3].keyframe_points, curves[4].keyframe_points, curves[5].keyframe_points, curves[6].keyframe_points, camData.rotationWFrames, camData.rotationXFrames, camData.rotationYFrames, camData.rotationZFrames)
-				afx_utils.AddKeysList_Value(self.keyframeInterpolation, curves[7].keyframe_points, camData.lensFrames)
-				updateImportProgress(len(camData.locationXFrames) * 3 + len(camData.rotationWFrames) * 4 + len(camData.lensFrames))
-				for curve in curves:
-					curve.update()
-
-			result['frameEnd'] = int(math.ceil(timeConverter.GetTime()))
-
-			if 0 < timeConverter.errorCount:
-				self.warning("FPS mismatch was detected %i times. The maximum error was %f. Solution: Make sure to set the Blender project FPS correctly before importing." % (timeConverter.errorCount, timeConverter.maxError))
+		# Create the Blender objects:
 
-			context.window_manager.progress_end()
+		models = []
+		cameras = []
 
-		finally:
-			if file is not None:
-				file.close()
+		if self.prefetcher is not None:
+			# Anything not requested while decoding (i.e. loaded from the cache):
+			for entity in recording.entities:
+				self.prefetchModel(entity.modelName)
+
+		for entity in recording.entities:
+			if 'CAMERAS' != self.entityPreset:
+				modelData = self.importModel(context, entity)
+				if modelData is not None:
+					models.append((entity, modelData))
+			if entity.camera is not None:
+				cameras.append((entity.camera, self.createCamera(context, entity.camera.name)))
+
+		if recording.afxCam is not None:
+			cameras.append((recording.afxCam, self.createCamera(context, recording.afxCam.name)))
+
+		if self.modelLibrary is not None:
+			self.modelLibrary.PrintReport("AGR")
+
+		if self.prefetcher is not None:
+			print("AGR Model prefetch read %.2f MiB of %i models in %.4f sec, %.4f sec of it overlapped with decoding, waited %.4f sec for it." % (
+				self.prefetcher.bytesRead / 1048576.0,
+				len(self.prefetcher.jobs),
+				self.prefetcher.GetTotalTime(),
+				0.0 if decodeBegin is None else self.prefetcher.GetOverlap(decodeBegin, decodeEnd),
+				self.prefetchWaitTime))
+
+		# Key-frame them:
+
+		self.keyframeWriter = afx_utils.KeyframeWriter(self.keyframeInterpolation, self.removeRedundantKeys, self.simplifyKeys, self.simplifyTolerance, self.simplifyAngleTolerance, self.writeKeyHandles)
+
+		totalTracks = len(models) + len(cameras)
+		importedTracks = 0
+
+		def updateImportProgress():
+			nonlocal importedTracks
+			importedTracks += 1
+			val = importedTracks / totalTracks
+			print("AGR Import %f%%" % (100*val))
+			context.window_manager.progress_update(0.5 + val * 0.5)
+
+		for entity, modelData in models:
+			self.addModelKeys(entity, modelData, recording.version)
+			# Not needed anymore, release the memory (or file) early:
+			entity.boneMatrices = None
+			updateImportProgress()
+
+		for camTrack, camData in cameras:
+			self.addCameraKeys(camTrack, camData)
+			updateImportProgress()
+
+		self.keyframeWriter.PrintReport("AGR")
+
+		if self.removeRedundantKeys or self.simplifyKeys:
+			print("AGR Removed %i of %i key frames." % (self.keyframeWriter.keyCount - self.keyframeWriter.keyCountWritten, self.keyframeWriter.keyCount))
+
+		result['frameEnd'] = int(math.ceil(recording.endTime))
+
+		if frameRange is not None:
+			result['frameBegin'] = frameRange[0]
+			result['frameEnd'] = min(frameRange[1], result['frameEnd'])
+
+		if 0 < recording.fpsErrorCount:
+			self.warning("FPS mismatch was detected %i times. The maximum error was %f. Solution: Make sure to set the Blender project FPS correctly before importing." % (recording.fpsErrorCount, recording.fpsMaxError))
+
+		peakRss = agr_reader.GetPeakRss()
+		if peakRss is not None:
+			print("AGR Peak RSS (of Blender's process so far) %.2f MiB." % (peakRss / 1048576.0))
+
+		context.window_manager.progress_end()
 
 		result['result'] = True
 		return result
@@ -5,6 +5,7 @@ import struct
 
 import bpy, bpy.props, bpy.ops
 import mathutils
+import numpy
 
 from io_scene_valvesource import utils as vs_utils
 
@@ -103,20 +104,12 @@ def ReadFrameTime(file):
 	return float(words[2])
 
 
-def ReadFrame(file, channels):
-	line = ReadLineWords(file)
-
-	if len(line) < 6:
-		return False;
-
-	Xpos = float(line[channels[0]])
-	Ypos = float(line[channels[1]])
-	Zpos = float(line[channels[2]])
-	Zrot = float(line[channels[3]])
-	Xrot = float(line[channels[4]])
-	Yrot = float(line[channels[5]])
-
-	return [Xpos, Ypos, Zpos, Zrot, Xrot, Yrot]
+# <summary> Reads the remaining frame lines </summary>
+# <param name="file"> file to read from </param>
+# <param name="channels"> channel indexes as returned by ReadChannels </param>
+# <returns> (N,6) array with the columns Xposition, Yposition, Zposition, Zrotation, Xrotation, Yrotation </returns>
+def ReadFrameValues(file, channels):
+	return afx_utils.ReadColumns(file, 6)[:, channels]
 
 class CameraData:
 	def __init__(self,o):
@@ -174,8 +167,24 @@ class BvhImporter(bpy.types.Operator, vs_utils.Logger):
 		default=9.0,
 	)
 
-	# class properties
-	blenderCamUpQuat = mathutils.Quaternion((math.cos(0.5 * math.radians(90.0)), math.sin(0.5* math.radians(90.0)), 0.0, 0.0))
+	simplifyKeys: bpy.props.BoolProperty(
+		name="Simplify key frames",
+		description="Drop key frames as long as the animation stays within the given tolerances (lossy).",
+		default=False)
+
+	simplifyTolerance: bpy.props.FloatProperty(
+		name="Simplify tolerance",
+		description="Maximum error for locations in Blender units.",
+		default=0.001,
+		min=0.0,
+		precision=4)
+
+	simplifyAngleTolerance: bpy.props.FloatProperty(
+		name="Simplify angle tolerance",
+		description="Maximum error for rotations in degrees.",
+		default=0.1,
+		min=0.0,
+		precision=3)
 
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -239,6 +248,27 @@ class BvhImporter(bpy.types.Operator, vs_utils.Logger):
 
 		return fov
 
+	def addKeys(self, camData, times, locations, rotations):
+		curves = camData.curves
+		owner = camData.o.name
+
+		times = numpy.array(times, dtype=numpy.float64)
+		locations = numpy.array(locations, dtype=numpy.float64).reshape((-1, 3))
+		# Make sure we travel the short way:
+		rotations = afx_utils.ShortestPath_Rotations(numpy.array(rotations, dtype=numpy.float64).reshape((-1, 4)))
+
+		keyframeWriter = afx_utils.KeyframeWriter('CONSTANT', False, self.simplifyKeys, self.simplifyTolerance, self.simplifyAngleTolerance)
+
+		if self.interKey:
+			keyframeWriter.AddKeys(owner, curves[0:3], *afx_utils.InterKeys_Value(times, locations))
+			keyframeWriter.AddKeys(owner, curves[3:7], *afx_utils.InterKeys_Rotation(times, rotations), isRotation = True)
+		else:
+			keyframeWriter.AddKeys(owner, curves[0:3], times, locations)
+			keyframeWriter.AddKeys(owner, curves[3:7], times, rotations, isRotation = True)
+
+		keyframeWriter.UpdateCurves(curves)
+		keyframeWriter.PrintReport("BVH")
+
 	def readBvh(self, context):
 		fps = context.scene.render.fps
 
@@ -282,49 +312,23 @@ class BvhImporter(bpy.types.Operator, vs_utils.Logger):
 				self.error('Failed parsing Frame Time.')
 				return False
 
-			frameCount = int(0)
-
-			lastQuat = None
-
-			while True:
-				frame = ReadFrame(file, channels)
-				if not frame:
-					break
-
-				frameCount += 1
-
-				BTT = (float(frameTime) * float(frameCount-1))
-
-				BYP = -frame[0]
-				BZP =  frame[1]
-				BXP = -frame[2]
-
-				BZR = -frame[3]
-				BXR = -frame[4]
-				BYR =  frame[5]
-
-				time = BTT
-				time = 1.0 + time * fps
-
-				renderOrigin = mathutils.Vector((-BYP,BXP,BZP)) * self.global_scale
-
-				curves = camData.curves
-
-				afx_utils.AddKey_Location(self.interKey, curves[0+0].keyframe_points, curves[0+1].keyframe_points, curves[0+2].keyframe_points, time, renderOrigin)
+			frame = ReadFrameValues(file, channels)
+			frameCount = len(frame)
 
-				qAngle = afx_utils.QAngle(BXR,BYR,BZR)
+			times = 1.0 + (float(frameTime) * numpy.arange(frameCount, dtype=numpy.float64)) * fps
 
-				quat = qAngle.to_quaternion() @ self.blenderCamUpQuat
+			BYP = -frame[:, 0]
+			BZP =  frame[:, 1]
+			BXP = -frame[:, 2]
 
-				# Make sure we travel the short way:
-				if lastQuat:
-					dp = lastQuat.dot(quat)
-					if dp < 0:
-						quat.negate()
+			BZR = -frame[:, 3]
+			BXR = -frame[:, 4]
+			BYR =  frame[:, 5]
 
-				lastQuat = quat
+			locations = afx_utils.ValveToBlender_Locations(numpy.stack((BXP, BYP, BZP), axis=-1), self.global_scale)
+			rotations = afx_utils.QAngles_ToCameraQuaternions(numpy.stack((BXR, BYR, BZR), axis=-1))
 
-				afx_utils.AddKey_Rotation(self.interKey, curves[0+3].keyframe_points, curves[0+4].keyframe_points, curves[0+5].keyframe_points, curves[0+6].keyframe_points, time, quat)
+			self.addKeys(camData, times, locations, rotations)
 
 			if not frameCount == frames:
 				self.error("Frames are missing in BVH file.")
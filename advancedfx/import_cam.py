@@ -5,6 +5,7 @@ import struct
 
 import bpy, bpy.props, bpy.ops
 import mathutils
+import numpy
 
 from io_scene_valvesource import utils as vs_utils
 
@@ -18,15 +19,6 @@ def ReadLineWords(file):
 	words = [ll for ll in line.split() if ll]
 	return words
 
-def AlienSwarm_FovScaling(width, height, fov):
-	if 0 == height:
-		return fov
-	engineAspectRatio = width / height
-	defaultAscpectRatio = 4.0 / 3.0
-	ratio = engineAspectRatio / defaultAscpectRatio
-	t = ratio * math.tan(math.radians(0.5 * fov))
-	return 2.0 * math.degrees(math.atan(t))
-
 class CameraData:
 	def __init__(self,o,c):
 		self.o = o
@@ -57,8 +49,24 @@ class CamImporter(bpy.types.Operator, vs_utils.Logger):
 		default=0.01,
 	)
 
-	# class properties
-	blenderCamUpQuat = mathutils.Quaternion((math.cos(0.5 * math.radians(90.0)), math.sin(0.5* math.radians(90.0)), 0.0, 0.0))
+	simplifyKeys: bpy.props.BoolProperty(
+		name="Simplify key frames",
+		description="Drop key frames as long as the animation stays within the given tolerances (lossy).",
+		default=False)
+
+	simplifyTolerance: bpy.props.FloatProperty(
+		name="Simplify tolerance",
+		description="Maximum error for locations in Blender units and for the lens in mm.",
+		default=0.001,
+		min=0.0,
+		precision=4)
+
+	simplifyAngleTolerance: bpy.props.FloatProperty(
+		name="Simplify angle tolerance",
+		description="Maximum error for rotations in degrees.",
+		default=0.1,
+		min=0.0,
+		precision=3)
 
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -120,6 +128,30 @@ class CamImporter(bpy.types.Operator, vs_utils.Logger):
 
 		return camData
 
+	def addKeys(self, camData, times, locations, rotations, lenses):
+		curves = camData.curves
+		owner = camData.o.name
+
+		times = numpy.array(times, dtype=numpy.float64)
+		locations = numpy.array(locations, dtype=numpy.float64).reshape((-1, 3))
+		# Make sure we travel the short way:
+		rotations = afx_utils.ShortestPath_Rotations(numpy.array(rotations, dtype=numpy.float64).reshape((-1, 4)))
+		lenses = numpy.array(lenses, dtype=numpy.float64)
+
+		keyframeWriter = afx_utils.KeyframeWriter('CONSTANT', False, self.simplifyKeys, self.simplifyTolerance, self.simplifyAngleTolerance)
+
+		if self.interKey:
+			keyframeWriter.AddKeys(owner, curves[0:3], *afx_utils.InterKeys_Value(times, locations))
+			keyframeWriter.AddKeys(owner, curves[3:7], *afx_utils.InterKeys_Rotation(times, rotations), isRotation = True)
+			keyframeWriter.AddKeys(owner, curves[7:8], *afx_utils.InterKeys_Value(times, lenses))
+		else:
+			keyframeWriter.AddKeys(owner, curves[0:3], times, locations)
+			keyframeWriter.AddKeys(owner, curves[3:7], times, rotations, isRotation = True)
+			keyframeWriter.AddKeys(owner, curves[7:8], times, lenses)
+
+		keyframeWriter.UpdateCurves(curves)
+		keyframeWriter.PrintReport("CAM")
+
 	def readCam(self, context):
 		fps = context.scene.render.fps
 
@@ -169,56 +201,33 @@ class CamImporter(bpy.types.Operator, vs_utils.Logger):
 				self.error("Unsupported scaleFov value.")
 				return False
 
-			lastTime = None
-			lastQuat = None
-	
-			while True:
-				words = ReadLineWords(file)
-
-				if not( 8 <= len(words)):
-					break
-
-				time = float(words[0])
-
-				if not lastTime:
-					lastTime = time
-
-				orgTime = time
-
-				time = time -lastTime
-
-				time = 1.0 + time * fps
-
-				frame_end = int(math.ceil(time))
-
-				renderOrigin = mathutils.Vector((-float(words[2]),float(words[1]),float(words[3]))) * self.global_scale
-				qAngle = afx_utils.QAngle(float(words[5]),float(words[6]),float(words[4]))
-
-				quat = qAngle.to_quaternion() @ self.blenderCamUpQuat
-
-				# Make sure we travel the short way:
-				if lastQuat:
-					dp = lastQuat.dot(quat)
-					if dp < 0:
-						quat.negate()
-
-				lastQuat = quat
-
-				fov = float(words[7])
+			# time, x, y, z, xRoll, yPitch, zYaw, fov per line:
+			values = afx_utils.ReadColumns(file, 8)
 
-				# none and alienSwarm was confused in version 1, version 2 always outputs real fov and doesn't have scaleFov.
-				if 'none' == scaleFov:
-					fov = AlienSwarm_FovScaling(width, height, fov)
+			# Times are relative to the first non-zero time:
+			times = values[:, 0].copy()
+			nonZero = numpy.flatnonzero(times)
+			if 0 < len(nonZero):
+				first = nonZero[0]
+				times[first:] -= times[first]
+				times[:first] = 0.0
+			else:
+				times[:] = 0.0
+			times = 1.0 + times * fps
 
-				lens = camData.c.sensor_width / (2.0 * math.tan(math.radians(fov) / 2.0))
+			if 0 < len(times):
+				frame_end = int(math.ceil(times[-1]))
 
-				curves = camData.curves
+			fov = values[:, 7]
 
-				afx_utils.AddKey_Location(self.interKey, curves[0+0].keyframe_points, curves[0+1].keyframe_points, curves[0+2].keyframe_points, time, renderOrigin)
+			# none and alienSwarm was confused in version 1, version 2 always outputs real fov and doesn't have scaleFov.
+			if 'none' == scaleFov:
+				fov = afx_utils.AlienSwarm_FovScaling(width, height, fov)
 
-				afx_utils.AddKey_Rotation(self.interKey, curves[0+3].keyframe_points, curves[0+4].keyframe_points, curves[0+5].keyframe_points, curves[0+6].keyframe_points, time, quat)
+			# Angles are in (pitch, yaw, roll) order for QAngle:
+			locations, rotations, lenses = afx_utils.ValveToBlender_Cameras(values[:, 1:4], values[:, [5, 6, 4]], fov, self.global_scale, camData.c.sensor_width)
 
-				afx_utils.AddKey_Value(self.interKey, curves[0+7].keyframe_points, time, lens)
+			self.addKeys(camData, times, locations, rotations, lenses)
 
 			if frame_end is not None:
 				bpy.context.scene.frame_start = 1
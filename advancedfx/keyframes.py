@@ -0,0 +1,285 @@
+import math
+
+import numpy
+
+# Key frame math on arrays, this module must not depend on bpy / mathutils, so it can be tested outside of Blender.
+
+# Blender treats keys closer than this to the evaluation time as being on it (BEZT_BINARYSEARCH_THRESH):
+KEY_TIME_THRESHOLD = 0.0001
+
+def KeysData(data):
+	"""Returns interleaved (time, value) data as contiguous float32 array (without copying if it is one already)."""
+	return numpy.ascontiguousarray(data, dtype=numpy.float32).reshape(-1)
+
+def KeysLists(times, values):
+	"""Returns interleaved (time, value) data as expected by AddKeysList_*, one per column of values.
+	The data are contiguous float32 arrays, so foreach_set can copy them as they are (no Python lists)."""
+	values = numpy.asarray(values)
+	if values.ndim < 2:
+		return numpy.column_stack((times, values)).astype(numpy.float32).ravel()
+	keys = numpy.empty((values.shape[1], len(times), 2), dtype=numpy.float32)
+	keys[:, :, 0] = times
+	keys[:, :, 1] = values.T
+	return tuple(keys[i].ravel() for i in range(values.shape[1]))
+
+def BezierHandles(data):
+	"""Returns interleaved (x, y) left and right handles as contiguous float32 arrays for the interleaved (time, value)
+	data of keys sorted by time, like Blender computes them for AUTO_CLAMPED handles (the default for added key frames)
+	on a curve without auto smoothing and with constant extrapolation."""
+	keys = KeysData(data).reshape((-1, 2))
+	count = len(keys)
+	left = keys.copy()
+	right = keys.copy()
+	if count < 2:
+		return left.ravel(), right.ravel()
+
+	# Single precision, like Blender:
+	x = keys[:, 0].copy()
+	y = keys[:, 1].copy()
+
+	# Neighbours, mirrored at the ends:
+	prevX = numpy.concatenate(([2.0 * x[0] - x[1]], x[:-1]))
+	prevY = numpy.concatenate(([2.0 * y[0] - y[1]], y[:-1]))
+	nextX = numpy.concatenate((x[1:], [2.0 * x[-1] - x[-2]]))
+	nextY = numpy.concatenate((y[1:], [2.0 * y[-1] - y[-2]]))
+
+	lengthA = x - prevX
+	lengthB = nextX - x
+	lengthA[0.0 == lengthA] = 1.0
+	lengthB[0.0 == lengthB] = 1.0
+	tangentX = (nextX - x) / lengthB + (x - prevX) / lengthA
+	tangentY = (nextY - y) / lengthB + (y - prevY) / lengthA
+	length = tangentX * numpy.float32(2.5614)
+	lengthA = numpy.minimum(lengthA, 5.0 * lengthB)
+	lengthB = numpy.minimum(lengthB, 5.0 * lengthA)
+	valid = 0.0 != length
+	length[~valid] = 1.0
+	factorA = numpy.where(valid, lengthA / length, 0.0)
+	factorB = numpy.where(valid, lengthB / length, 0.0)
+	leftX = x - tangentX * factorA
+	leftY = y - tangentY * factorA
+	rightX = x + tangentX * factorB
+	rightY = y + tangentY * factorB
+
+	# Clamp inner handles to the neighbours' values, flat at extrema:
+	diffA = prevY - y
+	diffB = nextY - y
+	inner = valid.copy()
+	inner[0] = inner[-1] = False
+	rising = diffA <= 0.0
+	extremum = (rising & (diffB <= 0.0)) | ((0.0 <= diffA) & (0.0 <= diffB))
+	leftViolate = inner & (extremum | numpy.where(rising, leftY < prevY, prevY < leftY))
+	rightViolate = inner & (extremum | numpy.where(rising, nextY < rightY, rightY < nextY))
+	leftY = numpy.where(leftViolate, numpy.where(extremum, y, prevY), leftY)
+	rightY = numpy.where(rightViolate, numpy.where(extremum, y, nextY), rightY)
+
+	# Keep the handles aligned, the violating left one wins:
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		alignedRightY = y + (y - leftY) / (leftX - x) * (x - rightX)
+		alignedLeftY = y + (y - rightY) / (x - rightX) * (leftX - x)
+	rightY = numpy.where(leftViolate, alignedRightY, rightY)
+	leftY = numpy.where(rightViolate & ~leftViolate, alignedLeftY, leftY)
+
+	# Flat ends:
+	leftY[[0, -1]] = y[[0, -1]]
+	rightY[[0, -1]] = y[[0, -1]]
+
+	left[:, 0] = leftX
+	left[:, 1] = leftY
+	right[:, 0] = rightX
+	right[:, 1] = rightY
+	return left.ravel(), right.ravel()
+
+def EvaluateBezier(keys, handlesLeft, handlesRight, times):
+	"""Returns the values at the (M) times of the Bezier curve through the (N, 2) keys (sorted by time) with the (N, 2) handles.
+	Handles overlapping in time are scaled down like Blender does (BKE_fcurve_correct_bezpart)."""
+	keys = numpy.asarray(keys, dtype=numpy.float64)
+	handlesLeft = numpy.asarray(handlesLeft, dtype=numpy.float64)
+	handlesRight = numpy.asarray(handlesRight, dtype=numpy.float64)
+	times = numpy.asarray(times, dtype=numpy.float64)
+	if len(keys) < 2:
+		return numpy.full(len(times), keys[0, 1] if 0 < len(keys) else 0.0)
+
+	segment = numpy.clip(numpy.searchsorted(keys[:, 0], times, 'right') - 1, 0, len(keys) - 2)
+	x0, y0 = keys[segment].T
+	x1, y1 = handlesRight[segment].T
+	x2, y2 = handlesLeft[segment + 1].T
+	x3, y3 = keys[segment + 1].T
+
+	lengthA = numpy.abs(x0 - x1)
+	lengthB = numpy.abs(x3 - x2)
+	lengths = lengthA + lengthB
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		factor = numpy.where(x3 - x0 < lengths, (x3 - x0) / lengths, 1.0)
+	x1 = x0 + (x1 - x0) * factor
+	y1 = y0 + (y1 - y0) * factor
+	x2 = x3 + (x2 - x3) * factor
+	y2 = y3 + (y2 - y3) * factor
+
+	# Time is monotonic within the corrected segments, find the curve parameter by bisection:
+	t = numpy.clip(times, x0, x3)
+	low = numpy.zeros(len(times))
+	high = numpy.ones(len(times))
+	for _ in range(40):
+		u = 0.5 * (low + high)
+		v = 1.0 - u
+		before = v * v * v * x0 + 3.0 * v * u * (v * x1 + u * x2) + u * u * u * x3 < t
+		low = numpy.where(before, u, low)
+		high = numpy.where(before, high, u)
+	u = 0.5 * (low + high)
+	v = 1.0 - u
+	return v * v * v * y0 + 3.0 * v * u * (v * y1 + u * y2) + u * u * u * y3
+
+def GetBezierSegmentCounts(keys, handlesLeft, handlesRight, tolerance):
+	"""Returns for each Bezier segment between the (N, 2) keys the number of equal parts straight lines stay within tolerance of it.
+	Uses the flatness bound 3/4 * max(|P0 - 2 P1 + P2|, |P1 - 2 P2 + P3|) / n^2 on the values, at most one part per frame."""
+	p0 = keys[:-1, 1]
+	p1 = handlesRight[:-1, 1]
+	p2 = handlesLeft[1:, 1]
+	p3 = keys[1:, 1]
+	flatness = 0.75 * numpy.maximum(numpy.abs(p0 - 2.0 * p1 + p2), numpy.abs(p1 - 2.0 * p2 + p3))
+	perFrame = numpy.maximum(1.0, numpy.ceil(keys[1:, 0] - keys[:-1, 0]))
+	if 0.0 == tolerance:
+		return perFrame.astype(numpy.int64)
+	return numpy.clip(numpy.ceil(numpy.sqrt(flatness / tolerance)), 1.0, perFrame).astype(numpy.int64)
+
+def GetSegmentFrames(times, parts, holds):
+	"""Returns the frames within the segments between the (N) sorted key times, splitting segment i into parts[i] equal parts.
+	The (N - 1) holds (i.e. CONSTANT segments) get a frame at the last whole frame before their end (if after their start),
+	so straight lines between the frames (as CAM files are read) only ramp after it, like with a row every frame."""
+	frames = [numpy.maximum(times[:-1][holds], numpy.ceil(times[1:][holds] - KEY_TIME_THRESHOLD) - 1.0)]
+	inner = parts - 1
+	if 0 < inner.sum():
+		segment = numpy.repeat(numpy.arange(len(times) - 1), inner)
+		part = numpy.arange(len(segment)) - numpy.repeat(numpy.cumsum(inner) - inner, inner) + 1
+		frames.append(times[segment] + (times[segment + 1] - times[segment]) * part / parts[segment])
+	return numpy.concatenate(frames)
+
+def RemoveRedundantKeys(times, values, interpolation):
+	"""Removes keys from a (N) channel that don't change the animation:
+	For CONSTANT interpolation keys with the same value as the key before, otherwise keys with the same
+	value as the keys before and after. Constant channels are reduced to their first key.
+	Values are compared as stored in key frames (single precision)."""
+	times = numpy.asarray(times, dtype=numpy.float64)
+	values = numpy.asarray(values, dtype=numpy.float64)
+	if len(times) < 2:
+		return times, values
+	storedValues = values.astype(numpy.float32)
+	same = storedValues[1:] == storedValues[:-1]
+	if same.all():
+		return times[:1], values[:1]
+	keep = numpy.ones(len(times), dtype=bool)
+	if 'CONSTANT' == interpolation:
+		keep[1:] = ~same
+	else:
+		keep[1:-1] = ~(same[:-1] & same[1:])
+	return times[keep], values[keep]
+
+def GetRotationErrors(rotations, references):
+	"""Angles in radians between (N,4) rotations and (N,4) references."""
+	dots = numpy.abs(numpy.einsum('ij,ij->i', rotations, references))
+	lengths = numpy.linalg.norm(rotations, axis=1) * numpy.linalg.norm(references, axis=1)
+	lengths[0 == lengths] = 1.0
+	return 2.0 * numpy.arccos(numpy.clip(dots / lengths, 0.0, 1.0))
+
+def GetBezierErrors(times, values, keep, isRotation):
+	"""Returns the errors of the keys that are not kept against the Bezier curves through the kept keys,
+	with the handles BezierHandles computes for them."""
+	kept = numpy.flatnonzero(keep)
+	dropped = numpy.flatnonzero(~keep)
+	columns = values.reshape((len(times), -1))
+	interpolated = numpy.empty((len(dropped), columns.shape[1]))
+	for i in range(columns.shape[1]):
+		data = KeysData(numpy.column_stack((times[kept], columns[kept, i])))
+		left, right = BezierHandles(data)
+		interpolated[:, i] = EvaluateBezier(data.reshape((-1, 2)), left.reshape((-1, 2)), right.reshape((-1, 2)), times[dropped])
+	if isRotation:
+		return GetRotationErrors(values[dropped], interpolated)
+	return numpy.abs(columns[dropped, 0] - interpolated[:, 0])
+
+def SimplifyKeysMask(times, values, tolerance, interpolation, isRotation):
+	"""Returns which keys to keep so the animation stays within tolerance and the maximum error.
+
+	For CONSTANT interpolation a key is kept when it differs more than tolerance from the last kept key,
+	otherwise Ramer-Douglas-Peucker is used on the linear interpolation between the kept keys.
+	For BEZIER interpolation keys are then added until the Bezier curves through the kept keys
+	(with the handles BezierHandles computes) stay within tolerance, too.
+	The error is the absolute difference for (N) values and the angle in radians for (N,4) rotations."""
+	count = len(times)
+	keep = numpy.zeros(count, dtype=bool)
+	if count < 3:
+		keep[:] = True
+		return keep, 0.0
+
+	keep[0] = True
+	keep[-1] = True
+	maxError = 0.0
+
+	if 'CONSTANT' == interpolation:
+		# Sequential, since each key is compared to the last kept one:
+		rows = values.tolist()
+		last = rows[0]
+		if isRotation:
+			lengths = numpy.linalg.norm(values, axis=1).tolist()
+			lastLength = lengths[0]
+			minCos = math.cos(0.5 * tolerance)
+			minDot = 1.0
+			for i in range(1, count - 1):
+				row = rows[i]
+				dot = abs(row[0] * last[0] + row[1] * last[1] + row[2] * last[2] + row[3] * last[3]) / (lengths[i] * lastLength or 1.0)
+				if dot < minCos:
+					keep[i] = True
+					last = row
+					lastLength = lengths[i]
+				elif dot < minDot:
+					minDot = dot
+			return keep, 2.0 * math.acos(min(minDot, 1.0))
+		for i in range(1, count - 1):
+			error = abs(rows[i] - last)
+			if tolerance < error:
+				keep[i] = True
+				last = rows[i]
+			elif maxError < error:
+				maxError = error
+		return keep, maxError
+
+	# Split all segments that exceed the tolerance at their worst key at once,
+	# only the keys of segments that got split need to be looked at again:
+	active = numpy.arange(1, count - 1)
+	while 0 < len(active):
+		kept = numpy.flatnonzero(keep)
+		segments = numpy.searchsorted(kept, active) - 1
+		a = kept[segments]
+		b = kept[segments + 1]
+		factors = (times[active] - times[a]) / (times[b] - times[a])
+		if isRotation:
+			interpolated = values[a] + (values[b] - values[a]) * factors[:, numpy.newaxis]
+			errors = GetRotationErrors(values[active], interpolated)
+		else:
+			errors = numpy.abs(values[active] - (values[a] + (values[b] - values[a]) * factors))
+		starts = numpy.flatnonzero(numpy.concatenate(([True], segments[1:] != segments[:-1])))
+		segmentErrors = numpy.repeat(numpy.maximum.reduceat(errors, starts), numpy.diff(numpy.append(starts, len(active))))
+		exceeding = tolerance < segmentErrors
+		maxError = max(maxError, float(errors[~exceeding].max(initial=0.0)))
+		worst = numpy.flatnonzero(exceeding & (errors == segmentErrors))
+		worst = worst[numpy.unique(segments[worst], return_index=True)[1]]
+		keep[active[worst]] = True
+		active = active[exceeding & ~keep[active]]
+
+	if 'BEZIER' == interpolation:
+		# The handles depend on the neighbouring kept keys, so re-check all segments after adding
+		# the worst key of each one that leaves the tolerance:
+		while not keep.all():
+			errors = GetBezierErrors(times, values, keep, isRotation)
+			segments = numpy.searchsorted(numpy.flatnonzero(keep), numpy.flatnonzero(~keep)) - 1
+			starts = numpy.flatnonzero(numpy.concatenate(([True], segments[1:] != segments[:-1])))
+			segmentErrors = numpy.repeat(numpy.maximum.reduceat(errors, starts), numpy.diff(numpy.append(starts, len(errors))))
+			exceeding = tolerance < segmentErrors
+			if not exceeding.any():
+				return keep, float(errors.max())
+			worst = numpy.flatnonzero(exceeding & (errors == segmentErrors))
+			worst = worst[numpy.unique(segments[worst], return_index=True)[1]]
+			keep[numpy.flatnonzero(~keep)[worst]] = True
+		return keep, 0.0
+
+	return keep, maxError
@@ -2,6 +2,11 @@ import mathutils
 import math
 import bpy
 
+import numpy
+
+from . import agr_reader
+from .keyframes import KeysData, KeysLists, BezierHandles, EvaluateBezier, GetBezierSegmentCounts, GetSegmentFrames, KEY_TIME_THRESHOLD, RemoveRedundantKeys, GetRotationErrors, GetBezierErrors, SimplifyKeysMask
+
 NEWER_THAN_290 = bpy.app.version >= (2, 90, 0)
 NEWER_THAN_440 = bpy.app.version >= (4, 4, 0)
 
@@ -23,6 +28,66 @@ class QAngle:
 		 
 		return qYawZ @ qPitchY @ qRollX
 
+# Batch coordinate conversions for (N,3) origins / angles and (N) field of views into arrays computed in one go
+# (see agr_reader), giving the same values as the per sample code (QAngle, mathutils).
+
+BLENDER_CAM_UP_QUAT = mathutils.Quaternion((math.cos(0.5 * math.radians(90.0)), math.sin(0.5* math.radians(90.0)), 0.0, 0.0))
+
+def ValveToBlender_Locations(origins, globalScale):
+	"""Quake (x, y, z) origins to Blender locations, scaled by globalScale."""
+	return agr_reader.ValveToBlenderLocations(origins, globalScale)
+
+def QAngles_ToQuaternions(angles):
+	"""(pitch, yaw, roll) angles in degrees to (w, x, y, z) quaternions, like QAngle.to_quaternion."""
+	return agr_reader.QAnglesToQuaternions(angles)
+
+def QAngles_ToCameraQuaternions(angles):
+	"""Like QAngles_ToQuaternions, but for cameras (rotated by BLENDER_CAM_UP_QUAT, Blender cameras look down -Z)."""
+	return agr_reader.QuaternionsMultiply(agr_reader.QAnglesToQuaternions(angles), BLENDER_CAM_UP_QUAT)
+
+def AlienSwarm_FovScaling(width, height, fovs):
+	"""Scales the field of views in degrees from 4:3 to the width:height aspect ratio (like Alien Swarm engine does)."""
+	if 0 == height:
+		return fovs
+	engineAspectRatio = width / height
+	defaultAscpectRatio = 4.0 / 3.0
+	ratio = engineAspectRatio / defaultAscpectRatio
+	return 2.0 * numpy.degrees(numpy.arctan(ratio * numpy.tan(numpy.radians(0.5 * numpy.asarray(fovs, dtype=numpy.float64)))))
+
+def Fovs_ToLenses(fovs, sensorWidth):
+	"""Horizontal field of views in degrees to lenses (focal lengths) for the camera's sensor width."""
+	return agr_reader.FovsToLenses(numpy.asarray(fovs, dtype=numpy.float64), sensorWidth)
+
+def ValveToBlender_Cameras(origins, angles, fovs, globalScale, sensorWidth):
+	"""Returns locations, rotations and lenses for camera origins, angles and field of views, see above."""
+	return ValveToBlender_Locations(origins, globalScale), QAngles_ToCameraQuaternions(angles), Fovs_ToLenses(fovs, sensorWidth)
+
+def ReadColumns(file, columns):
+	"""Reads the remaining lines of the text file into a (N, columns) float64 array, stopping at the first line with
+	less than columns whitespace separated words like reading lines one by one would, further words are ignored."""
+	lines = file.read().splitlines()
+	count = len(lines)
+	while 0 < count and 0 == len(lines[count - 1].split()):
+		count -= 1
+	if 0 == count:
+		return numpy.empty((0, columns), dtype=numpy.float64)
+
+	# Fast path for the usual files (exactly columns numbers per line, no blank lines in between):
+	try:
+		values = numpy.loadtxt(lines[:count], dtype=numpy.float64, comments=None, ndmin=2)
+		if values.shape == (count, columns):
+			return values
+	except ValueError:
+		pass
+
+	rows = []
+	for line in lines:
+		words = line.split()
+		if len(words) < columns:
+			break
+		rows.append(words[:columns])
+	return numpy.array(rows, dtype=numpy.float64).reshape((-1, columns))
+
 def GetInterKeyRange(lastTime, time):
 	loF = lastTime
 	lo = int(math.ceil(loF))
@@ -55,18 +120,41 @@ def AddKey_Value(interKey, keyframe_points, time, value):
 	item.co = [time, value]
 	item.interpolation = 'CONSTANT'
 
+# Interpolation enum value -> int32 array to slice for foreach_set, grown as needed:
+INTERPOLATION_ARRAYS = {}
+
+def GetInterpolationArray(interpolation, count):
+	"""Returns a (shared, read only) contiguous int32 array of count interpolation enum values."""
+	array = INTERPOLATION_ARRAYS.get(interpolation, None)
+	if array is None or len(array) < count:
+		value = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items[interpolation].value
+		array = numpy.full(max(count, 1024, 0 if array is None else 2 * len(array)), value, dtype=numpy.int32)
+		array.flags.writeable = False
+		INTERPOLATION_ARRAYS[interpolation] = array
+	return array[:count]
+
+def SetKeysInterpolation(interpolation, keyframe_points):
+	if NEWER_THAN_290:
+		keyframe_points.foreach_set("interpolation", GetInterpolationArray(interpolation, len(keyframe_points)))
+	else:
+		for item in keyframe_points:
+			item.interpolation = interpolation
+
 def AddKeysList_Value(interpolation, keyframe_points, data):
+	data = KeysData(data)
 	if len(data) < 2:
 		return
 	keyframe_points.add(len(data) // 2)
 	keyframe_points.foreach_set("co", data)
 	if keyframe_points[0].interpolation != interpolation:
-		if NEWER_THAN_290:
-			interpolation_value = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items[interpolation].value
-			keyframe_points.foreach_set("interpolation", [interpolation_value] * len(keyframe_points))
-		else:
-			for item in keyframe_points:
-				item.interpolation = interpolation
+		SetKeysInterpolation(interpolation, keyframe_points)
+
+def SetKeysHandles(keyframe_points, data):
+	"""Sets the handles of the keyframe_points (only holding the sorted keys of data) computed by BezierHandles,
+	so the curve doesn't need update()."""
+	left, right = BezierHandles(data)
+	keyframe_points.foreach_set("handle_left", left)
+	keyframe_points.foreach_set("handle_right", right)
 
 def AppendInterKeys_Value(time, value, data):
 	if 0 == len(data):
@@ -96,14 +184,10 @@ def AddKey_Visible(interKey, keyframe_points_hide_render, time, visible):
 	item.interpolation = 'CONSTANT'
 
 def AddKeysList_Visible(keyframe_points, data):
+	data = KeysData(data)
 	keyframe_points.add(len(data) // 2)
 	keyframe_points.foreach_set("co", data)
-	if NEWER_THAN_290:
-		interpolation_value = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items['CONSTANT'].value
-		keyframe_points.foreach_set("interpolation", [interpolation_value] * len(keyframe_points))
-	else:
-		for item in keyframe_points:
-			item.interpolation = 'CONSTANT'
+	SetKeysInterpolation('CONSTANT', keyframe_points)
 
 def AppendInterKeys_Visible(time, invisible, data):
 	if 0 == len(data):
@@ -152,25 +236,13 @@ def AddKey_Location(interKey, keyframe_points_location_x, keyframe_points_locati
 def AddKeysList_Location(interpolation, keyframe_points_x, keyframe_points_y, keyframe_points_z, data_x, data_y, data_z):
 	if len(data_x) < 2:
 		return
-	keyframe_points_x.add(len(data_x) // 2)
-	keyframe_points_x.foreach_set("co", data_x)
-	keyframe_points_y.add(len(data_y) // 2)
-	keyframe_points_y.foreach_set("co", data_y)
-	keyframe_points_z.add(len(data_z) // 2)
-	keyframe_points_z.foreach_set("co", data_z)
+	for keyframe_points, data in ((keyframe_points_x, data_x), (keyframe_points_y, data_y), (keyframe_points_z, data_z)):
+		data = KeysData(data)
+		keyframe_points.add(len(data) // 2)
+		keyframe_points.foreach_set("co", data)
 	if keyframe_points_x[0].interpolation != interpolation:
-		if NEWER_THAN_290:
-			interpolation_value = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items[interpolation].value
-			keyframe_points_x.foreach_set("interpolation", [interpolation_value] * len(keyframe_points_x))
-			keyframe_points_y.foreach_set("interpolation", [interpolation_value] * len(keyframe_points_y))
-			keyframe_points_z.foreach_set("interpolation", [interpolation_value] * len(keyframe_points_z))
-		else:
-			for item in keyframe_points_x:
-				item.interpolation = interpolation
-			for item in keyframe_points_y:
-				item.interpolation = interpolation
-			for item in keyframe_points_z:
-				item.interpolation = interpolation
+		for keyframe_points in (keyframe_points_x, keyframe_points_y, keyframe_points_z):
+			SetKeysInterpolation(interpolation, keyframe_points)
 
 def AppendInterKeys_Location(time, location, data_x, data_y, data_z):
 	if 0 == len(data_x):
@@ -237,30 +309,13 @@ def AddKey_Rotation(interKey, keyframe_points_rotation_quaternion_w, keyframe_po
 def AddKeysList_Rotation(interpolation, keyframe_points_w, keyframe_points_x, keyframe_points_y, keyframe_points_z, data_w, data_x, data_y, data_z):
 	if len(data_w) < 2:
 		return
-	keyframe_points_w.add(len(data_w) // 2)
-	keyframe_points_w.foreach_set("co", data_w)
-	keyframe_points_x.add(len(data_x) // 2)
-	keyframe_points_x.foreach_set("co", data_x)
-	keyframe_points_y.add(len(data_y) // 2)
-	keyframe_points_y.foreach_set("co", data_y)
-	keyframe_points_z.add(len(data_z) // 2)
-	keyframe_points_z.foreach_set("co", data_z)
+	for keyframe_points, data in ((keyframe_points_w, data_w), (keyframe_points_x, data_x), (keyframe_points_y, data_y), (keyframe_points_z, data_z)):
+		data = KeysData(data)
+		keyframe_points.add(len(data) // 2)
+		keyframe_points.foreach_set("co", data)
 	if keyframe_points_w[0].interpolation != interpolation:
-		if NEWER_THAN_290:
-			interpolation_value = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items[interpolation].value
-			keyframe_points_w.foreach_set("interpolation", [interpolation_value] * len(keyframe_points_w))
-			keyframe_points_x.foreach_set("interpolation", [interpolation_value] * len(keyframe_points_x))
-			keyframe_points_y.foreach_set("interpolation", [interpolation_value] * len(keyframe_points_y))
-			keyframe_points_z.foreach_set("interpolation", [interpolation_value] * len(keyframe_points_z))
-		else:
-			for item in keyframe_points_w:
-				item.interpolation = interpolation
-			for item in keyframe_points_x:
-				item.interpolation = interpolation
-			for item in keyframe_points_y:
-				item.interpolation = interpolation
-			for item in keyframe_points_z:
-				item.interpolation = interpolation
+		for keyframe_points in (keyframe_points_w, keyframe_points_x, keyframe_points_y, keyframe_points_z):
+			SetKeysInterpolation(interpolation, keyframe_points)
 
 def AppendInterKeys_Rotation(time, rotation, data_w, data_x, data_y, data_z):
 	if 0 == len(data_w):
@@ -277,3 +332,441 @@ def AppendInterKeys_Rotation(time, rotation, data_w, data_x, data_y, data_z):
 		data_x.extend((interTime, interRotation.x))
 		data_y.extend((interTime, interRotation.y))
 		data_z.extend((interTime, interRotation.z))
+
+# Channel-level (batch) versions of the above, times are (N) arrays and values (N) or (N,C) arrays:
+
+def ShortestPath_Rotations(rotations):
+	"""Flips the signs of the (N,4) quaternions, so each one is in the same hemisphere as the one before."""
+	rotations = numpy.asarray(rotations, dtype=numpy.float64)
+	if len(rotations) < 2:
+		return rotations.copy()
+	dots = numpy.einsum('ij,ij->i', rotations[:-1], rotations[1:])
+	signs = numpy.cumprod(numpy.concatenate(([1.0], numpy.where(dots < 0, -1.0, 1.0))))
+	return rotations * signs[:, numpy.newaxis]
+
+def GetInterKeyRanges(times):
+	"""Same as GetInterKeyRange for every two consecutive times.
+	Returns the inter key times, the index of the key they follow and the interpolation factor."""
+	times = numpy.asarray(times, dtype=numpy.float64)
+	lastTimes = times[:-1]
+	nextTimes = times[1:]
+	lo = numpy.ceil(lastTimes)
+	lo[lo == lastTimes] += 1
+	hi = numpy.floor(nextTimes)
+	hi[hi == nextTimes] -= 1
+	counts = numpy.maximum(hi - lo + 1, 0).astype(numpy.int64)
+	total = int(counts.sum())
+	indices = numpy.repeat(numpy.arange(len(counts)), counts)
+	offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+	interTimes = lo[indices] + offsets
+	factors = (interTimes - lastTimes[indices]) / (nextTimes[indices] - lastTimes[indices])
+	return interTimes, indices, factors
+
+def MergeInterKeys(times, values, interTimes, indices, interValues):
+	"""Returns times and values with the inter keys inserted after the keys they follow."""
+	count = len(times) + len(interTimes)
+	isKey = numpy.ones(count, dtype=bool)
+	isKey[indices + numpy.arange(len(indices)) + 1] = False
+	mergedTimes = numpy.empty(count, dtype=numpy.float64)
+	mergedTimes[isKey] = times
+	mergedTimes[~isKey] = interTimes
+	mergedValues = numpy.empty((count,) + values.shape[1:], dtype=numpy.float64)
+	mergedValues[isKey] = values
+	mergedValues[~isKey] = interValues
+	return mergedTimes, mergedValues
+
+def InterKeys_Value(times, values):
+	"""Batch version of AppendInterKeys_Value / AppendInterKeys_Location (linear interpolation)."""
+	times = numpy.asarray(times, dtype=numpy.float64)
+	values = numpy.asarray(values, dtype=numpy.float64)
+	if len(times) < 2:
+		return times, values
+	interTimes, indices, factors = GetInterKeyRanges(times)
+	if values.ndim > 1:
+		factors = factors[:, numpy.newaxis]
+	interValues = values[indices] * (1.0 - factors) + values[indices + 1] * factors
+	return MergeInterKeys(times, values, interTimes, indices, interValues)
+
+def InterKeys_Visible(times, invisible):
+	"""Batch version of AppendInterKeys_Visible, invisible is 0 for visible and 1 for not visible."""
+	times = numpy.asarray(times, dtype=numpy.float64)
+	invisible = numpy.asarray(invisible, dtype=numpy.float64)
+	if len(times) < 2:
+		return times, invisible
+	interTimes, indices, factors = GetInterKeyRanges(times)
+	interValues = numpy.where((0 == invisible[indices]) & (0 == invisible[indices + 1]), 0.0, 1.0)
+	return MergeInterKeys(times, invisible, interTimes, indices, interValues)
+
+def InterKeys_Rotation(times, rotations):
+	"""Batch version of AppendInterKeys_Rotation (spherical interpolation like Quaternion.slerp)."""
+	times = numpy.asarray(times, dtype=numpy.float64)
+	rotations = numpy.asarray(rotations, dtype=numpy.float64)
+	if len(times) < 2:
+		return times, rotations
+	interTimes, indices, factors = GetInterKeyRanges(times)
+	a = rotations[indices]
+	b = rotations[indices + 1]
+	cosom = numpy.einsum('ij,ij->i', a, b)
+	b = numpy.where((cosom < 0)[:, numpy.newaxis], -b, b)
+	cosom = numpy.abs(cosom)
+	useSlerp = 0.0001 < (1.0 - cosom)
+	omega = numpy.arccos(numpy.clip(cosom, -1.0, 1.0))
+	sinom = numpy.where(useSlerp, numpy.sin(omega), 1.0)
+	sc1 = numpy.where(useSlerp, numpy.sin((1.0 - factors) * omega) / sinom, 1.0 - factors)
+	sc2 = numpy.where(useSlerp, numpy.sin(factors * omega) / sinom, factors)
+	interValues = a * sc1[:, numpy.newaxis] + b * sc2[:, numpy.newaxis]
+	return MergeInterKeys(times, rotations, interTimes, indices, interValues)
+
+# Bone channels closer than this to their rest value count as not animated:
+REST_VALUE_EPSILON = 1e-6
+
+class KeyframeWriter:
+	"""Adds channels of keys (as arrays) to F-curves, optionally removing redundant keys and simplifying them.
+
+	writeHandles: Write the Bezier handles of new curves directly (see BezierHandles), so UpdateCurves doesn't need to update them."""
+
+	def __init__(self, interpolation, removeRedundant = False, simplify = False, tolerance = 0.0, angleTolerance = 0.0, writeHandles = False):
+		self.interpolation = interpolation
+		self.removeRedundant = removeRedundant
+		self.simplify = simplify
+		self.tolerance = tolerance
+		self.angleTolerance = angleTolerance
+		self.writeHandles = writeHandles
+		self.updatedCurves = set()
+		self.keyCount = 0
+		self.keyCountWritten = 0
+		self.report = []
+
+	def AddKeys(self, owner, curves, times, values, interpolation = None, restValues = None, isRotation = False, simplify = True):
+		"""Adds keys for (N) times and (N,len(curves)) values to the curves.
+
+		owner: Name of the curves' owner for the report.
+		restValues: If given and removeRedundant is set, curves that are constantly at their rest value get no keys.
+		isRotation: If the values are quaternions, these are simplified together by angle.
+		simplify: If False the keys are not simplified (i.e. for visibility)."""
+
+		if interpolation is None:
+			interpolation = self.interpolation
+
+		simplify = simplify and self.simplify
+
+		times = numpy.asarray(times, dtype=numpy.float64)
+		values = numpy.asarray(values, dtype=numpy.float64).reshape((len(times), len(curves)))
+
+		keyCount = len(times) * len(curves)
+		keyCountWritten = 0
+		maxError = 0.0
+
+		if simplify and isRotation:
+			keep, maxError = SimplifyKeysMask(times, values, math.radians(self.angleTolerance), interpolation, True)
+			maxError = math.degrees(maxError)
+			times = times[keep]
+			values = values[keep]
+
+		for i, curve in enumerate(curves):
+			curveTimes = times
+			curveValues = values[:, i]
+
+			if self.removeRedundant:
+				curveTimes, curveValues = RemoveRedundantKeys(curveTimes, curveValues, interpolation)
+				if (restValues is not None) and (1 == len(curveValues)) and abs(curveValues[0] - restValues[i]) <= REST_VALUE_EPSILON:
+					# Not animated, remove the curve in UpdateCurves.
+					continue
+
+			if simplify and not isRotation:
+				keep, error = SimplifyKeysMask(curveTimes, curveValues, self.tolerance, interpolation, False)
+				maxError = max(maxError, error)
+				curveTimes = curveTimes[keep]
+				curveValues = curveValues[keep]
+
+			keyCountWritten += len(curveTimes)
+
+			# Handles can only be computed here for new curves with the default handle settings:
+			writeHandles = self.writeHandles and 0 == len(curve.keyframe_points) and 'NONE' == curve.auto_smoothing and 'CONSTANT' == curve.extrapolation
+
+			data = KeysLists(curveTimes, curveValues)
+			AddKeysList_Value(interpolation, curve.keyframe_points, data)
+
+			if writeHandles:
+				SetKeysHandles(curve.keyframe_points, data)
+				self.updatedCurves.add(curve)
+
+		self.keyCount += keyCount
+		self.keyCountWritten += keyCountWritten
+
+		if simplify:
+			self.report.append(("%s %s" % (owner, curves[0].data_path), keyCountWritten, keyCount, maxError, isRotation))
+
+	def UpdateCurves(self, curves):
+		for curve in curves:
+			if self.removeRedundant and 0 == len(curve.keyframe_points):
+				curve.id_data.fcurves.remove(curve)
+			elif curve in self.updatedCurves:
+				# Keys are sorted and handles written already.
+				self.updatedCurves.discard(curve)
+			else:
+				curve.update()
+
+	def PrintReport(self, prefix):
+		"""Prints the kept keys and maximum error of each simplified channel."""
+		for name, keyCountWritten, keyCount, maxError, isRotation in self.report:
+			print("%s Simplified %s: kept %i of %i keys, max error %f%s." % (prefix, name, keyCountWritten, keyCount, maxError, " deg" if isRotation else ""))
+
+# Evaluating objects' animation without scene.frame_set (which evaluates the whole scene for every frame):
+
+def GetActionCurves(animation_data):
+	"""Returns the F-curves of the action (slot) assigned to the animation data, if any."""
+	if animation_data is None or animation_data.action is None:
+		return []
+	action = animation_data.action
+	if NEWER_THAN_440:
+		from bpy_extras import anim_utils
+		channelbag = anim_utils.action_get_channelbag_for_slot(action, animation_data.action_slot)
+		return [] if channelbag is None else list(channelbag.fcurves)
+	return list(action.fcurves)
+
+def GetAnimationDataError(animation_data):
+	"""Returns why the animation data doesn't just apply its action's F-curves, None if it does."""
+	if animation_data is None:
+		return None
+	if 0 < len(animation_data.drivers):
+		return "has drivers"
+	if 0 < len(animation_data.nla_tracks) or animation_data.use_tweak_mode:
+		return "uses NLA"
+	if animation_data.action is not None and (1.0 != animation_data.action_influence or 'REPLACE' != animation_data.action_blend_type):
+		return "blends its action"
+	for fcurve in GetActionCurves(animation_data):
+		if fcurve.mute or (fcurve.group is not None and fcurve.group.mute):
+			return "has muted F-Curves"
+	return None
+
+def GetDirectEvaluationError(obj):
+	"""Returns why the world matrix (and lens for cameras) of obj can't be evaluated from F-curves directly, None if it can.
+	Supported are objects whose transform only comes from their own action and parent chain."""
+	if 'CAMERA' == obj.type:
+		error = GetAnimationDataError(obj.data.animation_data)
+		if error is not None:
+			return "%s %s" % (obj.data.name, error)
+		for fcurve in GetActionCurves(obj.data.animation_data):
+			if fcurve.data_path in ('angle', 'angle_x', 'angle_y'):
+				return "%s has an animated angle" % obj.data.name
+	while obj is not None:
+		if 0 < len(obj.constraints):
+			return "%s has constraints" % obj.name
+		if obj.rigid_body is not None:
+			return "%s is a rigid body" % obj.name
+		error = GetAnimationDataError(obj.animation_data)
+		if error is not None:
+			return "%s %s" % (obj.name, error)
+		if obj.parent is not None and (obj.parent_type not in ('OBJECT', 'ARMATURE') or 'CURVE' == obj.parent.type):
+			return "%s has an unsupported parent" % obj.name
+		obj = obj.parent
+	return None
+
+def EvaluateFCurve(fcurve, frames):
+	"""Returns the values of the F-curve at the (N) frames.
+	Computed at once for CONSTANT / LINEAR keys without modifiers (like Blender, in single precision),
+	otherwise with fcurve.evaluate."""
+	count = len(fcurve.keyframe_points)
+	if 0 < count and 0 == len(fcurve.modifiers) and 'CONSTANT' == fcurve.extrapolation:
+		keys = numpy.empty(2 * count, dtype=numpy.float32)
+		fcurve.keyframe_points.foreach_get("co", keys)
+		interpolations = numpy.empty(count, dtype=numpy.int32)
+		fcurve.keyframe_points.foreach_get("interpolation", interpolations)
+		constant = GetInterpolationArray('CONSTANT', 1)[0]
+		linear = GetInterpolationArray('LINEAR', 1)[0]
+		segments = interpolations[:-1]
+		if ((constant == segments) | (linear == segments)).all():
+			times = keys[0::2]
+			values = keys[1::2]
+			time = numpy.asarray(frames, dtype=numpy.float32)
+			if 1 == count:
+				return numpy.full(len(time), values[0], dtype=numpy.float64)
+			# The last key before the time or on it (within the threshold, then its value is used as is):
+			key = numpy.clip(numpy.searchsorted(times, time + numpy.float32(KEY_TIME_THRESHOLD), 'left') - 1, 0, count - 1)
+			onKey = numpy.abs(times[key] - time) < numpy.float32(KEY_TIME_THRESHOLD)
+			start = numpy.minimum(key, count - 2)
+			begin = values[start]
+			change = values[start + 1] - begin
+			duration = times[start + 1] - times[start]
+			with numpy.errstate(divide='ignore', invalid='ignore'):
+				result = numpy.where((linear == interpolations[start]) & (0.0 != duration), change * (time - times[start]) / duration + begin, begin)
+			result = numpy.where(onKey, values[key], result)
+			result = numpy.where(time <= times[0], values[0], numpy.where(times[-1] <= time, values[-1], result))
+			return result.astype(numpy.float64)
+	return numpy.array([fcurve.evaluate(frame) for frame in frames], dtype=numpy.float64)
+
+def EvaluateProperty(id, fcurves, dataPath, frames):
+	"""Returns the (N, array length) values of the float (array) property at the frames,
+	from the F-curves animating it and the static value otherwise."""
+	values = numpy.tile(numpy.array(getattr(id, dataPath), dtype=numpy.float64).reshape(-1), (len(frames), 1))
+	for fcurve in fcurves:
+		if dataPath == fcurve.data_path and 0 <= fcurve.array_index < values.shape[1]:
+			values[:, fcurve.array_index] = EvaluateFCurve(fcurve, frames)
+	return values
+
+def EvaluateWorldMatrices(obj, frames):
+	"""Returns the world matrices of obj at the frames from its and its parents' F-curves (see GetDirectEvaluationError),
+	composed like Blender does it."""
+	fcurves = GetActionCurves(obj.animation_data)
+	locations = EvaluateProperty(obj, fcurves, 'location', frames) + EvaluateProperty(obj, fcurves, 'delta_location', frames)
+	scales = EvaluateProperty(obj, fcurves, 'scale', frames) * EvaluateProperty(obj, fcurves, 'delta_scale', frames)
+
+	mode = obj.rotation_mode
+	if 'QUATERNION' == mode:
+		rotations = EvaluateProperty(obj, fcurves, 'rotation_quaternion', frames)
+		deltas = EvaluateProperty(obj, fcurves, 'delta_rotation_quaternion', frames)
+		def ToMatrix(rotation, delta):
+			return mathutils.Quaternion(delta).normalized().to_matrix() @ mathutils.Quaternion(rotation).normalized().to_matrix()
+	elif 'AXIS_ANGLE' == mode:
+		rotations = EvaluateProperty(obj, fcurves, 'rotation_axis_angle', frames)
+		# Blender applies a delta axis angle, too (identity where the Python API doesn't expose it):
+		if hasattr(obj, 'delta_rotation_axis_angle'):
+			deltas = EvaluateProperty(obj, fcurves, 'delta_rotation_axis_angle', frames)
+		else:
+			deltas = numpy.tile([0.0, 0.0, 1.0, 0.0], (len(frames), 1))
+		def AxisAngleToMatrix(axisAngle):
+			axis = mathutils.Vector(axisAngle[1:4])
+			if 0.0 == axis.length:
+				return mathutils.Matrix.Identity(3)
+			return mathutils.Matrix.Rotation(axisAngle[0], 3, axis)
+		def ToMatrix(rotation, delta):
+			return AxisAngleToMatrix(delta) @ AxisAngleToMatrix(rotation)
+	else:
+		rotations = EvaluateProperty(obj, fcurves, 'rotation_euler', frames)
+		deltas = EvaluateProperty(obj, fcurves, 'delta_rotation_euler', frames)
+		def ToMatrix(rotation, delta):
+			return mathutils.Euler(delta, mode).to_matrix() @ mathutils.Euler(rotation, mode).to_matrix()
+
+	parents = None
+	if obj.parent is not None:
+		parentInverse = obj.matrix_parent_inverse.copy()
+		parents = [parent @ parentInverse for parent in EvaluateWorldMatrices(obj.parent, frames)]
+
+	matrices = []
+	for i in range(len(frames)):
+		matrix = (ToMatrix(rotations[i], deltas[i]) @ mathutils.Matrix.Diagonal(scales[i])).to_4x4()
+		matrix.translation = locations[i]
+		matrices.append(matrix if parents is None else parents[i] @ matrix)
+	return matrices
+
+def GetCameraFov(lens, sensorWidth):
+	"""Horizontal field of view in degrees."""
+	return math.degrees(2.0 * math.atan((sensorWidth / lens) / 2.0))
+
+def EvaluateCameraFovs(cam, frames):
+	"""Returns the field of views of the camera data at the frames from its F-curves (see GetDirectEvaluationError)."""
+	fcurves = GetActionCurves(cam.animation_data)
+	lenses = EvaluateProperty(cam, fcurves, 'lens', frames)[:, 0]
+	sensorWidths = EvaluateProperty(cam, fcurves, 'sensor_width', frames)[:, 0]
+	return [GetCameraFov(float(numpy.float32(lens)), float(numpy.float32(sensorWidth))) for lens, sensorWidth in zip(lenses, sensorWidths)]
+
+OBJECT_TRANSFORM_PATHS = ('location', 'delta_location', 'rotation_quaternion', 'delta_rotation_quaternion', 'rotation_axis_angle', 'delta_rotation_axis_angle', 'rotation_euler', 'delta_rotation_euler', 'scale', 'delta_scale')
+OBJECT_QUATERNION_PATHS = ('rotation_quaternion', 'delta_rotation_quaternion')
+OBJECT_ANGLE_PATHS = ('rotation_axis_angle', 'delta_rotation_axis_angle', 'rotation_euler', 'delta_rotation_euler')
+CAMERA_LENS_PATHS = ('lens', 'sensor_width')
+
+def GetSampleError(scene, obj):
+	"""Returns why obj can't be evaluated from F-curves directly in the scene, None if it can."""
+	if scene.render.frame_map_old != scene.render.frame_map_new:
+		return "scene uses time remapping"
+	return GetDirectEvaluationError(obj)
+
+def GetTransformCurves(obj):
+	"""Returns the F-curves animating the world matrix (and lens for cameras) of obj."""
+	curves = []
+	if 'CAMERA' == obj.type:
+		curves.extend(fcurve for fcurve in GetActionCurves(obj.data.animation_data) if fcurve.data_path in CAMERA_LENS_PATHS)
+	while obj is not None:
+		curves.extend(fcurve for fcurve in GetActionCurves(obj.animation_data) if fcurve.data_path in OBJECT_TRANSFORM_PATHS)
+		obj = obj.parent
+	return curves
+
+def GetKeyFrames(obj, frameStart, frameEnd, sampleBezier, tolerance, angleTolerance):
+	"""Returns the sorted (fractional) frames from frameStart to frameEnd that describe the animation of obj (see GetTransformCurves):
+	Both ends and the times of the keys, for sampleBezier also frames within BEZIER segments so straight lines between the frames
+	stay within tolerance (Blender units / mm) or angleTolerance (degrees) of them, and the frame before the end of CONSTANT segments.
+	Other (easing) segments are sampled every frame, just like curves with modifiers or extrapolation (from frameStart to frameEnd)."""
+	frames = [numpy.array([frameStart, frameEnd], dtype=numpy.float64)]
+	bezier = GetInterpolationArray('BEZIER', 1)[0]
+	constant = GetInterpolationArray('CONSTANT', 1)[0]
+	linear = GetInterpolationArray('LINEAR', 1)[0]
+
+	for fcurve in GetTransformCurves(obj):
+		count = len(fcurve.keyframe_points)
+		if 0 == count:
+			continue
+		if 0 < len(fcurve.modifiers) or 'CONSTANT' != fcurve.extrapolation:
+			frames.append(numpy.arange(frameStart, frameEnd + 1, dtype=numpy.float64))
+			continue
+
+		keys = numpy.empty(2 * count, dtype=numpy.float32)
+		fcurve.keyframe_points.foreach_get("co", keys)
+		keys = keys.reshape(count, 2).astype(numpy.float64)
+		frames.append(keys[:, 0])
+		if 1 == count:
+			continue
+
+		interpolations = numpy.empty(count, dtype=numpy.int32)
+		fcurve.keyframe_points.foreach_get("interpolation", interpolations)
+		segments = interpolations[:-1]
+
+		parts = numpy.maximum(1.0, numpy.ceil(keys[1:, 0] - keys[:-1, 0])).astype(numpy.int64)
+		parts[(constant == segments) | (linear == segments)] = 1
+		isBezier = bezier == segments
+		if sampleBezier and isBezier.any():
+			handlesLeft = numpy.empty(2 * count, dtype=numpy.float32)
+			fcurve.keyframe_points.foreach_get("handle_left", handlesLeft)
+			handlesRight = numpy.empty(2 * count, dtype=numpy.float32)
+			fcurve.keyframe_points.foreach_get("handle_right", handlesRight)
+			if fcurve.data_path in OBJECT_QUATERNION_PATHS:
+				curveTolerance = 0.5 * math.radians(angleTolerance)
+			elif fcurve.data_path in OBJECT_ANGLE_PATHS:
+				curveTolerance = math.radians(angleTolerance)
+			else:
+				curveTolerance = tolerance
+			parts[isBezier] = GetBezierSegmentCounts(keys, handlesLeft.reshape(count, 2).astype(numpy.float64), handlesRight.reshape(count, 2).astype(numpy.float64), curveTolerance)[isBezier]
+		elif not sampleBezier:
+			parts[isBezier] = 1
+
+		frames.append(GetSegmentFrames(keys[:, 0], parts, constant == segments))
+
+	frames = numpy.concatenate(frames)
+	frames = numpy.unique(frames[(frameStart <= frames) & (frames <= frameEnd)])
+	if 1 < len(frames):
+		# Merge frames Blender would consider the same key time:
+		frames = frames[numpy.concatenate(([True], KEY_TIME_THRESHOLD <= numpy.diff(frames)))]
+	return frames.tolist()
+
+def SampleObjects(scene, objects, frames, prefix):
+	"""Returns (world matrices, field of views in degrees for cameras or None) of the objects at the frames.
+	Objects are evaluated from their F-curves directly where possible, the others in a single pass of
+	scene.frame_set over the (possibly fractional) frames (restoring the current frame after)."""
+	frames = list(frames)
+	samples = [None] * len(objects)
+	pending = []
+
+	for i, obj in enumerate(objects):
+		error = GetSampleError(scene, obj)
+		if error is None:
+			samples[i] = (EvaluateWorldMatrices(obj, frames), EvaluateCameraFovs(obj.data, frames) if 'CAMERA' == obj.type else None)
+		else:
+			print("%s Evaluating %s with frame_set: %s." % (prefix, obj.name, error))
+			samples[i] = ([], [] if 'CAMERA' == obj.type else None)
+			pending.append(i)
+
+	if 0 < len(pending):
+		frame_current = scene.frame_current
+		subframe_current = scene.frame_subframe
+		for frame in frames:
+			wholeFrame = math.floor(frame)
+			scene.frame_set(int(wholeFrame), subframe=frame - wholeFrame)
+			for i in pending:
+				obj = objects[i]
+				matrices, fovs = samples[i]
+				matrices.append(obj.matrix_world.copy())
+				if fovs is not None:
+					fovs.append(GetCameraFov(obj.data.lens, obj.data.sensor_width))
+		scene.frame_set(frame_current, subframe=subframe_current)
+
+	return samples
@@ -0,0 +1,60 @@
+"""Scaling benchmark of the parallel AGR decode (agr_reader.ReadAgrParallel) against the serial one (ReadAgr).
+
+Usage: python benchmarks/bench_agr_parallel.py [file.agr] [--frames N] [--workers 1,2,4,8]
+Without a file a synthetic recording is written to a temporary directory."""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+# Import agr_reader without the (bpy dependent) addon package __init__:
+package = types.ModuleType("advancedfx")
+package.__path__ = [os.path.join(ROOT, "advancedfx")]
+sys.modules["advancedfx"] = package
+
+from advancedfx import agr_reader
+from agr_synthetic import WriteAgr
+
+def Measure(function, repeat):
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		function()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("filepath", nargs="?")
+	parser.add_argument("--frames", type=int, default=6000)
+	parser.add_argument("--workers", default="1,2,4,8")
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--fps", type=float, default=64)
+	parser.add_argument("--interval", type=int, default=64, help="Index interval (recorded frames between checkpoints)")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		filepath = args.filepath
+		if filepath is None:
+			filepath = WriteAgr(os.path.join(directory, "bench.agr"), frames=args.frames)
+
+		size = os.path.getsize(filepath) / 1048576.0
+		index = agr_reader.AgrIndexer(args.interval).Build(filepath)
+		print("%s: %.2f MiB, %i checkpoints, %i CPUs" % (filepath, size, len(index.checkpoints), os.cpu_count() or 1))
+
+		serial = Measure(lambda: agr_reader.ReadAgr(filepath, args.fps, 0.01), args.repeat)
+		print("serial      %8.3f s  %8.2f MiB/s" % (serial, size / serial))
+
+		for workers in (int(value) for value in args.workers.split(",")):
+			elapsed = Measure(lambda: agr_reader.ReadAgrParallel(filepath, args.fps, 0.01, index, workers), args.repeat)
+			print("%2i workers  %8.3f s  %8.2f MiB/s  x%.2f" % (workers, elapsed, size / elapsed, serial / elapsed))
+
+if __name__ == "__main__":
+	main()
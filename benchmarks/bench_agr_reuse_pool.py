@@ -0,0 +1,108 @@
+"""Benchmark of re-using unused AGR objects (agr_reader.EntityReusePool) against the linear scan it replaced,
+for the quadratic case: A burst of short-lived shells / grenades fills the pool with thousands of unused objects,
+then steady spam keeps re-using from it. Both run on the same inputs and must pick the same objects.
+
+Usage: python benchmarks/bench_agr_reuse_pool.py [--quick]"""
+
+import argparse
+import collections
+import math
+import os
+import random
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import agr_reader without the (bpy dependent) addon package __init__:
+package = types.ModuleType("advancedfx")
+package.__path__ = [os.path.join(ROOT, "advancedfx")]
+sys.modules["advancedfx"] = package
+
+from advancedfx import agr_reader
+
+MODELS = ('models/shells/shell_9mm.mdl', 'models/shells/shell_556.mdl', 'models/weapons/w_eq_smokegrenade_thrown.mdl', 'models/weapons/w_eq_flashbang_dropped.mdl')
+SPOTS = ((0, 0), (3000, -2000), (-1500, 800), (5000, 4000))
+
+class LinearReusePool:
+	"""The linear scan over all unused objects the importer used before EntityReusePool."""
+
+	def __init__(self):
+		self.entities = []
+
+	def __len__(self):
+		return len(self.entities)
+
+	def Add(self, entity):
+		self.entities.append(entity)
+
+	def Pop(self, modelName, origin):
+		best = None
+		bestIndex = 0
+		bestLength = 0
+		for index, entity in enumerate(self.entities):
+			if (entity.modelName == modelName) and ((best is None) or entity.lastRenderOrigin is None or math.dist(entity.lastRenderOrigin, origin) < bestLength):
+				best = entity
+				bestLength = 0 if entity.lastRenderOrigin is None else math.dist(entity.lastRenderOrigin, origin)
+				bestIndex = index
+		if best is not None:
+			del self.entities[bestIndex]
+		return best
+
+def Simulate(pool, burst, frames, spawnsPerFrame, lifetime, seed, globalScale = 0.01):
+	"""Returns the object numbers picked for the spawns, the time taken, the number of objects and of unused ones at the end."""
+	rnd = random.Random(seed)
+	parser = agr_reader.AgrParser(64, globalScale)
+	parser.handleToLastEntity = {}
+	parser.unusedEntities = pool
+	parser.entities = []
+	parser.currentTime = 0.0
+	alive = collections.deque()
+	picks = []
+	nextHandle = 1
+
+	def Spawn(frame):
+		nonlocal nextHandle
+		model = rnd.choice(MODELS)
+		x, y = rnd.choice(SPOTS)
+		origin = ((x + rnd.uniform(-1500, 1500)) * globalScale, (y + rnd.uniform(-1500, 1500)) * globalScale, rnd.uniform(0, 300) * globalScale)
+		entity = parser.GetEntity(nextHandle, model, origin)
+		picks.append(entity.objNr)
+		entity.UpdateVisible(parser.currentTime, True)
+		# A few are deleted before their transform is known (no lastRenderOrigin):
+		if rnd.random() < 0.99:
+			entity.UpdateTransform(parser.currentTime, origin, (0.0,) * 6)
+		alive.append((nextHandle, frame))
+		nextHandle += 1
+
+	time_start = time.perf_counter()
+	for i in range(burst):
+		Spawn(0)
+	for frame in range(1, frames):
+		parser.currentTime = float(frame)
+		while alive and (lifetime <= frame - alive[0][1] or 0 == alive[0][1]):
+			parser.HideEntity(alive.popleft()[0])
+		for i in range(spawnsPerFrame):
+			Spawn(frame)
+	return picks, time.perf_counter() - time_start, len(parser.entities), len(parser.unusedEntities)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--quick", action="store_true", help="Only the smallest case")
+	args = parser.parse_args()
+
+	cases = ((2000, 4000, 2, 100), (5000, 8000, 3, 200), (10000, 8000, 4, 200))
+	if args.quick:
+		cases = cases[:1]
+
+	for burst, frames, spawnsPerFrame, lifetime in cases:
+		linear = Simulate(LinearReusePool(), burst, frames, spawnsPerFrame, lifetime, 1)
+		pool = Simulate(agr_reader.EntityReusePool(agr_reader.REUSE_CELL_SIZE * 0.01), burst, frames, spawnsPerFrame, lifetime, 1)
+		if (linear[0], linear[2], linear[3]) != (pool[0], pool[2], pool[3]):
+			raise AssertionError("EntityReusePool picked different objects than the linear scan.")
+		print("burst %5i, %i frames x %i spawns: %5i objects, %5i unused at end, linear %7.3f s, pool %6.3f s (x%.1f), same picks" % (
+			burst, frames, spawnsPerFrame, pool[2], pool[3], linear[1], pool[1], linear[1] / pool[1]))
+
+if __name__ == "__main__":
+	main()
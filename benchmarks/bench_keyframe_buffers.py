@@ -0,0 +1,85 @@
+"""Micro-benchmark of writing a million-key F-curve through keyframe_points.foreach_set:
+Python lists (as the key helpers used to pass) against contiguous typed buffers (utils.KeysData,
+utils.GetInterpolationArray), and with the handles written vectorized (utils.SetKeysHandles) instead of fcurve.update().
+
+Needs Blender: blender -b --factory-startup --python benchmarks/bench_keyframe_buffers.py [-- --keys N]"""
+
+import argparse
+import os
+import sys
+import time
+
+import bpy
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from advancedfx import utils as afx_utils
+
+def NewCurve():
+	action = bpy.data.actions.new("afx_bench")
+	obj = bpy.data.objects.new("afx_bench", None)
+	obj.animation_data_create().action = action
+	if afx_utils.NEWER_THAN_440:
+		fcurve = action.fcurve_ensure_for_datablock(obj, "location", index=0)
+	else:
+		fcurve = action.fcurves.new("location", index=0)
+	return obj, action, fcurve
+
+def RemoveCurve(obj, action):
+	bpy.data.objects.remove(obj)
+	bpy.data.actions.remove(action)
+
+def Measure(name, write, data, repeat):
+	best = None
+	for i in range(repeat):
+		obj, action, fcurve = NewCurve()
+		start = time.perf_counter()
+		write(fcurve, data)
+		elapsed = time.perf_counter() - start
+		RemoveCurve(obj, action)
+		best = elapsed if best is None else min(best, elapsed)
+	print("%-40s %8.4f s" % (name, best))
+	return best
+
+def WriteLists(fcurve, data):
+	keys = data.tolist()
+	fcurve.keyframe_points.add(len(keys) // 2)
+	fcurve.keyframe_points.foreach_set("co", keys)
+	linear = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items['LINEAR'].value
+	fcurve.keyframe_points.foreach_set("interpolation", [linear] * len(fcurve.keyframe_points))
+
+def WriteBuffers(fcurve, data):
+	afx_utils.AddKeysList_Value('LINEAR', fcurve.keyframe_points, data)
+
+def WriteListsUpdate(fcurve, data):
+	WriteLists(fcurve, data)
+	fcurve.update()
+
+def WriteBuffersUpdate(fcurve, data):
+	WriteBuffers(fcurve, data)
+	fcurve.update()
+
+def WriteBuffersHandles(fcurve, data):
+	WriteBuffers(fcurve, data)
+	afx_utils.SetKeysHandles(fcurve.keyframe_points, data)
+
+def main():
+	argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--keys", type=int, default=1000000)
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args(argv)
+
+	times = numpy.arange(args.keys, dtype=numpy.float64) + 1.0
+	data = afx_utils.KeysData(numpy.stack((times, numpy.sin(times * 0.001)), axis=-1))
+
+	print("%i keys, Blender %s" % (args.keys, bpy.app.version_string))
+	Measure("lists: co + interpolation", WriteLists, data, args.repeat)
+	Measure("typed buffers: co + interpolation", WriteBuffers, data, args.repeat)
+	Measure("lists + fcurve.update()", WriteListsUpdate, data, args.repeat)
+	Measure("typed buffers + fcurve.update()", WriteBuffersUpdate, data, args.repeat)
+	Measure("typed buffers + SetKeysHandles", WriteBuffersHandles, data, args.repeat)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,132 @@
+"""Writes synthetic afxGameRecord (AGR) files for the tests and benchmarks."""
+
+import math
+import random
+import struct
+
+PLAYER_MODEL = "models/player/ctm_sas.mdl"
+WEAPON_MODEL = "models/weapons/w_rif_ak47.mdl"
+SHELL_MODEL = "models/shells/shell_9mm.mdl"
+
+class AgrWriter:
+	def __init__(self, version):
+		self.data = bytearray(b"afxGameRecord\0") + struct.pack('<i', version)
+		self.dictionary = {}
+		self.version = version
+
+	def String(self, value):
+		if value in self.dictionary:
+			self.data += struct.pack('<i', self.dictionary[value])
+		else:
+			self.dictionary[value] = len(self.dictionary)
+			self.data += struct.pack('<i', -1) + value.encode('utf-8') + b"\0"
+
+	def Int(self, value):
+		self.data += struct.pack('<i', value)
+
+	def Floats(self, *values):
+		self.data += struct.pack('<%if' % len(values), *values)
+
+	def Bool(self, value):
+		self.data += struct.pack('<?', value)
+
+def RotationZ(yaw):
+	c, s = math.cos(yaw), math.sin(yaw)
+	return [[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]]
+
+def MakeAgr(version = 6, frames = 200, entities = 10, bones = 60, seed = 1, churn = True, cameras = True):
+	"""Returns the bytes of an AGR file with entities (players, weapons, shells) appearing, moving and being deleted
+(at the start of a frame and after their update in the same frame), hidden entities, FPS jitter, entity cameras and afxCam."""
+	rnd = random.Random(seed)
+	writer = AgrWriter(version)
+	models = [PLAYER_MODEL, WEAPON_MODEL, SHELL_MODEL]
+	live = {}
+	nextHandle = 100
+
+	for frame in range(frames):
+		writer.String('afxFrame')
+		writer.Floats(1.0 / 64 + (0.0001 if frame % 50 == 7 else 0.0))
+		hiddenOffset = None
+		if frame % 17 == 5 and live:
+			hiddenOffset = len(writer.data)
+		writer.Int(0)
+
+		if churn and frame % 9 == 3 and live:
+			handle = rnd.choice(sorted(live))
+			del live[handle]
+			writer.String('deleted')
+			writer.Int(handle)
+
+		while len(live) < entities:
+			live[nextHandle] = rnd.choice(models)
+			nextHandle += 1
+
+		for handle in sorted(live):
+			model = live[handle]
+			writer.String('entity_state')
+			writer.Int(handle)
+			writer.String('baseentity')
+			writer.String(model)
+			writer.Bool(rnd.random() > 0.1)
+			x, y, z = rnd.uniform(-1000, 1000), rnd.uniform(-1000, 1000), rnd.uniform(0, 200)
+			if 5 == version:
+				writer.Floats(x, y, z)
+				writer.Floats(rnd.uniform(-89, 89), rnd.uniform(-180, 180), rnd.uniform(-10, 10))
+			else:
+				r = RotationZ(rnd.uniform(-3, 3))
+				writer.Floats(r[0][0], r[0][1], r[0][2], x, r[1][0], r[1][1], r[1][2], y, r[2][0], r[2][1], r[2][2], z)
+
+			writer.String('baseanimating')
+			hasBones = SHELL_MODEL != model
+			writer.Bool(hasBones)
+			if hasBones:
+				boneCount = bones if PLAYER_MODEL == model else 8
+				writer.Int(boneCount)
+				for bone in range(boneCount):
+					if 5 == version:
+						a = rnd.uniform(-1, 1)
+						writer.Floats(rnd.uniform(-5, 5), rnd.uniform(-5, 5), rnd.uniform(-5, 5))
+						writer.Floats(math.sin(a / 2) * 0.6, math.sin(a / 2) * 0.8, 0.0, math.cos(a / 2))
+					else:
+						r = RotationZ(rnd.uniform(-1, 1))
+						writer.Floats(r[0][0], r[0][1], r[0][2], rnd.uniform(-5, 5), r[1][0], r[1][1], r[1][2], rnd.uniform(-5, 5), r[2][0], r[2][1], r[2][2], rnd.uniform(-5, 5))
+
+			if cameras and handle == min(live):
+				writer.String('camera')
+				writer.Bool(False)
+				writer.Floats(x, y, z + 64)
+				writer.Floats(rnd.uniform(-89, 89), rnd.uniform(-180, 180), 0.0)
+				writer.Floats(90.0)
+
+			writer.String('/')
+			writer.Bool(False)
+
+		if churn and frame % 7 == 4 and live:
+			# Deleted after its update in the same frame:
+			handle = rnd.choice(sorted(live))
+			del live[handle]
+			writer.String('deleted')
+			writer.Int(handle)
+
+		if cameras:
+			writer.String('afxCam')
+			writer.Floats(rnd.uniform(-1000, 1000), rnd.uniform(-1000, 1000), 100.0)
+			writer.Floats(rnd.uniform(-89, 89), rnd.uniform(-180, 180), 0.0)
+			writer.Floats(90.0 + (frame % 3))
+
+		if hiddenOffset is not None:
+			writer.String('afxHidden')
+			struct.pack_into('<i', writer.data, hiddenOffset, len(writer.data) - hiddenOffset)
+			hidden = sorted(live)[:2]
+			writer.Int(len(hidden))
+			for handle in hidden:
+				writer.Int(handle)
+
+		writer.String('afxFrameEnd')
+
+	return bytes(writer.data)
+
+def WriteAgr(filepath, **kwargs):
+	with open(filepath, 'wb') as file:
+		file.write(MakeAgr(**kwargs))
+	return filepath
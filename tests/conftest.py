@@ -0,0 +1,14 @@
+import os
+import sys
+import types
+
+# Make the bpy independent modules of the addon importable without running its (bpy dependent)
+# package __init__, like agr_reader.WORKER_INITIALIZER does in the decode worker processes:
+ADDON_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "advancedfx")
+
+if "advancedfx" not in sys.modules:
+	package = types.ModuleType("advancedfx")
+	package.__path__ = [ADDON_DIRECTORY]
+	sys.modules["advancedfx"] = package
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
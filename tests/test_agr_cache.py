@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from advancedfx import agr_cache, agr_reader
+
+from agr_synthetic import WriteAgr
+from test_agr_parallel import AssertSameRecording, FPS, GLOBAL_SCALE
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+	filepath = WriteAgr(str(tmp_path_factory.mktemp("agr") / "cache.agr"), frames=200, entities=6, bones=20)
+	return filepath, agr_reader.ReadAgr(filepath, FPS, GLOBAL_SCALE)
+
+def test_store_and_load(recording, tmp_path):
+	filepath, decoded = recording
+	cache = agr_cache.AgrCache(str(tmp_path), 1 << 30)
+	key = cache.GetKey(filepath, {'fps': FPS})
+	assert cache.Load(key) is None
+	assert cache.Store(key, decoded)
+	assert os.path.getsize(cache.GetPath(key)) < agr_cache.GetAgrRecordingSize(decoded)
+	AssertSameRecording(decoded, cache.Load(key))
+	assert key != cache.GetKey(filepath, {'fps': FPS + 1})
+
+def test_skips_entries_over_the_limit(recording, tmp_path):
+	filepath, decoded = recording
+	cache = agr_cache.AgrCache(str(tmp_path / "cache"), agr_cache.GetAgrRecordingSize(decoded) - 1)
+	assert not cache.Store(cache.GetKey(filepath, {}), decoded)
+	assert not os.path.exists(cache.directory)
+
+def test_hit_without_utime(recording, tmp_path, monkeypatch):
+	filepath, decoded = recording
+	cache = agr_cache.AgrCache(str(tmp_path), 1 << 30)
+	key = cache.GetKey(filepath, {})
+	cache.Store(key, decoded)
+	def utime(*args):
+		raise PermissionError("read only")
+	monkeypatch.setattr(os, "utime", utime)
+	assert cache.Load(key) is not None
@@ -0,0 +1,71 @@
+import numpy
+import pytest
+
+from advancedfx import agr_reader
+
+from agr_synthetic import WriteAgr
+
+ENTITY_ARRAYS = ('visibilityTimes', 'visible', 'transformTimes', 'location', 'rotation', 'scaleTimes', 'scale', 'boneTimes', 'boneCounts', 'boneMatrices')
+CAMERA_ARRAYS = ('times', 'location', 'rotation', 'fov')
+
+FPS = 64
+GLOBAL_SCALE = 0.01
+
+def AssertSameCamera(a, b):
+	assert (a is None) == (b is None)
+	if a is not None:
+		assert a.name == b.name
+		for name in CAMERA_ARRAYS:
+			assert numpy.array_equal(getattr(a, name), getattr(b, name)), name
+
+def AssertSameRecording(a, b, stats = True):
+	assert [entity.objNr for entity in a.entities] == [entity.objNr for entity in b.entities]
+	for x, y in zip(a.entities, b.entities):
+		assert x.modelName == y.modelName
+		for name in ENTITY_ARRAYS:
+			assert numpy.array_equal(getattr(x, name), getattr(y, name)), (x.objNr, name)
+		AssertSameCamera(x.camera, y.camera)
+	AssertSameCamera(a.afxCam, b.afxCam)
+	if stats:
+		assert a.endTime == b.endTime
+		assert a.fpsErrorCount == b.fpsErrorCount
+		assert a.fpsMaxError == b.fpsMaxError
+		assert a.boneBytes == b.boneBytes
+
+@pytest.fixture(scope="module", params=[5, 6])
+def agrFile(request, tmp_path_factory):
+	filepath = WriteAgr(str(tmp_path_factory.mktemp("agr") / ("v%i.agr" % request.param)), version=request.param, frames=400, entities=8, bones=20)
+	return filepath, agr_reader.AgrIndexer(8).Build(filepath)
+
+OPTIONS = [
+	{},
+	{'frameRange': (100, 300)},
+	{'entityFilter': agr_reader.AgrEntityFilter(agr_reader.PLAYER_MODEL_PATTERNS)},
+	{'entityFilter': agr_reader.AgrEntityFilter((), ('*shell*',)), 'frameRange': (190, 350)},
+	{'readBones': False},
+]
+
+@pytest.mark.parametrize("options", OPTIONS)
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_decode_equals_serial(agrFile, options, workers):
+	filepath, index = agrFile
+	serial = agr_reader.ReadAgr(filepath, FPS, GLOBAL_SCALE, **options)
+	parallel = agr_reader.ReadAgrParallel(filepath, FPS, GLOBAL_SCALE, index, workers, **options)
+	assert 0 < len(serial.entities)
+	# The statistics of a frame range only cover the decoded chunks:
+	AssertSameRecording(serial, parallel, 'frameRange' not in options)
+
+@pytest.mark.parametrize("frameRange", [(12, 40), (100, 300), (390, 400)])
+def test_indexed_range_equals_full_parse(agrFile, frameRange):
+	filepath, index = agrFile
+	full = agr_reader.ReadAgr(filepath, FPS, GLOBAL_SCALE, frameRange=frameRange)
+	indexed = agr_reader.ReadAgr(filepath, FPS, GLOBAL_SCALE, frameRange=frameRange, index=index)
+	assert 0 < len(full.entities)
+	AssertSameRecording(full, indexed, False)
+
+def test_chunks_cover_file(agrFile):
+	filepath, index = agrFile
+	chunks = agr_reader.GetAgrChunks(index, 5, FPS)
+	assert chunks[0][0] is None and chunks[-1][1] is None
+	for (start, stop), (nextStart, nextStop) in zip(chunks[:-1], chunks[1:]):
+		assert stop == nextStart['offset']
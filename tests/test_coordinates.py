@@ -0,0 +1,66 @@
+import math
+
+import numpy
+import pytest
+
+from advancedfx import agr_reader
+
+mathutils = pytest.importorskip("mathutils")
+
+GLOBAL_SCALE = 0.01
+SENSOR_WIDTH = 36.0
+
+def QAngleToQuaternion(x, y, z):
+	"""Per row reference, same as utils.QAngle.to_quaternion."""
+	pitchH = 0.5 * math.radians(x)
+	qPitchY = mathutils.Quaternion((math.cos(pitchH), -math.sin(pitchH), 0.0, 0.0))
+	yawH = 0.5 * math.radians(y)
+	qYawZ = mathutils.Quaternion((math.cos(yawH), 0.0, 0.0, math.sin(yawH)))
+	rollH = 0.5 * math.radians(z)
+	qRollX = mathutils.Quaternion((math.cos(rollH), 0.0, math.sin(rollH), 0.0))
+	return qYawZ @ qPitchY @ qRollX
+
+BLENDER_CAM_UP_QUAT = mathutils.Quaternion((math.cos(0.5 * math.radians(90.0)), math.sin(0.5* math.radians(90.0)), 0.0, 0.0))
+
+@pytest.fixture(scope="module")
+def samples():
+	rng = numpy.random.default_rng(21)
+	count = 2000
+	origins = rng.uniform(-16384.0, 16384.0, (count, 3))
+	angles = numpy.concatenate((rng.uniform(-180.0, 180.0, (count - 4, 3)), [[90.0, 0.0, 0.0], [-90.0, 180.0, 0.0], [0.0, 0.0, 0.0], [89.99, -179.99, 45.0]]))
+	fovs = numpy.concatenate((rng.uniform(1.0, 170.0, count - 2), [90.0, 106.26]))
+	return origins, angles, fovs
+
+def test_locations_equal_per_row(samples):
+	origins, angles, fovs = samples
+	batch = agr_reader.ValveToBlenderLocations(origins, GLOBAL_SCALE)
+	rows = numpy.array([tuple(mathutils.Vector((-y, x, z)) * GLOBAL_SCALE) for x, y, z in origins])
+	assert numpy.array_equal(batch, rows)
+
+def test_quaternions_equal_per_row(samples):
+	origins, angles, fovs = samples
+	batch = agr_reader.QAnglesToQuaternions(angles)
+	rows = numpy.array([tuple(QAngleToQuaternion(x, y, z)) for x, y, z in angles], dtype=numpy.float32)
+	assert numpy.array_equal(batch, rows)
+
+def test_camera_quaternions_equal_per_row(samples):
+	origins, angles, fovs = samples
+	batch = agr_reader.QuaternionsMultiply(agr_reader.QAnglesToQuaternions(angles), BLENDER_CAM_UP_QUAT)
+	rows = numpy.array([tuple(QAngleToQuaternion(x, y, z) @ BLENDER_CAM_UP_QUAT) for x, y, z in angles], dtype=numpy.float32)
+	assert numpy.array_equal(batch, rows)
+
+def test_lenses_equal_per_row(samples):
+	origins, angles, fovs = samples
+	batch = agr_reader.FovsToLenses(fovs, SENSOR_WIDTH)
+	# As stored by Blender (single precision), numpy.tan and math.tan may differ in the last double bit:
+	rows = numpy.array([SENSOR_WIDTH / (2.0 * math.tan(math.radians(fov) / 2.0)) for fov in fovs])
+	assert numpy.array_equal(numpy.float32(batch), numpy.float32(rows))
+
+def test_utils_batch_api_equals_per_row(samples):
+	pytest.importorskip("bpy")
+	from advancedfx import utils
+	origins, angles, fovs = samples
+	locations, rotations, lenses = utils.ValveToBlender_Cameras(origins, angles, fovs, GLOBAL_SCALE, SENSOR_WIDTH)
+	assert numpy.array_equal(locations, [tuple(mathutils.Vector((-y, x, z)) * GLOBAL_SCALE) for x, y, z in origins])
+	assert numpy.array_equal(rotations, numpy.array([tuple(utils.QAngle(x, y, z).to_quaternion() @ utils.BLENDER_CAM_UP_QUAT) for x, y, z in angles], dtype=numpy.float32))
+	assert numpy.array_equal(numpy.float32(lenses), numpy.float32([SENSOR_WIDTH / (2.0 * math.tan(math.radians(fov) / 2.0)) for fov in fovs]))
@@ -0,0 +1,25 @@
+import numpy
+
+from advancedfx import keyframes
+
+def Stepped(keyTimes, keyValues, times):
+	"""Values of a CONSTANT interpolated curve."""
+	return keyValues[numpy.clip(numpy.searchsorted(keyTimes, times, 'right') - 1, 0, len(keyTimes) - 1)]
+
+def test_constant_segments_hold_till_the_frame_before_the_next_key():
+	keyTimes = numpy.array([1.0, 101.0, 102.0, 350.0, 351.5, 600.0])
+	keyValues = numpy.array([0.0, 5.0, -2.0, 7.0, 1.0, 3.0])
+	parts = numpy.ones(len(keyTimes) - 1, dtype=numpy.int64)
+	holds = numpy.ones(len(keyTimes) - 1, dtype=bool)
+	rows = numpy.unique(numpy.concatenate((keyTimes, keyframes.GetSegmentFrames(keyTimes, parts, holds))))
+	assert len(rows) < 2 * len(keyTimes)
+
+	# Straight lines between the rows (as CAM files are read) against a row every frame:
+	frames = numpy.arange(1.0, 601.0)
+	perFrame = Stepped(keyTimes, keyValues, frames)
+	assert numpy.array_equal(numpy.interp(frames, rows, Stepped(keyTimes, keyValues, rows)), perFrame)
+
+def test_split_segments():
+	keyTimes = numpy.array([0.0, 10.0, 20.0])
+	frames = keyframes.GetSegmentFrames(keyTimes, numpy.array([4, 1]), numpy.array([False, False]))
+	assert numpy.array_equal(frames, [2.5, 5.0, 7.5])
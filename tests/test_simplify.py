@@ -0,0 +1,54 @@
+import numpy
+import pytest
+
+from advancedfx import keyframes
+
+TOLERANCE = 0.001
+ANGLE_TOLERANCE = numpy.radians(0.1)
+
+@pytest.fixture(scope="module")
+def times():
+	return numpy.arange(5000, dtype=numpy.float64)
+
+def BezierReference(keys, handlesLeft, handlesRight, segment, count):
+	"""Points of the cubic Bezier segment at count equal parameter steps."""
+	u = numpy.linspace(0.0, 1.0, count)[:, numpy.newaxis]
+	v = 1.0 - u
+	return v * v * v * keys[segment] + 3.0 * v * v * u * handlesRight[segment] + 3.0 * v * u * u * handlesLeft[segment + 1] + u * u * u * keys[segment + 1]
+
+def test_evaluate_bezier_on_curve():
+	rng = numpy.random.default_rng(7)
+	data = keyframes.KeysData(numpy.column_stack((numpy.cumsum(rng.uniform(0.5, 3.0, 50)), rng.normal(size=50))))
+	left, right = keyframes.BezierHandles(data)
+	keys, left, right = data.reshape((-1, 2)), left.reshape((-1, 2)), right.reshape((-1, 2))
+	for segment in range(len(keys) - 1):
+		points = BezierReference(keys, left, right, segment, 20)
+		assert numpy.allclose(keyframes.EvaluateBezier(keys, left, right, points[:, 0]), points[:, 1], rtol=0.0, atol=1e-9)
+
+@pytest.mark.parametrize("interpolation", ['CONSTANT', 'LINEAR'])
+def test_values_within_tolerance(times, interpolation):
+	values = 3.0 * numpy.sin(times / 50.0) + 0.2 * numpy.sin(times / 7.0)
+	keep, maxError = keyframes.SimplifyKeysMask(times, values, TOLERANCE, interpolation, False)
+	if 'CONSTANT' == interpolation:
+		held = values[keep][numpy.searchsorted(times[keep], times, 'right') - 1]
+	else:
+		held = numpy.interp(times, times[keep], values[keep])
+	assert numpy.abs(values - held).max() <= maxError <= TOLERANCE
+	assert keep.sum() < len(times)
+
+def test_bezier_values_within_tolerance(times):
+	values = 3.0 * numpy.sin(times / 50.0) + 0.2 * numpy.sin(times / 7.0)
+	linearKeep, linearError = keyframes.SimplifyKeysMask(times, values, TOLERANCE, 'LINEAR', False)
+	keep, maxError = keyframes.SimplifyKeysMask(times, values, TOLERANCE, 'BEZIER', False)
+	assert linearError <= TOLERANCE
+	assert maxError <= TOLERANCE
+	assert keep[0] and keep[-1] and keep.sum() < len(times)
+	assert keyframes.GetBezierErrors(times, values, keep, False).max() == maxError
+
+def test_bezier_rotations_within_tolerance(times):
+	angles = times / 200.0
+	rotations = numpy.column_stack((numpy.cos(angles), 0.6 * numpy.sin(angles), 0.8 * numpy.sin(angles), numpy.zeros(len(times))))
+	keep, maxError = keyframes.SimplifyKeysMask(times, rotations, ANGLE_TOLERANCE, 'BEZIER', True)
+	assert maxError <= ANGLE_TOLERANCE
+	assert keep.sum() < len(times)
+	assert keyframes.GetBezierErrors(times, rotations, keep, True).max() == maxError